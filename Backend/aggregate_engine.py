@@ -0,0 +1,302 @@
+"""
+Incremental rolling-average engine for `symbol_aggregates`
+Keeps running sum / count / non-zero count / first-seen date per (symbol, type)
+so a new downloaded day or a moved date window only touches the edge days
+instead of re-pivoting the whole range.
+
+Several worker processes share the state doc: a day's deltas are applied only
+by the caller whose $addToSet / $pull actually changed `applied_dates`, so a
+day is never counted twice or removed twice.
+"""
+
+import threading
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+EXCLUDED_SYMBOLS = {'PERMITTED'}
+
+
+class IncrementalAggregateEngine:
+    def __init__(self, daily_collection, aggregates_collection, state_collection, source='incremental'):
+        """
+        Args:
+            daily_collection: `symbol_daily` (symbol, type, date, value, company_name)
+            aggregates_collection: `symbol_aggregates` (one doc per symbol + type)
+            state_collection: stores the active window and applied dates per type
+        """
+        self.daily = daily_collection
+        self.aggregates = aggregates_collection
+        self.state = state_collection
+        self.source = source
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._pending_refresh = set()  # types whose derived fields wait for refresh_pending()
+
+    def _lock(self, data_type):
+        with self._locks_guard:
+            if data_type not in self._locks:
+                self._locks[data_type] = threading.RLock()
+            return self._locks[data_type]
+
+    # ----- state -----
+    def get_state(self, data_type):
+        doc = self.state.find_one({'_id': data_type}) or {}
+        return {
+            'start': doc.get('start'),
+            'end': doc.get('end'),
+            'applied_dates': sorted(doc.get('applied_dates') or [])
+        }
+
+    def _save_window(self, data_type, start_iso, end_iso):
+        """Set the window bounds; applied_dates is only changed through _claim_day/_release_day."""
+        self.state.update_one(
+            {'_id': data_type},
+            {'$set': {'start': start_iso, 'end': end_iso, 'updated_at': datetime.now().isoformat()},
+             '$setOnInsert': {'applied_dates': []}},
+            upsert=True
+        )
+
+    def _claim_day(self, data_type, date_iso, extend=False):
+        """
+        Atomically mark date_iso applied. True only for the caller that added it,
+        and only while the date is inside the window (extend moves the end instead).
+        """
+        query = {'_id': data_type, 'applied_dates': {'$ne': date_iso}, 'start': {'$lte': date_iso}}
+        update = {'$addToSet': {'applied_dates': date_iso}, '$set': {'updated_at': datetime.now().isoformat()}}
+        if extend:
+            update['$max'] = {'end': date_iso}
+        else:
+            query['end'] = {'$gte': date_iso}
+        return self.state.update_one(query, update).modified_count == 1
+
+    def _release_day(self, data_type, date_iso):
+        """Atomically unmark date_iso. True only for the caller that removed it."""
+        result = self.state.update_one(
+            {'_id': data_type, 'applied_dates': date_iso},
+            {'$pull': {'applied_dates': date_iso}, '$set': {'updated_at': datetime.now().isoformat()}}
+        )
+        return result.modified_count == 1
+
+    def is_applied(self, data_type, date_iso):
+        return date_iso in self.get_state(data_type)['applied_dates']
+
+    # ----- day contributions -----
+    def load_day(self, data_type, date_iso):
+        """Read one day's values from symbol_daily as {symbol: (value, company_name)}."""
+        values = {}
+        cursor = self.daily.find(
+            {'type': data_type, 'date': date_iso},
+            {'symbol': 1, 'value': 1, 'company_name': 1, '_id': 0}
+        )
+        for doc in cursor:
+            sym = doc.get('symbol')
+            val = doc.get('value')
+            if not sym or val is None or str(sym).strip().upper() in EXCLUDED_SYMBOLS:
+                continue
+            values[sym] = (float(val), doc.get('company_name'))
+        return values
+
+    def _apply_delta(self, data_type, date_iso, old_values, new_values):
+        """
+        Turn one day's old -> new values into $inc operations.
+        Adding a day is old={}, removing a day is new={}.
+        Returns symbols whose first-seen date may have moved later.
+        """
+        ops = []
+        lost_first_seen = []
+        for sym in set(old_values) | set(new_values):
+            old = old_values.get(sym)
+            new = new_values.get(sym)
+            old_v = old[0] if old else 0.0
+            new_v = new[0] if new else 0.0
+            inc = {
+                'running.sum': new_v - old_v,
+                'running.count': (1 if new else 0) - (1 if old else 0),
+                'running.non_zero': (1 if new and new_v > 0 else 0) - (1 if old and old_v > 0 else 0)
+            }
+            update = {'$inc': inc}
+            if new:
+                update['$min'] = {'running.first_seen': date_iso}
+                if new[1]:
+                    update['$set'] = {'company_name': new[1]}
+            elif old:
+                lost_first_seen.append(sym)
+            if not any(inc.values()) and '$min' not in update:
+                continue
+            ops.append(UpdateOne({'symbol': sym, 'type': data_type}, update, upsert=bool(new)))
+
+        for i in range(0, len(ops), 1000):
+            self.aggregates.bulk_write(ops[i:i + 1000], ordered=False)
+        return lost_first_seen
+
+    def _recompute_first_seen(self, data_type, symbols, applied_dates):
+        """Re-derive first_seen for symbols that lost a day equal to their first_seen."""
+        if not symbols:
+            return
+        stale = [
+            doc['symbol'] for doc in self.aggregates.find(
+                {'type': data_type, 'symbol': {'$in': symbols}},
+                {'symbol': 1, 'running.first_seen': 1}
+            )
+            if doc.get('running', {}).get('first_seen') not in applied_dates
+        ]
+        if not stale:
+            return
+        found = {}
+        if applied_dates:
+            pipeline = [
+                {'$match': {'type': data_type, 'symbol': {'$in': stale}, 'date': {'$in': list(applied_dates)}, 'value': {'$ne': None}}},
+                {'$group': {'_id': '$symbol', 'first': {'$min': '$date'}}}
+            ]
+            found = {doc['_id']: doc['first'] for doc in self.daily.aggregate(pipeline)}
+        ops = []
+        for sym in stale:
+            if sym in found:
+                ops.append(UpdateOne({'symbol': sym, 'type': data_type}, {'$set': {'running.first_seen': found[sym]}}))
+            else:
+                ops.append(UpdateOne({'symbol': sym, 'type': data_type}, {'$unset': {'running.first_seen': ''}}))
+        self.aggregates.bulk_write(ops, ordered=False)
+
+    def _refresh_derived(self, data_type, state):
+        """Recompute average/day counts from running totals server-side (one update_many)."""
+        applied = sorted(state['applied_dates'])
+        date_range = {'start': applied[0], 'end': applied[-1]} if applied else None
+        self.aggregates.delete_many({'type': data_type, 'running.count': {'$lte': 0}})
+        self.aggregates.update_many(
+            {'type': data_type, 'running': {'$exists': True}},
+            [{'$set': {
+                'average': {'$cond': [
+                    {'$gt': ['$running.count', 0]},
+                    {'$divide': ['$running.sum', '$running.count']},
+                    None
+                ]},
+                'days_with_data': '$running.count',
+                'non_zero_days': '$running.non_zero',
+                'total_possible_days': {'$size': {'$filter': {
+                    'input': applied,
+                    'as': 'd',
+                    'cond': {'$gte': ['$$d', '$running.first_seen']}
+                }}},
+                'date_range': {'$literal': date_range},
+                'source': self.source,
+                'updated_at': datetime.now().isoformat()
+            }}]
+        )
+
+    def _after_change(self, data_type, refresh):
+        if refresh:
+            self.refresh(data_type)
+        else:
+            self._pending_refresh.add(data_type)
+
+    # ----- public API -----
+    def add_day(self, data_type, date_iso, day_values=None, auto_extend=True, refresh=True):
+        """
+        Apply a newly downloaded day. Days after the window end extend it when
+        auto_extend is set; days outside the window, or already applied by any
+        process, are ignored. refresh=False leaves the derived fields to
+        refresh_pending() so a batch of days recomputes them once.
+        Returns True when the aggregates changed.
+        """
+        with self._lock(data_type):
+            state = self.get_state(data_type)
+            if state['start'] is None or date_iso in state['applied_dates']:
+                return False  # no window yet (the first set_window() builds it) or nothing to do
+            values = day_values if day_values is not None else self.load_day(data_type, date_iso)
+            if not values:
+                return False
+            if not self._claim_day(data_type, date_iso, extend=auto_extend):
+                return False
+            try:
+                self._apply_delta(data_type, date_iso, {}, values)
+            except Exception:
+                self._release_day(data_type, date_iso)
+                raise
+            self._after_change(data_type, refresh)
+            return True
+
+    def replace_day(self, data_type, date_iso, old_values, new_values, refresh=True):
+        """Re-downloaded day that is already applied: apply only the value differences."""
+        with self._lock(data_type):
+            state = self.get_state(data_type)
+            if date_iso not in state['applied_dates']:
+                return self.add_day(data_type, date_iso, day_values=new_values, refresh=refresh)
+            lost = self._apply_delta(data_type, date_iso, old_values, new_values)
+            self._recompute_first_seen(data_type, lost, set(state['applied_dates']))
+            self._after_change(data_type, refresh)
+            return True
+
+    def refresh(self, data_type):
+        """Recompute derived fields for data_type from the running totals."""
+        with self._lock(data_type):
+            self._pending_refresh.discard(data_type)
+            self._refresh_derived(data_type, self.get_state(data_type))
+
+    def refresh_pending(self):
+        """Refresh every type changed with refresh=False since the last refresh."""
+        for data_type in sorted(self._pending_refresh):
+            self.refresh(data_type)
+
+    def set_window(self, data_type, start_iso, end_iso):
+        """
+        Move the aggregate window to [start_iso, end_iso], adding or subtracting
+        only the days that differ from the currently applied set.
+        """
+        with self._lock(data_type):
+            state = self.get_state(data_type)
+            target = set(self.daily.distinct('date', {
+                'type': data_type,
+                'date': {'$gte': start_iso, '$lte': end_iso}
+            }))
+            applied = set(state['applied_dates'])
+
+            reset = state['start'] is None or not (applied & target)
+            if reset:
+                # No overlap with the old window: start from zero once
+                self._reset(data_type)
+                applied = set()
+
+            to_add = sorted(target - applied)
+            to_remove = sorted(applied - target)
+
+            # Bounds first, so other processes' add_day claims respect the new window
+            self._save_window(data_type, start_iso, end_iso)
+            lost = set()
+            removed = added = 0
+            for date_iso in to_remove:
+                if self._release_day(data_type, date_iso):
+                    lost.update(self._apply_delta(data_type, date_iso, self.load_day(data_type, date_iso), {}))
+                    removed += 1
+            for date_iso in to_add:
+                values = self.load_day(data_type, date_iso)
+                if values and self._claim_day(data_type, date_iso):
+                    self._apply_delta(data_type, date_iso, {}, values)
+                    added += 1
+
+            state = self.get_state(data_type)
+            self._recompute_first_seen(data_type, sorted(lost), set(state['applied_dates']))
+            if reset or added or removed or data_type in self._pending_refresh:
+                self._pending_refresh.discard(data_type)
+                self._refresh_derived(data_type, state)
+            applied_days = len(state['applied_dates'])
+            summary = {
+                'type': data_type,
+                'added_days': added,
+                'removed_days': removed,
+                'applied_days': applied_days
+            }
+            print(f"[aggregate-engine] {data_type.upper()} window {start_iso}..{end_iso}: "
+                  f"+{added} / -{removed} days ({applied_days} applied)")
+            return summary
+
+    def _reset(self, data_type):
+        # Docs without running totals come from a full rewrite; their averages
+        # would survive the rebuild untouched, so drop them
+        self.aggregates.delete_many({'type': data_type, 'running': {'$exists': False}})
+        self.aggregates.update_many(
+            {'type': data_type},
+            {'$set': {'running.sum': 0.0, 'running.count': 0, 'running.non_zero': 0},
+             '$unset': {'running.first_seen': ''}}
+        )
+        self.state.delete_one({'_id': data_type})
@@ -14,10 +14,11 @@ from werkzeug.utils import secure_filename
 import tempfile
 import shutil
 from pathlib import Path
-import requests
 from io import BytesIO, StringIO
 import zipfile
 import time
+import queue
+import threading
 from dateutil import parser as date_parser
 import numpy as np
 from pymongo import MongoClient, UpdateOne
@@ -28,9 +29,31 @@ import base64
 import math
 from consolidate_marketcap import MarketCapConsolidator
 from nse_symbol_metrics import SymbolMetricsFetcher
+from nse_client import get_nse_client
+from series_cache import configure_series_cache, get_series_cache
+from quote_cache import CACHED_SOURCE as QUOTE_CACHED_SOURCE, configure_quote_cache, get_quote_cache
+from trading_calendar import configure_trading_calendar, get_trading_calendar
+from reference_data import configure_reference_data, get_reference_data
+from name_index import get_name_index_for_map, name_index_stats
+from name_aliases import configure_alias_table, get_alias_table
+from symbol_ids import configure_symbol_ids, get_symbol_ids
+from bhav_miss_cache import (
+    configure_miss_cache, get_miss_cache,
+    HOLIDAY as BHAV_HOLIDAY, NO_DATA as BHAV_NO_DATA, NOT_PUBLISHED as BHAV_NOT_PUBLISHED, MISSING_FILE as BHAV_MISSING_FILE,
+    HTTP_ERROR as BHAV_HTTP_ERROR, NETWORK_ERROR as BHAV_NETWORK_ERROR, RETRYABLE_REASONS as BHAV_RETRYABLE_REASONS
+)
+from rate_limiter import RetryScheduler
 from urllib.parse import quote_plus
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from memory_optimized_export import MemoryOptimizedExporter, ChunkedDataProcessor, get_memory_usage_mb
+from aggregate_engine import IncrementalAggregateEngine
+from metrics_buckets import MonthlyMetricsStore
+from matrix_store import MatrixStore
+from job_queue import JobQueue
+from columnar_cache import ColumnarBhavStore, parquet_available, df_to_parquet_bytes, read_parquet_bytes, consolidation_columns
+from export_cache import ExportResultCache
+from artifact_store import ArtifactNotFound, create_artifact_store, parse_range
+from export_formats import EXPORT_FORMATS, validate_output_format, export_filename, export_mimetype, stream_sheets, write_sheets
 import gc
 
 app = Flask(__name__)
@@ -96,6 +119,8 @@ dotenv.load_dotenv()
 # Keep-alive security settings (for GitHub Actions scheduled pings)
 KEEPALIVE_TOKEN = os.getenv('KEEPALIVE_TOKEN', '').strip()
 KEEPALIVE_ALLOW_UNAUTH = os.getenv('KEEPALIVE_ALLOW_UNAUTH', 'true').strip().lower() == 'true'
+# Symbol dashboard fetch engine: 'threads' (default) or 'async' (requires aiohttp)
+NSE_FETCH_BACKEND = os.getenv('NSE_FETCH_BACKEND', 'threads').strip().lower()
 
 
 def _is_keepalive_authorized(req):
@@ -130,8 +155,17 @@ try:
     symbol_daily_collection = db['symbol_daily']  # per-symbol, per-date values (mcap/pr)
     symbol_aggregates_collection = db['symbol_aggregates']  # per-symbol averages
     symbol_metrics_collection = db['symbol_metrics']  # Symbol dashboard metrics
-    symbol_metrics_daily_collection = db['symbol_metrics_daily']  # Daily impact_cost and free_float_mcap
+    symbol_metrics_daily_collection = db['symbol_metrics_daily']  # Legacy daily metrics (one doc per symbol, unbounded array)
+    symbol_metrics_monthly_collection = db['symbol_metrics_monthly']  # Daily metrics in per-symbol monthly buckets
     nifty_indices_collection = db['nifty_indices']  # Nifty index constituent mappings
+    aggregate_state_collection = db['aggregate_state']  # Incremental aggregate window per type
+    export_jobs_collection = db['export_jobs']  # Background export job table
+    symbol_series_collection = db['symbol_series']  # Resolved GetQuoteApi series per symbol
+    quote_cache_collection = db['quote_cache']  # Last GetQuoteApi row per symbol (per-field timestamps)
+    trading_calendar_collection = db['trading_calendar']  # Learned NSE holidays / weekend sessions
+    bhavcache_misses_collection = db['bhavcache_misses']  # Known-missing bhavcopies with retry-after
+    pr_name_aliases_collection = db['pr_name_aliases']  # Learned PR name -> ticker aliases
+    symbol_ids_collection = db['symbol_ids']  # Stable int32 symbol IDs (sid)
     
     print(f"🔄 Creating indexes...")
     # speed-critical indexes
@@ -139,6 +173,7 @@ try:
         [('symbol', 1), ('type', 1), ('date', 1)], name='symbol_type_date', unique=True
     )
     symbol_daily_collection.create_index([('type', 1), ('date', 1)], name='type_date')
+    symbol_daily_collection.create_index([('sid', 1), ('type', 1), ('date', 1)], name='sid_type_date')
     symbol_aggregates_collection.create_index(
         [('symbol', 1), ('type', 1), ('date_range.start', 1), ('date_range.end', 1)],
         name='symbol_type_range', unique=False
@@ -173,8 +208,82 @@ except Exception as e:
     symbol_aggregates_collection = None
     symbol_metrics_collection = None
     symbol_metrics_daily_collection = None
+    symbol_metrics_monthly_collection = None
     nifty_indices_collection = None
+    aggregate_state_collection = None
+    export_jobs_collection = None
+    symbol_series_collection = None
+    quote_cache_collection = None
+    trading_calendar_collection = None
+    bhavcache_misses_collection = None
+    pr_name_aliases_collection = None
+    symbol_ids_collection = None
+
+# Incremental symbol_aggregates maintenance (running sums per symbol/type)
+aggregate_engine = None
+if symbol_daily_collection is not None and symbol_aggregates_collection is not None:
+    aggregate_engine = IncrementalAggregateEngine(
+        symbol_daily_collection, symbol_aggregates_collection, aggregate_state_collection
+    )
+
+# Symbol -> series resolutions survive restarts when Mongo is available
+if symbol_series_collection is not None:
+    configure_series_cache(symbol_series_collection)
+if quote_cache_collection is not None:
+    configure_quote_cache(quote_cache_collection)
+
+if bhavcache_misses_collection is not None:
+    configure_miss_cache(bhavcache_misses_collection, holiday_check=lambda iso: get_trading_calendar().is_seed_holiday(iso))
+if pr_name_aliases_collection is not None:
+    configure_alias_table(pr_name_aliases_collection)
+
+# Symbol IDs: rows written before IDs existed get their sid in the background;
+# symbol_daily filters switch from symbol strings to sid once that is done
+if symbol_ids_collection is not None:
+    configure_symbol_ids(symbol_ids_collection).backfill_async(symbol_daily_collection)
+
+# Reference tables (names, aggregates, index membership, metrics) held in memory;
+# warmed in the background so startup is not blocked
+if db is not None:
+    configure_reference_data(symbol_aggregates_collection, nifty_indices_collection, symbol_metrics_collection).warm_async()
+
+# Trading calendar: seed file + learned holidays; weekend dates already cached count as sessions
+if trading_calendar_collection is not None:
+    try:
+        configure_trading_calendar(trading_calendar_collection).learn_from_cached_dates(
+            bhavcache_collection.distinct('date')
+        )
+    except Exception as exc:
+        print(f"⚠️ Trading calendar setup failed: {exc}")
+
+# Daily symbol metrics: one idempotent write per symbol/day into monthly buckets
+metrics_bucket_store = MonthlyMetricsStore(symbol_metrics_monthly_collection) if symbol_metrics_monthly_collection is not None else None
 
+# Generated workbooks live in GridFS (or ARTIFACT_DIR with ARTIFACT_STORE=local), streamed in chunks
+ARTIFACT_TTL_HOURS = float(os.getenv('ARTIFACT_TTL_HOURS', 72))
+artifact_store = None
+try:
+    artifact_store = create_artifact_store(
+        db,
+        backend=os.getenv('ARTIFACT_STORE'),
+        root_dir=os.getenv('ARTIFACT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'artifacts')),
+        ttl_hours=ARTIFACT_TTL_HOURS
+    )
+    print(f"✅ Artifact store: {artifact_store.backend}")
+    if excel_results_collection is not None:
+        # excel_results rows expire with their artifact (the artifact itself is removed by cleanup_expired)
+        excel_results_collection.create_index([('expires_at', 1)], name='expires_at_ttl', expireAfterSeconds=0)
+except Exception as exc:
+    print(f"⚠️ Artifact store setup failed: {exc}")
+
+# Background worker pool for long consolidation exports (avoids the 30s request limit)
+export_job_queue = JobQueue(
+    export_jobs_collection,
+    max_workers=int(os.getenv('EXPORT_JOB_WORKERS', 2)),
+    result_dir=os.getenv('EXPORT_JOB_DIR'),
+    # GridFS copy lets a worker on another host serve the result; a local artifact dir adds nothing
+    result_store=artifact_store if artifact_store is not None and artifact_store.backend != 'local' else None
+)
 
 # Custom JSON encoder to handle NaN and Inf values
 class NumpyEncoder(json.JSONEncoder):
@@ -222,21 +331,18 @@ def is_summary_symbol(symbol):
     return False
 
 
-# ===== Index utilities =====
-def _make_session(user_agent=None):
-    sess = requests.Session()
-    if user_agent:
-        sess.headers.update({'User-Agent': user_agent})
-    return sess
-
-
-def _prime_cookies(session, headers):
-    try:
-        session.get('https://www.nseindia.com', headers=headers, timeout=10)
-    except Exception as exc:  # best-effort warmup
-        print(f"⚠️ NSE cookie warmup failed (indices): {exc}")
+def summary_symbol_mask(symbols):
+    """Vectorized is_summary_symbol over a Series of symbols."""
+    text = symbols.astype(str).str.strip().str.upper()
+    normalized = text.str.replace(r'[^A-Z0-9]', '', regex=True)
+    return (
+        normalized.isin(['TOTAL', 'LISTED', 'TOTALLISTED', 'LISTEDTOTAL'])
+        | text.str.startswith('TOTAL')
+        | text.str.startswith('LISTED')
+    )
 
 
+# ===== Index utilities =====
 def fetch_index_constituents(index_name, session, headers):
     url = f"https://www.nseindia.com/api/equity-stock?index={quote_plus(index_name)}"
     resp = session.get(url, headers=headers, timeout=20)
@@ -276,8 +382,8 @@ def build_symbol_index_map(index_list):
         'Connection': 'keep-alive',
         'Referer': 'https://www.nseindia.com/market-data/live-market-indices'
     }
-    sess = _make_session()
-    _prime_cookies(sess, headers)
+    # Shared pooled client handles cookie priming and keep-alive
+    sess = get_nse_client()
     mapping = {}
     live_data_mapping = {}
     errors = []
@@ -297,21 +403,12 @@ def build_symbol_index_map(index_list):
 
 
 def primary_index_map_from_db(symbols):
-    """Return latest primary_index per symbol from nifty_indices_collection."""
+    """Return latest primary_index per symbol from the nifty_indices reference table."""
     if nifty_indices_collection is None or not symbols:
         return {}
     mapping = {}
     try:
-        # Query exactly what we need: current constituents only
-        cursor = nifty_indices_collection.find(
-            {'symbol': {'$in': symbols}},
-            {'symbol': 1, 'primary_index': 1}
-        )
-
-        for doc in cursor:
-            sym = doc.get('symbol')
-            if not sym:
-                continue
+        for sym, doc in get_reference_data().indices(symbols).items():
             idx = doc.get('primary_index')
             if idx:
                 mapping[sym] = idx
@@ -342,6 +439,8 @@ def upsert_symbol_daily(symbol, company_name, date_iso, data_type, value, source
             'source': source,
             'updated_at': datetime.now().isoformat()
         }
+        symbol_ids = get_symbol_ids()
+        payload.update(symbol_ids.sid_fields(symbol_ids.encode([symbol])[0]))
         if extra:
             payload.update(extra)
         symbol_daily_collection.update_one(
@@ -349,6 +448,7 @@ def upsert_symbol_daily(symbol, company_name, date_iso, data_type, value, source
             {'$set': payload},
             upsert=True
         )
+        invalidate_matrix_days(data_type, [date_iso])
     except Exception as exc:
         print(f"⚠️ Failed to upsert symbol_daily for {symbol} {date_iso} {data_type}: {exc}")
 
@@ -374,6 +474,7 @@ def upsert_symbol_aggregate(symbol, company_name, data_type, days_with_data, ave
             {'$set': payload},
             upsert=True
         )
+        get_reference_data().invalidate('aggregates')
     except Exception as exc:
         print(f"⚠️ Failed to upsert symbol_aggregate for {symbol} {data_type}: {exc}")
 
@@ -381,22 +482,24 @@ def upsert_symbol_aggregate(symbol, company_name, data_type, days_with_data, ave
 def bulk_upsert_symbol_metrics(rows, source='nse_symbol_metrics'):
     """
     ULTRA-FAST bulk upsert of symbol metrics.
-    Consolidates thousands of database operations into 2-3 bulk writes.
+    Consolidates thousands of database operations into 2 bulk writes
+    (symbol_metrics + one idempotent bucket write per row).
     """
     if symbol_metrics_collection is None:
         return
     
     from pymongo import UpdateOne
     ops_main = []
-    ops_daily_meta = []
-    ops_daily_pull = []
-    ops_daily_push = []
+    ops_daily = []
     
     now_iso = datetime.now().isoformat()
     default_as_on = datetime.now().strftime('%Y-%m-%d')
     
     try:
         for row in rows:
+            # quote-cache hits were not fetched by this request: persisting them would store old numbers as today's
+            if row.get('source') == QUOTE_CACHED_SOURCE:
+                continue
             symbol = str(row.get('symbol') or '').strip()
             if not symbol: continue
             
@@ -415,11 +518,10 @@ def bulk_upsert_symbol_metrics(rows, source='nse_symbol_metrics'):
                 upsert=True
             ))
             
-            # 2. Daily collection (Metadata & Structure)
-            if symbol_metrics_daily_collection is not None:
+            # 2. Daily metrics bucket (symbol + month), day slot overwritten in place
+            if metrics_bucket_store is not None:
                 cname = row.get('companyName') or row.get('company_name') or ''
                 daily_entry = {
-                    'date': as_on,
                     'impact_cost': _safe_float(row.get('impact_cost')),
                     'free_float_mcap': _safe_float(row.get('free_float_mcap')),
                     'total_market_cap': _safe_float(row.get('total_market_cap')),
@@ -428,36 +530,15 @@ def bulk_upsert_symbol_metrics(rows, source='nse_symbol_metrics'):
                     'updated_at': now_iso
                 }
                 
-                ops_daily_meta.append(UpdateOne(
-                    {'symbol': symbol},
-                    {
-                        '$set': {'company_name': cname, 'last_updated': now_iso},
-                        '$setOnInsert': {'symbol': symbol, 'created_at': now_iso}
-                    },
-                    upsert=True
-                ))
-                
-                ops_daily_pull.append(UpdateOne(
-                    {'symbol': symbol},
-                    {'$pull': {'daily_data': {'date': as_on}}}
-                ))
-                
-                ops_daily_push.append(UpdateOne(
-                    {'symbol': symbol},
-                    {'$push': {'daily_data': daily_entry}}
-                ))
+                ops_daily.append(metrics_bucket_store.upsert_op(symbol, as_on, daily_entry, company_name=cname, now_iso=now_iso))
 
         # Execute Bulk Operations
         if ops_main:
             symbol_metrics_collection.bulk_write(ops_main, ordered=False)
+            get_reference_data().invalidate('metrics')
         
-        if symbol_metrics_daily_collection is not None:
-            if ops_daily_meta:
-                symbol_metrics_daily_collection.bulk_write(ops_daily_meta, ordered=False)
-            if ops_daily_pull:
-                symbol_metrics_daily_collection.bulk_write(ops_daily_pull, ordered=False)
-            if ops_daily_push:
-                symbol_metrics_daily_collection.bulk_write(ops_daily_push, ordered=False)
+        if ops_daily:
+            metrics_bucket_store.write(ops_daily)
                 
         print(f"✅ Bulk upserted {len(rows)} symbol metrics successfully ({source})")
     except Exception as exc:
@@ -533,7 +614,7 @@ def enrich_rows_from_metrics_db(rows):
 
     return rows
 
-def persist_consolidated_results(consolidator, data_type, source='consolidation', skip_daily=False):
+def persist_consolidated_results(consolidator, data_type, source='consolidation', skip_daily=False, skip_aggregates=False):
     """Store per-symbol per-date values and averages into MongoDB using bulk operations with memory optimization."""
     if consolidator is None or consolidator.df_consolidated is None:
         return
@@ -561,8 +642,10 @@ def persist_consolidated_results(consolidator, data_type, source='consolidation'
             batch_df = consolidator.df_consolidated.iloc[i : i + SYMBOL_BATCH_SIZE]
             aggregate_ops = []
             daily_ops = []
+            symbol_ids = get_symbol_ids()
+            batch_sids = symbol_ids.encode(batch_df['Symbol'].fillna('').astype(str).str.strip()) if not skip_daily else None
             
-            for _, row in batch_df.iterrows():
+            for row_pos, (_, row) in enumerate(batch_df.iterrows()):
                 symbol = str(row.get('Symbol') or '').strip()
                 company_name = str(row.get('Company Name') or '').strip()
                 if not symbol:
@@ -575,7 +658,7 @@ def persist_consolidated_results(consolidator, data_type, source='consolidation'
                 non_zero_val = row.get(consolidator.non_zero_days_col) if hasattr(consolidator, 'non_zero_days_col') else row.get('non_zero_days', 0)
                 total_possible = row.get('total_possible_days', 0)
                 
-                if symbol_aggregates_collection is not None:
+                if symbol_aggregates_collection is not None and not skip_aggregates:
                     payload = {
                         'symbol': symbol,
                         'company_name': company_name,
@@ -600,6 +683,7 @@ def persist_consolidated_results(consolidator, data_type, source='consolidation'
 
                 # Prepare daily upserts
                 if symbol_daily_collection is not None and not skip_daily:
+                    sid_fields = symbol_ids.sid_fields(batch_sids[row_pos])
                     for date_str in date_cols:
                         val = row.get(date_str)
                         if val in (None, ''):
@@ -616,7 +700,8 @@ def persist_consolidated_results(consolidator, data_type, source='consolidation'
                             'type': data_type,
                             'value': _safe_float(val),
                             'source': source,
-                            'updated_at': datetime.now().isoformat()
+                            'updated_at': datetime.now().isoformat(),
+                            **sid_fields
                         }
                         daily_ops.append(
                             UpdateOne(
@@ -643,11 +728,42 @@ def persist_consolidated_results(consolidator, data_type, source='consolidation'
             print(f"[persist] ✓ Batched persistence: {processed}/{total_rows} symbols processed")
 
         print(f"[persist] ✓ All results persisted for {data_type}")
+        get_reference_data().invalidate('aggregates')
             
     except Exception as exc:
         import traceback
         traceback.print_exc()
         print(f"⚠️ Failed to persist consolidated results for {data_type}: {exc}")
+    finally:
+        # daily rows went straight to Mongo (possibly only some batches): matrix columns refill on next read
+        if symbol_daily_collection is not None and not skip_daily:
+            invalidate_matrix_days(data_type, [
+                d.strftime('%Y-%m-%d')
+                for d in pd.to_datetime(pd.Index([c[0] for c in consolidator.dates_list]), format='%d-%m-%Y', errors='coerce')
+                if not pd.isna(d)
+            ])
+
+
+def update_aggregates_for_window(consolidator, data_type, date_iso_list, skip_daily=True, log_fn=None):
+    """
+    Bring symbol_aggregates in line with a consolidation window. Uses the incremental
+    engine (edge days only) when symbol_daily covers the range, else the full rewrite.
+    """
+    if aggregate_engine is None or not date_iso_list:
+        persist_consolidated_results(consolidator, data_type, source='cached_db', skip_daily=skip_daily)
+        return
+    if not skip_daily:
+        # Daily rows must land first so the engine can read them
+        persist_consolidated_results(consolidator, data_type, source='cached_db', skip_daily=False, skip_aggregates=True)
+    try:
+        summary = aggregate_engine.set_window(data_type, min(date_iso_list), max(date_iso_list))
+        get_reference_data().invalidate('aggregates')
+        if summary['applied_days'] > 0:
+            if log_fn: log_fn(f"✓ Incremental {data_type.upper()} aggregates: +{summary['added_days']}/-{summary['removed_days']} days")
+            return
+    except Exception as exc:
+        if log_fn: log_fn(f"⚠️ Incremental aggregates failed for {data_type.upper()}: {exc}")
+    persist_consolidated_results(consolidator, data_type, source='cached_db', skip_daily=True)
 
 
 def _parse_mcap_date_from_filename(filename):
@@ -690,21 +806,111 @@ def find_mcap_files_in_range(base_dir, start_dt, end_dt):
 
 
 # ===== Cache helpers =====
+# Columnar (Parquet) bhavcache: local files are the fast read path, Mongo `bhavcache`
+# keeps the durable copy (Parquet bytes, or legacy CSV bytes until migrated).
+BHAVCACHE_DIR = os.getenv('BHAVCACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'bhavcache'))
+columnar_store = None
+if parquet_available():
+    try:
+        columnar_store = ColumnarBhavStore(BHAVCACHE_DIR)
+        print(f"✅ Columnar bhavcache enabled at {BHAVCACHE_DIR}")
+    except Exception as exc:
+        print(f"⚠️ Columnar bhavcache disabled: {exc}")
+else:
+    print("⚠️ pyarrow not installed - bhavcache falls back to CSV blobs")
+
+# Dense symbol x date matrices (memory-mapped) kept in step with symbol_daily;
+# consolidation windows are answered by slicing them
+MATRIX_STORE_DIR = os.getenv('MATRIX_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'matrix'))
+matrix_store = None
+try:
+    matrix_store = MatrixStore(MATRIX_STORE_DIR)
+    print(f"✅ Symbol/date matrix store at {MATRIX_STORE_DIR}")
+except Exception as exc:
+    print(f"⚠️ Matrix store disabled: {exc}")
+
+
+def invalidate_matrix_days(data_type, date_isos):
+    """symbol_daily rows changed without going through set_day: let the matrix refill those days."""
+    if matrix_store is None or not date_isos:
+        return
+    try:
+        matrix_store.invalidate(data_type, date_isos)
+    except Exception as exc:
+        print(f"⚠️ Matrix invalidation for {data_type} failed: {exc}")
+
+# Finished consolidate-saved exports, keyed by request params + bhavcache versions
+EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'exports'))
+export_cache = None
+try:
+    export_cache = ExportResultCache(EXPORT_CACHE_DIR, max_bytes=int(os.getenv('EXPORT_CACHE_MAX_MB', 2048)) * 1024 * 1024)
+    print(f"✅ Export result cache at {EXPORT_CACHE_DIR}")
+except Exception as exc:
+    print(f"⚠️ Export result cache disabled: {exc}")
+
+
+def invalidate_export_cache(date_iso_list):
+    """Drop cached exports covering dates whose underlying data just changed."""
+    if export_cache is None:
+        return
+    try:
+        dropped = export_cache.invalidate_dates(date_iso_list)
+        if dropped:
+            print(f"[export-cache] invalidated {dropped} cached export(s) for {list(date_iso_list)}")
+    except Exception as exc:
+        print(f"⚠️ Export cache invalidation failed: {exc}")
+
+
 def _normalize_iso_date(dt):
     return dt.strftime('%Y-%m-%d')
 
 
+def _decode_cached_blob(doc, columns=None):
+    """Decode a bhavcache document's file_data according to its storage format."""
+    blob = doc.get('file_data')
+    if not blob:
+        return None
+    if doc.get('format') == 'parquet':
+        return read_parquet_bytes(blob, columns=columns)
+    if columns:
+        return pd.read_csv(BytesIO(blob), usecols=lambda c: c.strip() in columns)
+    return pd.read_csv(BytesIO(blob))
+
+
+def _mirror_cached_doc(doc, df=None):
+    """
+    Write-through of a bhavcache doc to the local columnar store, so the next
+    read comes from disk. Legacy CSV docs are converted (df: the full decoded
+    frame when the caller already has it).
+    """
+    if columnar_store is None:
+        return
+    try:
+        if doc.get('format') == 'parquet':
+            columnar_store.write_bytes(doc['date'], doc['type'], doc['file_data'])
+        elif doc.get('format') in (None, 'csv'):
+            full = df if df is not None else _decode_cached_blob(doc)
+            if full is not None:
+                columnar_store.write(doc['date'], doc['type'], full)
+    except Exception as exc:
+        print(f"⚠️ Local bhavcache mirror for {doc.get('type')} {doc.get('date')} failed: {exc}")
+
+
 def get_cached_csv(date_iso, data_type):
+    if columnar_store is not None:
+        df = columnar_store.read(date_iso, data_type)
+        if df is not None:
+            return {'df': df, 'records': len(df), 'columns': df.columns.tolist(), 'stored_at': None}
     if bhavcache_collection is None:
         return None
     doc = bhavcache_collection.find_one({'date': date_iso, 'type': data_type})
     if not doc:
         return None
     try:
-        csv_bytes = doc.get('file_data')
-        if not csv_bytes:
+        df = _decode_cached_blob(doc)
+        if df is None:
             return None
-        df = pd.read_csv(BytesIO(csv_bytes))
+        _mirror_cached_doc(doc, df)
         return {
             'df': df,
             'records': doc.get('records', len(df)),
@@ -717,52 +923,54 @@ def get_cached_csv(date_iso, data_type):
 
 
 def get_cached_csv_bulk(date_iso_list, data_type):
-    """Bulk fetch cached CSVs for multiple dates (faster than one-by-one)"""
-    if bhavcache_collection is None:
-        return {}
-    
+    """Bulk fetch cached data for multiple dates, decoding only the consolidation columns."""
+    req_cols = consolidation_columns(data_type)
+    symbol_col = req_cols[0]
+    results = {}
+
+    # 1. Local columnar files (no network, column-pruned decode)
+    if columnar_store is not None:
+        for date_iso, df in columnar_store.read_many(date_iso_list, data_type, columns=req_cols).items():
+            if symbol_col not in df.columns:
+                continue
+            df[symbol_col] = df[symbol_col].astype('category')
+            results[date_iso] = {'df': df, 'records': len(df), 'columns': df.columns.tolist(), 'stored_at': None}
+
+    remaining = [d for d in date_iso_list if d not in results]
+    if not remaining or bhavcache_collection is None:
+        return results
+
     try:
-        # Single query for all dates
-        docs = list(bhavcache_collection.find({
-            'date': {'$in': date_iso_list},
+        # Single query for the dates not on local disk
+        docs = bhavcache_collection.find({
+            'date': {'$in': remaining},
             'type': data_type
-        }))
-        
-        results = {}
+        })
+
         for doc in docs:
             date_iso = doc.get('date')
             try:
-                csv_bytes = doc.get('file_data')
-                if csv_bytes:
-                    # Determine columns to load based on data_type
-                    symbol_col = 'SECURITY' if data_type == 'pr' else 'Symbol'
-                    value_col = 'NET_TRDVAL' if data_type == 'pr' else 'Market Cap(Rs.)'
-                    name_col = 'SECURITY' if data_type == 'pr' else 'Security Name'
-
-                    req_cols = [symbol_col, value_col]
-                    if symbol_col != name_col: # Only add if different from symbol_col
-                        req_cols.append(name_col)
-                    
-                    # OPTIMIZATION: Load only necessary columns and specify dtypes
-                    df = pd.read_csv(
-                        BytesIO(csv_bytes),
-                        usecols=req_cols,
-                        dtype={symbol_col: 'category'} # Category saves memory for repeated symbols
-                    )
-                    
-                    results[date_iso] = {
-                        'df': df,
-                        'records': doc.get('records', len(df)),
-                        'columns': doc.get('columns', df.columns.tolist()),
-                        'stored_at': doc.get('stored_at')
-                    }
+                df = _decode_cached_blob(doc, columns=req_cols)
+                if df is None:
+                    continue
+                df.columns = df.columns.str.strip()
+                # Category saves memory for repeated symbols
+                df[symbol_col] = df[symbol_col].astype('category')
+                results[date_iso] = {
+                    'df': df,
+                    'records': doc.get('records', len(df)),
+                    'columns': doc.get('columns', df.columns.tolist()),
+                    'stored_at': doc.get('stored_at')
+                }
+                # Write-through so the next consolidation reads from disk
+                _mirror_cached_doc(doc)
             except Exception as e:
                 print(f"⚠️ Failed to read cached {data_type} for {date_iso}: {e}")
-        
+
         return results
     except Exception as e:
         print(f"⚠️ Bulk cache fetch failed for {data_type}: {e}")
-        return {}
+        return results
 
 
 def get_cached_csv_metadata_bulk(date_iso_list, data_type):
@@ -795,18 +1003,28 @@ def get_cached_csv_metadata_bulk(date_iso_list, data_type):
 
 
 def put_cached_csv(date_iso, data_type, df, source='nse'):
-    if bhavcache_collection is None or df is None:
-        return None
+    """Store a day's bhavcopy (local Parquet and/or Mongo). Returns True when it was stored anywhere."""
+    if df is None:
+        return False
     try:
-        csv_buf = BytesIO()
-        df.to_csv(csv_buf, index=False)
+        if columnar_store is not None:
+            file_data = columnar_store.write(date_iso, data_type, df)
+            file_format = 'parquet'
+        else:
+            csv_buf = BytesIO()
+            df.to_csv(csv_buf, index=False)
+            file_data = csv_buf.getvalue()
+            file_format = 'csv'
+        if bhavcache_collection is None:
+            return file_format == 'parquet'  # only the local columnar copy
         bhavcache_collection.update_one(
             {'date': date_iso, 'type': data_type},
             {
                 '$set': {
                     'date': date_iso,
                     'type': data_type,
-                    'file_data': csv_buf.getvalue(),
+                    'file_data': file_data,
+                    'format': file_format,
                     'records': len(df),
                     'columns': df.columns.tolist(),
                     'stored_at': datetime.now().isoformat(),
@@ -815,84 +1033,175 @@ def put_cached_csv(date_iso, data_type, df, source='nse'):
             },
             upsert=True
         )
+        invalidate_export_cache([date_iso])
         return True
     except Exception as e:
         print(f"⚠️ Failed to cache {data_type} for {date_iso}: {e}")
-        return None
+        return False
+
+
+def migrate_bhavcache_to_columnar(batch_size=50, dry_run=False):
+    """
+    Convert legacy CSV `bhavcache` documents to Parquet in place and populate
+    the local columnar store. Safe to re-run: already-converted docs are skipped.
+    """
+    summary = {'scanned': 0, 'converted': 0, 'bytes_before': 0, 'bytes_after': 0, 'errors': []}
+    if bhavcache_collection is None:
+        summary['errors'].append('Database not connected')
+        return summary
+    if columnar_store is None:
+        summary['errors'].append('pyarrow not installed')
+        return summary
+
+    query = {'format': {'$nin': ['parquet', 'zip']}}
+    ids = [doc['_id'] for doc in bhavcache_collection.find(query, {'_id': 1})]
+    print(f"[migrate-columnar] {len(ids)} CSV documents to convert (dry_run={dry_run})")
+
+    for i in range(0, len(ids), batch_size):
+        for doc in bhavcache_collection.find({'_id': {'$in': ids[i:i + batch_size]}}):
+            summary['scanned'] += 1
+            date_iso, data_type = doc.get('date'), doc.get('type')
+            try:
+                df = _decode_cached_blob(doc)
+                if df is None:
+                    continue
+                df.columns = df.columns.str.strip()
+                parquet_bytes = df_to_parquet_bytes(df)
+                summary['bytes_before'] += len(doc.get('file_data') or b'')
+                summary['bytes_after'] += len(parquet_bytes)
+                if dry_run:
+                    continue
+                columnar_store.write_bytes(date_iso, data_type, parquet_bytes)
+                bhavcache_collection.update_one(
+                    {'_id': doc['_id']},
+                    {'$set': {'file_data': parquet_bytes, 'format': 'parquet', 'migrated_at': datetime.now().isoformat()}}
+                )
+                summary['converted'] += 1
+            except Exception as exc:
+                summary['errors'].append({'date': date_iso, 'type': data_type, 'error': str(exc)})
+        print(f"[migrate-columnar] ✓ {min(i + batch_size, len(ids))}/{len(ids)} documents processed")
+
+    return summary
 
 
-def bulk_upsert_symbol_daily_from_df(df, date_iso, data_type, source='nse_download', symbol_name_map=None):
-    """Fast upsert of per-symbol values into Mongo, avoids per-row round trips."""
+# Fuzzy PR name matching on ingest is opt-in: a wrong match there overwrites a stored value
+PR_FUZZY_INGEST = os.getenv('PR_FUZZY_INGEST', 'false').lower() in ('1', 'true', 'yes')
+
+
+def bulk_upsert_symbol_daily_from_df(df, date_iso, data_type, source='nse_download', symbol_name_map=None, refresh_aggregates=True):
+    """
+    Fast upsert of per-symbol values into Mongo, avoids per-row round trips.
+    Normalization, PR name mapping and summary-row filtering run column-wise;
+    rows already stored with identical values are skipped, so re-downloading
+    a day only writes what changed. Batch callers pass refresh_aggregates=False
+    and call aggregate_engine.refresh_pending() once at the end.
+    """
     if symbol_daily_collection is None or df is None or df.empty:
         return
     symbol_col = 'Symbol' if data_type == 'mcap' else 'SECURITY'
     name_col = 'Security Name' if data_type == 'mcap' else 'SECURITY'
     value_col = 'Market Cap(Rs.)' if data_type == 'mcap' else 'NET_TRDVAL'
-    
-    # Pre-process PR mapping if needed
-    pr_lookup = None
+    if symbol_col not in df.columns or value_col not in df.columns:
+        return
+
+    raw_symbols = df[symbol_col].fillna('').astype(str).str.strip()
+    if name_col in df.columns:
+        names = df[name_col].fillna('').astype(str).str.strip()
+        names = names.where(names != '', raw_symbols)
+    else:
+        names = raw_symbols
+    values = pd.to_numeric(df[value_col], errors='coerce')
+    mask = (raw_symbols != '') & values.notna() & ~summary_symbol_mask(raw_symbols)
+
+    symbols = raw_symbols
     if data_type == 'pr' and symbol_name_map:
-        # Build normalized lookup: normalized_name -> ticker_symbol
-        def normalize_name(name):
-            if not name: return ''
-            return ''.join(c.upper() for c in str(name) if c.isalnum() or c.isspace()).strip()
-        
-        pr_lookup = {}
-        for company_name, ticker in symbol_name_map.items():
-            norm_name = normalize_name(company_name)
-            if norm_name: pr_lookup[norm_name] = ticker
+        name_index = get_name_index_for_map(symbol_name_map)
+        if name_index.size:
+            # PR SECURITY is the company name; rows that do not map to an MCAP ticker are
+            # dropped to keep sorting/averaging consistent with MCAP
+            symbols = name_index.resolve(raw_symbols, fuzzy=PR_FUZZY_INGEST)
+            mask &= symbols.notna()
+
+    day = pd.DataFrame({
+        'symbol': symbols[mask].astype(str),
+        'company_name': names[mask],
+        'value': values[mask].astype(float)
+    }).drop_duplicates('symbol', keep='last')
+    if day.empty:
+        return
+    day['sid'] = get_symbol_ids().encode(day['symbol'])
+
+    # One read of what is stored for this day: used to skip unchanged rows and,
+    # when the day is already aggregated, as its prior contribution
+    existing = {}
+    for doc in symbol_daily_collection.find(
+        {'type': data_type, 'date': date_iso},
+        {'symbol': 1, 'value': 1, 'company_name': 1, '_id': 0}
+    ):
+        if doc.get('symbol'):
+            existing[doc['symbol']] = (doc.get('value'), doc.get('company_name'))
+
+    old_values = None
+    if aggregate_engine is not None and aggregate_engine.is_applied(data_type, date_iso):
+        old_values = {
+            sym: (float(val), name) for sym, (val, name) in existing.items()
+            if val is not None and sym.strip().upper() != 'PERMITTED'
+        }
+
+    now_iso = datetime.now().isoformat()
+    sym_arr = day['symbol'].to_numpy()
+    name_arr = day['company_name'].to_numpy()
+    val_arr = day['value'].to_numpy()
+    sid_arr = day['sid'].to_numpy()
 
     ops = []
-    for _, row in df.iterrows():
-        raw_symbol = str(row.get(symbol_col) or '').strip()
-        if not raw_symbol or is_summary_symbol(raw_symbol):
-            continue
-            
-        symbol = raw_symbol
-        company_name = str(row.get(name_col) or symbol).strip()
-        
-        # PR Mapping Logic
-        if data_type == 'pr' and pr_lookup:
-            def normalize_name(name):
-                if not name: return ''
-                return ''.join(c.upper() for c in str(name) if c.isalnum() or c.isspace()).strip()
-            
-            norm_pr = normalize_name(raw_symbol) # raw_symbol is the company name in PR
-            mapped_ticker = pr_lookup.get(norm_pr)
-            if mapped_ticker:
-                symbol = mapped_ticker
-                # company_name stays as the full name from PR if we want, or we can use it from the map if we had it
-            else:
-                # If we can't map it, skip it to ensure consistent sorting/averaging with MCAP
-                # (since PR without MCAP ticker won't group correctly in the pivot)
-                continue
-                
-        raw_value = row.get(value_col)
-        value = pd.to_numeric(raw_value, errors='coerce')
-        if pd.isna(value):
+    new_values = {}
+    for symbol, company_name, value, sid in zip(sym_arr, name_arr, val_arr, sid_arr):
+        value = float(value)
+        if symbol.strip().upper() != 'PERMITTED':
+            new_values[symbol] = (value, company_name)
+        if existing.get(symbol) == (value, company_name):
             continue
-        ops.append(UpdateOne(
-            {'symbol': symbol, 'type': data_type, 'date': date_iso},
-            {'$set': {
-                'symbol': symbol,
-                'company_name': company_name,
-                'type': data_type,
-                'date': date_iso,
-                'value': float(value),
-                'source': source,
-                'updated_at': datetime.now().isoformat()
-            }},
-            upsert=True
-        ))
-    if not ops:
-        return
-    # chunk to keep payload moderate
-    chunk_size = 1000
-    for i in range(0, len(ops), chunk_size):
+        doc = {
+            'symbol': symbol,
+            'company_name': company_name,
+            'type': data_type,
+            'date': date_iso,
+            'value': value,
+            'source': source,
+            'updated_at': now_iso,
+            **get_symbol_ids().sid_fields(sid)
+        }
+        ops.append(UpdateOne({'symbol': symbol, 'type': data_type, 'date': date_iso}, {'$set': doc}, upsert=True))
+
+    if ops:
+        # chunk to keep payload moderate
+        chunk_size = 1000
+        for i in range(0, len(ops), chunk_size):
+            try:
+                symbol_daily_collection.bulk_write(ops[i:i + chunk_size], ordered=False)
+            except Exception as exc:
+                print(f"⚠️ bulk upsert for {data_type} {date_iso} failed: {exc}")
+    print(f"[symbol_daily] {data_type.upper()} {date_iso}: {len(ops)} changed / {len(day) - len(ops)} unchanged rows")
+    if ops:
+        invalidate_export_cache([date_iso])
+
+    if matrix_store is not None:
+        try:
+            matrix_store.get(data_type).set_day(date_iso, new_values)
+        except Exception as exc:
+            print(f"⚠️ Matrix update for {data_type} {date_iso} failed: {exc}")
+
+    # Fold this day into the running aggregates (O(symbols), no range recomputation)
+    if aggregate_engine is not None and (ops or old_values is None):
         try:
-            symbol_daily_collection.bulk_write(ops[i:i + chunk_size], ordered=False)
+            if old_values is not None:
+                aggregate_engine.replace_day(data_type, date_iso, old_values, new_values, refresh=refresh_aggregates)
+            else:
+                aggregate_engine.add_day(data_type, date_iso, day_values=new_values, refresh=refresh_aggregates)
+            get_reference_data().invalidate('aggregates')
         except Exception as exc:
-            print(f"⚠️ bulk upsert for {data_type} {date_iso} failed: {exc}")
+            print(f"⚠️ Incremental aggregate update for {data_type} {date_iso} failed: {exc}")
 
 
 def get_consolidated_metrics_from_db(date_iso_list, data_type, allowed_symbols=None):
@@ -911,7 +1220,7 @@ def get_consolidated_metrics_from_db(date_iso_list, data_type, allowed_symbols=N
             'symbol': {'$nin': ['Permitted', 'PERMITTED']}
         }
         if allowed_symbols:
-            match_query['symbol'] = {'$in': list(allowed_symbols)}
+            match_query.update(get_symbol_ids().in_filter(allowed_symbols, symbol_daily_collection))
             
         pipeline = [
             {
@@ -995,6 +1304,36 @@ def get_consolidated_metrics_from_db(date_iso_list, data_type, allowed_symbols=N
         return None
 
 
+def get_consolidated_metrics_from_matrix(date_iso_list, data_type, allowed_symbols=None):
+    """
+    Consolidation as NumPy reductions over the memory-mapped symbol x date matrix.
+    Days not yet in the matrix are loaded from symbol_daily first (one query),
+    so a cold or wiped matrix fills itself in. Same output shape as
+    get_consolidated_metrics_from_db; None when unavailable or empty.
+    """
+    if matrix_store is None:
+        return None
+    try:
+        matrix = matrix_store.get(data_type)
+        missing = [d for d in date_iso_list if not matrix.has_date(d)]
+        if missing and symbol_daily_collection is not None:
+            by_date = {}
+            for doc in symbol_daily_collection.find(
+                {'type': data_type, 'date': {'$in': missing}},
+                {'symbol': 1, 'company_name': 1, 'value': 1, 'date': 1, '_id': 0}
+            ):
+                sym = doc.get('symbol')
+                if not sym or doc.get('value') is None or sym.strip().upper() == 'PERMITTED':
+                    continue
+                by_date.setdefault(doc['date'], {})[sym] = (float(doc['value']), doc.get('company_name'))
+            for date_iso, day_values in by_date.items():
+                matrix.set_day(date_iso, day_values)
+        return matrix.consolidate(date_iso_list, allowed_symbols=allowed_symbols)
+    except Exception as e:
+        print(f"⚠️ Matrix consolidation failed for {data_type}: {e}")
+        return None
+
+
 def build_consolidated_from_cache(date_iso_list, data_type, allow_missing=False, log_fn=None, allowed_symbols=None, symbol_name_map=None):
     """Build consolidated dataframe - ULTRA-OPTIMIZED with minimal operations."""
     
@@ -1005,7 +1344,9 @@ def build_consolidated_from_cache(date_iso_list, data_type, allow_missing=False,
 
     # OPTIMIZATION: Try DB aggregation first (it's much faster)
     if log_fn: log_fn(f"⚡ Attempting high-performance DB aggregation for {data_type.upper()}...")
-    df_db = get_consolidated_metrics_from_db(date_iso_list, data_type, allowed_symbols=allowed_symbols)
+    df_db = get_consolidated_metrics_from_matrix(date_iso_list, data_type, allowed_symbols=allowed_symbols)
+    if df_db is None or df_db.empty:
+        df_db = get_consolidated_metrics_from_db(date_iso_list, data_type, allowed_symbols=allowed_symbols)
     if df_db is not None and not df_db.empty:
         if log_fn: log_fn(f"✅ DB aggregation successful ({len(df_db)} records)")
         
@@ -1080,31 +1421,35 @@ def build_consolidated_from_cache(date_iso_list, data_type, allow_missing=False,
                  symbols_upper.str.startswith(('TOTAL', 'LISTED', 'PERMITTED'))
     df_all = df_all[~is_summary]
 
-    # Filter to allowed symbols if needed
+    # Dictionary-encode the symbol key and the date once: filtering, de-duplication
+    # and the pivot run on int codes; strings come back only for the output rows
+    sym_codes, sym_keys = pd.factorize(df_all[symbol_col])
     if allowed_symbols is not None:
-        df_all = df_all[df_all[symbol_col].isin(allowed_symbols)]
+        keep = np.asarray(sym_keys.isin(allowed_symbols))[sym_codes]
+        df_all, sym_codes = df_all[keep], sym_codes[keep]
         if df_all.empty:
             raise ValueError(f"No {data_type.upper()} data for requested symbols")
-
-    # Convert dates once (vectorized)
-    df_all['_date_str'] = pd.to_datetime(df_all['_date_iso']).dt.strftime('%d-%m-%Y')
-    date_cols = sorted(df_all['_date_str'].unique(), key=lambda d: datetime.strptime(d, '%d-%m-%Y'))
-
-    # ULTRA-FAST RESHAPE: No groupby, just direct unstack with drop_duplicates
-    df_all = df_all.drop_duplicates(subset=[symbol_col, '_date_str'], keep='last')
-    df_all_pivot = df_all.set_index([symbol_col, '_date_str'])[value_col].unstack(fill_value=None)
-    df_all_pivot.reset_index(inplace=True)
-    df_all_pivot.rename(columns={symbol_col: 'Symbol'}, inplace=True)
-
-    # Get company names (single pass, handles symbol_col == name_col case)
-    if symbol_col == name_col:
-        # When symbol and name are the same column, map each to itself
-        name_lookup = {sym: sym for sym in df_all[symbol_col].drop_duplicates().values}
-    else:
-        # Normal case: create mapping from different columns
-        unique_df = df_all.drop_duplicates(symbol_col, keep='last')
-        name_lookup = unique_df.set_index(symbol_col)[name_col].to_dict()
-    df_all_pivot['Company Name'] = df_all_pivot['Symbol'].map(name_lookup)
+    date_codes, date_keys = pd.factorize(df_all['_date_iso'])
+    date_values = pd.to_datetime(pd.Index(date_keys))
+    order = np.argsort(date_values.values, kind='stable')
+    date_rank = np.empty(len(order), dtype=np.int64)
+    date_rank[order] = np.arange(len(order))
+    date_codes = date_rank[date_codes]
+    date_cols = list(date_values[order].strftime('%d-%m-%Y'))
+
+    # Later rows win, as drop_duplicates(keep='last') did
+    n_rows = len(sym_codes)
+    cell = sym_codes.astype(np.int64) * len(date_cols) + date_codes
+    _, last_from_end = np.unique(cell[::-1], return_index=True)
+    last = n_rows - 1 - last_from_end
+    matrix = np.full((len(sym_keys), len(date_cols)), np.nan)
+    matrix[sym_codes[last], date_codes[last]] = df_all[value_col].to_numpy(dtype=float)[last]
+
+    rows, last_from_end = np.unique(sym_codes[::-1], return_index=True)
+    df_all_pivot = pd.DataFrame(matrix[rows], columns=date_cols)
+    df_all_pivot.insert(0, 'Symbol', np.asarray(sym_keys, dtype=object)[rows])
+    # Company name from each symbol's last row (the symbol itself for PR, where both are SECURITY)
+    df_all_pivot['Company Name'] = df_all[name_col].to_numpy(dtype=object)[n_rows - 1 - last_from_end]
 
     # For PR data: Replace company names (in Symbol column) with ticker symbols from MCAP
     if data_type == 'pr' and symbol_name_map:
@@ -1112,46 +1457,25 @@ def build_consolidated_from_cache(date_iso_list, data_type, allow_missing=False,
         # df_all_pivot['Symbol'] currently contains company names (from SECURITY column)
         # Map them to ticker symbols so they match MCAP symbols
         original_companies = df_all_pivot['Symbol'].copy()
-        before_count = len(df_all_pivot)
-        
-        # Create normalized mapping for better matching
-        # Normalize: uppercase, remove extra spaces, punctuation
-        def normalize_name(name):
-            if not name:
-                return ''
-            return ''.join(c.upper() for c in str(name) if c.isalnum() or c.isspace()).strip()
-        
-        # Build normalized lookup: normalized_name → ticker_symbol
-        normalized_map = {}
-        for company_name, ticker in symbol_name_map.items():
-            norm_name = normalize_name(company_name)
-            if norm_name:
-                normalized_map[norm_name] = ticker
-        
-        # Try exact match first, then normalized match
-        def find_ticker(pr_company_name):
-            # Try exact match
-            if pr_company_name in symbol_name_map:
-                return symbol_name_map[pr_company_name]
-            # Try normalized match
-            norm_pr = normalize_name(pr_company_name)
-            return normalized_map.get(norm_pr)
-        
-        df_all_pivot['Symbol'] = original_companies.apply(find_ticker)
+        name_index = get_name_index_for_map(symbol_name_map)
+        df_all_pivot['Symbol'], match = name_index.resolve_with_stats(original_companies, fuzzy=True)
         # Keep original company name
         df_all_pivot['Company Name'] = original_companies
         # Remove rows where mapping failed (no matching MCAP symbol)
+        unmatched_companies = original_companies[df_all_pivot['Symbol'].isna()]
         df_all_pivot = df_all_pivot[df_all_pivot['Symbol'].notna()]
-        after_count = len(df_all_pivot)
-        matched_count = after_count
-        unmatched_count = before_count - after_count
-        
+
         if log_fn:
-            log_fn(f"✓ PR symbol mapping: {matched_count}/{before_count} matched ({100*matched_count/before_count:.1f}%), {unmatched_count} unmatched")
-            if unmatched_count > 0 and unmatched_count <= 10:
-                # Show samples of unmatched names
-                unmatched_samples = original_companies[~original_companies.isin(df_all_pivot['Company Name'].values)].head(10).tolist()
-                log_fn(f"  Unmatched samples: {', '.join(unmatched_samples[:5])}")
+            log_fn(f"✓ PR symbol mapping: {match['matched']}/{match['total']} matched ({100 * (match['match_rate'] or 0):.1f}%; "
+                   f"exact {match['exact']}, normalized {match['normalized']}, compact {match['compact']}, ticker {match['symbol']}, "
+                   f"alias {match['alias']}, fuzzy {match['fuzzy']}), {match['unmatched']} unmatched")
+            for m in sorted(match['fuzzy_matches'], key=lambda m: m['confidence'])[:5]:
+                # Lowest-confidence fuzzy matches first, so bad ones are easy to spot
+                review = '' if m['learned'] else ', not learned - review'
+                log_fn(f"  Fuzzy: {m['pr_name']} → {m['symbol']} ({m['mcap_name']}, {m['confidence']:.2f}{review})")
+            if match['unmatched']:
+                samples = unmatched_companies.drop_duplicates().head(20).tolist()
+                log_fn(f"  Unmatched samples: {', '.join(map(str, samples))}")
 
     # Get available date columns
     available_cols = [c for c in date_cols if c in df_all_pivot.columns]
@@ -1179,6 +1503,8 @@ def build_consolidated_from_cache(date_iso_list, data_type, allow_missing=False,
             df_all_pivot[col] = pd.to_numeric(df_all_pivot[col], errors='coerce')
         df_all_pivot[avg_col] = pd.to_numeric(df_all_pivot[avg_col], errors='coerce')
 
+    dates_list = [(d, datetime.strptime(d, '%d-%m-%Y')) for d in available_cols]
+
     # Final column order
     final_cols = ['Symbol', 'Company Name', 'Days With Data', 'Non Zero Days', 'total_possible_days', avg_col] + available_cols
     df_all_pivot = df_all_pivot[[c for c in final_cols if c in df_all_pivot.columns]]
@@ -1228,7 +1554,18 @@ def keepalive():
         'service': 'stock-backend',
         'time': datetime.now().isoformat(),
         'uptime_seconds': uptime_seconds,
-        'db_connected': db is not None
+        'db_connected': db is not None,
+        'nse_client': get_nse_client().get_stats(),
+        'series_cache': get_series_cache().get_stats(),
+        'quote_cache': get_quote_cache().get_stats(),
+        'trading_calendar': get_trading_calendar().get_stats(),
+        'bhav_miss_cache': get_miss_cache().get_stats(),
+        'export_cache': export_cache.get_stats() if export_cache is not None else None,
+        'artifact_store': artifact_store.get_stats() if artifact_store is not None else None,
+        'reference_data': get_reference_data().get_stats(),
+        'name_index': name_index_stats(),
+        'pr_aliases': get_alias_table().get_stats(),
+        'symbol_ids': get_symbol_ids().get_stats()
     })
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     return response, 200
@@ -1292,12 +1629,7 @@ def calculate_averages_from_consolidated_data(symbols, start_date=None, end_date
                 end_dt = date_parser.parse(end_date)
                 if start_dt > end_dt:
                     return {}
-                current = start_dt
-                date_iso_list = []
-                while current <= end_dt:
-                    # Removed weekend skip: Include Saturdays and Sundays as well
-                    date_iso_list.append(current.strftime('%Y-%m-%d'))
-                    current += timedelta(days=1)
+                date_iso_list = get_trading_calendar().trading_days_iso(start_dt, end_dt)
             
             except:
                 return {}
@@ -1394,8 +1726,32 @@ def calculate_averages_from_db(symbols, start_date=None, end_date=None):
     if consolidated_averages:
         return consolidated_averages
     
-    # Fallback to original DB method with new schema
-    if symbol_metrics_daily_collection is None or not symbols:
+    if not symbols:
+        return {}
+
+    # Monthly buckets: only the months spanned by the range are read. Days of legacy
+    # symbol_metrics_daily docs not migrated yet are merged in.
+    if metrics_bucket_store is not None:
+        try:
+            legacy_present = symbol_metrics_daily_collection is not None and \
+                symbol_metrics_daily_collection.find_one(
+                    {'symbol': {'$in': symbols}, 'migrated_at': {'$exists': False}}, {'_id': 1}
+                ) is not None
+            if legacy_present:
+                result, merged = metrics_bucket_store.averages_with_legacy(
+                    symbol_metrics_daily_collection, symbols, start_date, end_date
+                )
+            else:
+                result, merged = metrics_bucket_store.averages(symbols, start_date, end_date), None
+            if result:
+                source = f"monthly buckets + {merged['legacy_days']} legacy days" if merged else "monthly buckets"
+                print(f"[calculate_averages_from_db] Calculated averages for {len(result)} symbols from {source} (fallback)")
+                return result
+        except Exception as exc:
+            print(f"⚠️ Failed to calculate averages from monthly buckets: {exc}")
+
+    # Legacy per-symbol array (data not yet migrated to buckets)
+    if symbol_metrics_daily_collection is None:
         return {}
     
     try:
@@ -1448,34 +1804,67 @@ def calculate_averages_from_db(symbols, start_date=None, end_date=None):
 
 
 def save_excel_to_database(excel_path, filename, metadata):
-    """Save Excel file to MongoDB"""
-    if excel_results_collection is None:
+    """
+    Upload an Excel file to the artifact store and index it in excel_results.
+    Returns the excel_results id (or the artifact id when Mongo is unavailable).
+    """
+    if artifact_store is None:
         return None
     
     try:
-        # Read Excel file as binary
-        with open(excel_path, 'rb') as f:
-            excel_binary = Binary(f.read())
-        
-        # Create document for MongoDB
+        file_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        artifact = artifact_store.put_file(excel_path, filename, file_type, metadata={'kind': 'excel_result'})
+        if excel_results_collection is None:
+            return artifact['id']
+
+        # Index document only - the workbook bytes stay in the artifact store
         document = {
             'filename': filename,
-            'file_data': excel_binary,
-            'file_size': os.path.getsize(excel_path),
+            'artifact_id': artifact['id'],
+            'artifact_backend': artifact_store.backend,
+            'file_size': artifact['length'],
             'created_at': datetime.now(),
+            'expires_at': artifact_store.expiry(),
             'metadata': metadata,
-            'file_type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            'file_type': file_type
         }
         
-        # Insert into database
         result = excel_results_collection.insert_one(document)
-        print(f"✅ Excel file saved to MongoDB with ID: {result.inserted_id}")
+        print(f"✅ Excel file saved to {artifact_store.backend} artifact store ({artifact['length'] / 1024 / 1024:.1f}MB) with ID: {result.inserted_id}")
         return result.inserted_id
     except Exception as e:
         print(f"⚠️ Error saving Excel to database: {e}")
         return None
 
 
+def send_artifact(artifact_id, filename=None, mimetype=None):
+    """
+    Stream an artifact in chunks, honouring single-range `Range` requests
+    (206 + Content-Range) so large files can be resumed.
+    """
+    info = artifact_store.info(artifact_id)
+    length = int(info.get('length') or 0)
+    byte_range = parse_range(request.headers.get('Range'), length)
+    if byte_range is False:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f"bytes */{length}"
+        return response
+
+    start, end = byte_range or (0, length)
+    response = Response(
+        artifact_store.iter_range(artifact_id, start, end),
+        status=206 if byte_range else 200,
+        mimetype=mimetype or info.get('content_type') or 'application/octet-stream',
+        direct_passthrough=True
+    )
+    response.headers['Content-Length'] = str(end - start)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = f"attachment; filename={filename or info.get('filename') or artifact_id}"
+    if byte_range:
+        response.headers['Content-Range'] = f"bytes {start}-{end - 1}/{length}"
+    return response
+
+
 def format_dashboard_excel(rows, excel_path, start_date=None, end_date=None):
     """
     Format dashboard Excel with required columns and calculations.
@@ -1513,12 +1902,7 @@ def format_dashboard_excel(rows, excel_path, start_date=None, end_date=None):
                     end_dt = date_parser.parse(end_date)
                     
                     if start_dt <= end_dt:
-                        current = start_dt
-                        date_iso_list = []
-                        while current <= end_dt:
-                            # Removed weekend skip: Include Saturdays and Sundays as well
-                            date_iso_list.append(current.strftime('%Y-%m-%d'))
-                            current += timedelta(days=1)
+                        date_iso_list = get_trading_calendar().trading_days_iso(start_dt, end_dt)
                         
                         if date_iso_list:
                             consolidation_averages = {}
@@ -1813,11 +2197,116 @@ def format_dashboard_excel(rows, excel_path, start_date=None, end_date=None):
 
 
 
-def download_nse_csv(date_obj_or_iso, data_type):
+BHAV_BUNDLE_TYPES = ('mcap', 'pr', 'bhav')
+RETAIN_BHAV_ZIP = os.getenv('RETAIN_BHAV_ZIP', 'false').lower() in ('1', 'true', 'yes')
+
+
+def _bundle_member(file_list, data_type):
+    """Pick the CSV for data_type out of a PR.zip listing."""
+    csv_files = [f for f in file_list if f.lower().endswith('.csv')]
+    if data_type == 'mcap':
+        for file in csv_files:
+            if file.lower().startswith('mcap'):
+                return file
+        data_type = 'bhav'  # older archives only carry the bhavcopy
+    if data_type == 'bhav':
+        for file in csv_files:
+            if 'bhav' in file.lower() or file.lower().startswith('bh'):
+                return file
+        return None
+    for file in csv_files:
+        if file.lower().startswith('pr'):
+            return file
+    return None
+
+
+def _read_bundle_csv(raw):
+    """Parse a bhavcopy CSV with the C engine; the python engine only for malformed files."""
+    try:
+        df = pd.read_csv(BytesIO(raw), on_bad_lines='skip', engine='c', low_memory=False)
+    except pd.errors.ParserError:
+        df = pd.read_csv(BytesIO(raw), on_bad_lines='skip', engine='python')
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def _bundle_zip_path(date_iso):
+    return os.path.join(BHAVCACHE_DIR, 'zip', f"{date_iso}.zip")
+
+
+def get_cached_bundle_zip(date_iso):
+    """Raw PR.zip bytes retained for date_iso (local file first, then Mongo), or None."""
+    path = _bundle_zip_path(date_iso)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    if bhavcache_collection is None:
+        return None
+    doc = bhavcache_collection.find_one({'date': date_iso, 'type': 'zip'}, {'file_data': 1})
+    return bytes(doc['file_data']) if doc and doc.get('file_data') else None
+
+
+def put_cached_bundle_zip(date_iso, zip_bytes, source='nse'):
+    """Keep the raw archive so later re-parses need no network."""
+    try:
+        path = _bundle_zip_path(date_iso)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(zip_bytes)
+        if bhavcache_collection is not None:
+            bhavcache_collection.update_one(
+                {'date': date_iso, 'type': 'zip'},
+                {'$set': {
+                    'date': date_iso,
+                    'type': 'zip',
+                    'file_data': Binary(zip_bytes),
+                    'format': 'zip',
+                    'stored_at': datetime.now().isoformat(),
+                    'source': source
+                }},
+                upsert=True
+            )
+        return True
+    except Exception as e:
+        print(f"⚠️ Failed to retain bhavcopy ZIP for {date_iso}: {e}")
+        return None
+
+
+def prune_bundle_zips(cutoff_iso=None):
     """
-    Download a specific CSV (mcap or pr) from NSE for a given date.
-    Returns: pandas.DataFrame or None
+    Drop retained archives dated before cutoff_iso (all of them when None):
+    files under BHAVCACHE_DIR/zip and type 'zip' bhavcache docs.
+    Returns (files_removed, docs_removed).
+    """
+    zip_dir = os.path.dirname(_bundle_zip_path('x'))
+    removed_files = 0
+    if os.path.isdir(zip_dir):
+        for name in os.listdir(zip_dir):
+            if name.endswith('.zip') and (cutoff_iso is None or name[:-4] < cutoff_iso):
+                try:
+                    os.remove(os.path.join(zip_dir, name))
+                    removed_files += 1
+                except OSError as exc:
+                    print(f"⚠️ Retained ZIP {name} not removed: {exc}")
+    removed_docs = 0
+    if bhavcache_collection is not None:
+        query = {'type': 'zip'}
+        if cutoff_iso is not None:
+            query['date'] = {'$lt': cutoff_iso}
+        removed_docs = bhavcache_collection.delete_many(query).deleted_count
+    return removed_files, removed_docs
+
+
+def download_nse_bundle(date_obj_or_iso, types=BHAV_BUNDLE_TYPES, retain_zip=None, use_retained=True):
+    """
+    Fetch the PR.zip archive for one date ONCE and parse every requested CSV.
+    Returns: {data_type: pandas.DataFrame or None} for each entry in types.
+    A retained archive (RETAIN_BHAV_ZIP / retain_zip=True) is re-parsed without
+    touching NSE. Failures are recorded per type in the bhavcopy miss cache so
+    range downloads know when the date is worth requesting again.
     """
+    result = {t: None for t in types}
+    date_iso = None
     try:
         if isinstance(date_obj_or_iso, str):
             # Handle both YYYY-MM-DD and DD-Mon-YYYY if needed, but primary is ISO
@@ -1829,67 +2318,95 @@ def download_nse_csv(date_obj_or_iso, data_type):
             date_obj = date_obj_or_iso
             
         nse_date_formatted = date_obj.strftime('%d-%b-%Y')
-        
-        # NSE API request
-        api_url = "https://www.nseindia.com/api/reports"
-        params = {
-            'archives': json.dumps([{
-                "name": "CM - Bhavcopy (PR.zip)",
-                "type": "archives",
-                "category": "capital-market",
-                "section": "equities"
-            }]),
-            'date': nse_date_formatted,
-            'type': 'equities',
-            'mode': 'single'
-        }
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Connection': 'keep-alive'
-        }
-        
-        # Mimic browser requests more closely to avoid blocks
-        response = requests.get(api_url, params=params, headers=headers, timeout=30)
-        if response.status_code != 200:
-            print(f"⚠️ NSE API returned {response.status_code} for {nse_date_formatted}")
-            return None
+        date_iso = date_obj.strftime('%Y-%m-%d')
+        retain_zip = RETAIN_BHAV_ZIP if retain_zip is None else retain_zip
+
+        zip_bytes = get_cached_bundle_zip(date_iso) if use_retained else None
+        if zip_bytes is None:
+            # NSE API request
+            api_url = "https://www.nseindia.com/api/reports"
+            params = {
+                'archives': json.dumps([{
+                    "name": "CM - Bhavcopy (PR.zip)",
+                    "type": "archives",
+                    "category": "capital-market",
+                    "section": "equities"
+                }]),
+                'date': nse_date_formatted,
+                'type': 'equities',
+                'mode': 'single'
+            }
             
-        zip_data = BytesIO(response.content)
-        with zipfile.ZipFile(zip_data, 'r') as zip_ref:
-            file_list = zip_ref.namelist()
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+                'Accept': 'application/json, text/plain, */*',
+                'Accept-Language': 'en-US,en;q=0.9',
+                'Connection': 'keep-alive'
+            }
             
-            target_file = None
-            if data_type == 'mcap':
-                # Look for mcap or bhav fallback
-                for file in file_list:
-                    if file.lower().startswith('mcap') and file.lower().endswith('.csv'):
-                        target_file = file
-                        break
+            # Mimic browser requests more closely to avoid blocks
+            response = get_nse_client().get(api_url, params=params, headers=headers, timeout=30)
+            if response.status_code == 404 or (response.status_code == 200 and not response.content):
+                # "No bhavcopy for this date": counts towards learning a holiday. Only
+                # seed-confirmed holidays are never retried; other past weekdays get a
+                # long retry window, and today/future dates may simply be unpublished
+                calendar = get_trading_calendar()
+                calendar.record_no_data(date_obj)
+                if date_obj.date() >= datetime.now().date():
+                    reason = BHAV_NOT_PUBLISHED
+                else:
+                    reason = BHAV_HOLIDAY if calendar.is_seed_holiday(date_obj) else BHAV_NO_DATA
+                for data_type in types:
+                    get_miss_cache().record(date_iso, data_type, reason, detail=f"HTTP {response.status_code}")
+            elif response.status_code != 200:
+                for data_type in types:
+                    get_miss_cache().record(date_iso, data_type, BHAV_HTTP_ERROR, detail=f"HTTP {response.status_code}")
+            if response.status_code != 200:
+                print(f"⚠️ NSE API returned {response.status_code} for {nse_date_formatted}")
+                return result
+            if not response.content:
+                print(f"⚠️ NSE API returned an empty body for {nse_date_formatted}")
+                return result
+            zip_bytes = response.content
+            fetched = True
+        else:
+            fetched = False
+
+        with zipfile.ZipFile(BytesIO(zip_bytes), 'r') as zip_ref:
+            file_list = zip_ref.namelist()
+            for data_type in types:
+                target_file = _bundle_member(file_list, data_type)
                 if not target_file:
-                    for file in file_list:
-                        if file.lower().endswith('.csv') and ('bhav' in file.lower() or file.lower().startswith('bh')):
-                            target_file = file
-                            break
-            else: # pr
-                for file in file_list:
-                    if file.lower().startswith('pr') and file.lower().endswith('.csv'):
-                        target_file = file
-                        break
-                        
-            if not target_file:
-                print(f"⚠️ Target file {data_type} not found in ZIP for {nse_date_formatted}. Files: {file_list}")
-                return None
-                
-            csv_content = zip_ref.read(target_file)
-            df = pd.read_csv(BytesIO(csv_content), on_bad_lines='skip', engine='python')
-            df.columns = df.columns.str.strip()
-            return df
+                    print(f"⚠️ Target file {data_type} not found in ZIP for {nse_date_formatted}. Files: {file_list}")
+                    get_miss_cache().record(date_iso, data_type, BHAV_MISSING_FILE, detail=', '.join(file_list)[:500])
+                    continue
+                df = _read_bundle_csv(zip_ref.read(target_file))
+                if not df.empty:
+                    get_miss_cache().clear(date_iso, data_type)
+                result[data_type] = df
+
+        if any(df is not None and not df.empty for df in result.values()):
+            get_trading_calendar().record_session(date_obj)
+            if fetched and retain_zip:
+                put_cached_bundle_zip(date_iso, zip_bytes)
+        return result
     except Exception as e:
-        print(f"⚠️ Error downloading {data_type} for {date_obj_or_iso}: {e}")
-        return None
+        print(f"⚠️ Error downloading bhavcopy bundle for {date_obj_or_iso}: {e}")
+        if date_iso:
+            reason = BHAV_HTTP_ERROR if isinstance(e, zipfile.BadZipFile) else BHAV_NETWORK_ERROR
+            for data_type in types:
+                if result.get(data_type) is None:
+                    get_miss_cache().record(date_iso, data_type, reason, detail=str(e)[:500])
+        return result
+
+
+def download_nse_csv(date_obj_or_iso, data_type):
+    """
+    Download a specific CSV (mcap or pr) from NSE for a given date.
+    Returns: pandas.DataFrame or None
+    Callers needing several CSVs for the same date should use download_nse_bundle.
+    """
+    return download_nse_bundle(date_obj_or_iso, types=(data_type,)).get(data_type)
 
 
 @app.route('/api/download-nse', methods=['POST'])
@@ -1916,13 +2433,12 @@ def download_nse_data():
         
         print(f"Downloading NSE data for {nse_date_formatted}...")
         
-        # Use helper for MCAP
-        mcap_df = download_nse_csv(date_obj, 'mcap')
+        # One archive download for both CSVs
+        bundle = download_nse_bundle(date_obj, types=('mcap', 'pr'), retain_zip=data.get('retain_zip'))
+        mcap_df = bundle.get('mcap')
         if mcap_df is None:
             return jsonify({'error': f'Failed to download or parse MCAP for {nse_date_formatted}'}), 404
-            
-        # Use helper for PR
-        pr_df = download_nse_csv(date_obj, 'pr')
+        pr_df = bundle.get('pr')
         
         # Persist to Mongo cache and symbol_daily
         put_cached_csv(date_iso, 'mcap', mcap_df, source='nse')
@@ -1952,6 +2468,28 @@ def download_nse_data():
         print(f"Error in download_nse_data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/trading-calendar/<date_iso>', methods=['DELETE'])
+def forget_trading_calendar_date(date_iso):
+    """
+    Un-learn a date: drops a learned/suspected holiday or an observed session so the
+    seed file (or the weekday rule) decides again, and clears its bhavcopy misses.
+    """
+    try:
+        day = datetime.strptime(date_iso, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'date must be YYYY-MM-DD'}), 400
+    forgotten = get_trading_calendar().forget(day)
+    for data_type in ('mcap', 'pr'):
+        get_miss_cache().preload([date_iso], data_type)
+        get_miss_cache().clear(date_iso, data_type)
+    return jsonify({
+        'success': True,
+        'date': date_iso,
+        'forgotten': forgotten,
+        'is_trading_day': get_trading_calendar().is_trading_day(day)
+    }), 200
+
+
 @app.route('/api/nse-dates', methods=['GET'])
 def get_nse_dates():
     """
@@ -1959,18 +2497,11 @@ def get_nse_dates():
     Returns list of dates in DD-Mon-YYYY format
     """
     try:
-        dates = []
         today = datetime.now()
         
-        # Generate dates for last 2 years (approximately 500+ trading days, excluding weekends)
-        # 2 years = ~730 days, ~500 trading days (excluding weekends/holidays)
+        # Last 2 years (~730 days, ~500 trading days); weekends/holidays come from the trading calendar
         start_date = today - timedelta(days=730)
-        
-        current = start_date
-        while current <= today:
-            # Removed weekend skip: Include Saturdays and Sundays as well
-            dates.append(current.strftime('%d-%b-%Y'))
-            current += timedelta(days=1)
+        dates = [d.strftime('%d-%b-%Y') for d in get_trading_calendar().trading_days(start_date, today)]
         
         # Reverse to show most recent first
         dates.reverse()
@@ -1993,6 +2524,7 @@ def download_nse_range():
         "start_date": "01-Dec-2025",  # Format: DD-Mon-YYYY
         "end_date": "05-Dec-2025",    # Format: DD-Mon-YYYY
         "refresh_mode": "missing_only" or "force"  # Optional, default missing_only
+        "retain_zip": true  # Optional, keep the raw PR.zip (default RETAIN_BHAV_ZIP)
     }
     Returns summary and entries (no sessions; files cached in Mongo).
     """
@@ -2002,6 +2534,7 @@ def download_nse_range():
         end_date_str = data.get('end_date', '')
         refresh_mode = data.get('refresh_mode', 'missing_only')  # missing_only | force
         parallel_workers = int(data.get('parallel_workers', 20) or 20)
+        retain_zip = data.get('retain_zip')  # None -> RETAIN_BHAV_ZIP
 
         if refresh_mode not in ['missing_only', 'force']:
             return jsonify({'error': 'Invalid refresh_mode. Use missing_only or force'}), 400
@@ -2019,14 +2552,9 @@ def download_nse_range():
         if start_date > end_date:
             return jsonify({'error': 'start_date cannot be after end_date'}), 400
         
-        # Generate list of trading days in range
-        current_date = start_date
-        trading_dates = []
-        
-        while current_date <= end_date:
-            # Removed weekend skip: Include Saturdays and Sundays as well
-            trading_dates.append(current_date)
-            current_date += timedelta(days=1)
+        # Generate list of trading days in range (weekends/holidays never have a bhavcopy)
+        trading_dates = get_trading_calendar().trading_days(start_date, end_date)
+        skipped_non_trading = (end_date.date() - start_date.date()).days + 1 - len(trading_dates)
         
         if not trading_dates:
             return jsonify({'error': 'No trading days found in the selected range'}), 400
@@ -2035,6 +2563,7 @@ def download_nse_range():
             'total_requested': len(trading_dates),
             'cached_count': 0,
             'fetched_count': 0,
+            'skipped_count': 0,
             'failed_count': 0,
             'entries': [],
             'errors': []
@@ -2051,8 +2580,17 @@ def download_nse_range():
             print(f"[download-range] Fast-checking cache metadata for {len(date_iso_list)} dates...")
             prefetched_mcap_meta = get_cached_csv_metadata_bulk(date_iso_list, 'mcap')
             prefetched_pr_meta = get_cached_csv_metadata_bulk(date_iso_list, 'pr')
+            # Known-missing dates (holidays, unpublished, recent failures) wait for their retry window
+            get_miss_cache().preload(date_iso_list, 'mcap')
+            get_miss_cache().preload(date_iso_list, 'pr')
+
+        def known_miss(date_iso, data_type, attempt):
+            # Retries inside this run ignore the window their own failure just opened
+            if refresh_mode == 'force' or attempt > 0:
+                return None
+            return get_miss_cache().lookup(date_iso, data_type)
 
-        def process_trade_date(index, trade_date):
+        def process_trade_date(index, trade_date, attempt=0):
             nse_date_formatted = trade_date.strftime('%d-%b-%Y')
             date_iso = _normalize_iso_date(trade_date)
 
@@ -2083,7 +2621,18 @@ def download_nse_range():
                 }
 
             # 3. SLOW PATH: Missing data or FORCE mode
-            # We need the actual dataframes for these cases
+            # We need the actual dataframes for these cases; MCAP and PR come out of
+            # one archive, so NSE is hit at most once per date
+            bundle = None
+
+            def nse_frame(data_type):
+                nonlocal bundle
+                if bundle is None:
+                    # force means fresh from NSE: a retained archive is the stale copy being replaced
+                    bundle = download_nse_bundle(trade_date, types=('mcap', 'pr'), retain_zip=retain_zip,
+                                                 use_retained=(refresh_mode != 'force'))
+                return bundle.get(data_type)
+
             try:
                 # MCAP Stage
                 mcap_df = None
@@ -2093,15 +2642,22 @@ def download_nse_range():
                 else:
                     # Actually fetch from NSE or full cache
                     mcap_data = get_cached_csv(date_iso, 'mcap') if refresh_mode != 'force' else None
-                    if not mcap_data:
-                        mcap_df = download_nse_csv(trade_date, 'mcap')
+                    mcap_miss = known_miss(date_iso, 'mcap', attempt) if not mcap_data else None
+                    if mcap_miss:
+                        result_entry['status'] = 'skipped'
+                        result_entry['skip_reason'] = mcap_miss.get('reason')
+                        result_entry['retry_after'] = mcap_miss['retry_after'].isoformat() if mcap_miss.get('retry_after') else None
+                    elif not mcap_data:
+                        mcap_df = nse_frame('mcap')
                         if mcap_df is not None:
                             put_cached_csv(date_iso, 'mcap', mcap_df)
+                        else:
+                            result_entry['reason'] = get_miss_cache().reason(date_iso, 'mcap')
                     else:
                         mcap_df = mcap_data['df']
                     
                     if mcap_df is not None:
-                        bulk_upsert_symbol_daily_from_df(mcap_df, date_iso, 'mcap', source='nse_download')
+                        bulk_upsert_symbol_daily_from_df(mcap_df, date_iso, 'mcap', source='nse_download', refresh_aggregates=False)
                         mcap_records = len(mcap_df)
                     else:
                         mcap_records = 0
@@ -2115,10 +2671,16 @@ def download_nse_range():
                     pr_records = pr_meta.get('records', 0)
                 else:
                     pr_data = get_cached_csv(date_iso, 'pr') if refresh_mode != 'force' else None
-                    if not pr_data:
-                        pr_df = download_nse_csv(trade_date, 'pr')
+                    pr_miss = known_miss(date_iso, 'pr', attempt) if not pr_data else None
+                    if pr_miss:
+                        result_entry['pr_status'] = 'skipped'
+                        result_entry['pr_skip_reason'] = pr_miss.get('reason')
+                    elif not pr_data:
+                        pr_df = nse_frame('pr')
                         if pr_df is not None:
                             put_cached_csv(date_iso, 'pr', pr_df)
+                        else:
+                            result_entry['pr_reason'] = get_miss_cache().reason(date_iso, 'pr')
                     else:
                         pr_df = pr_data['df']
                     
@@ -2133,7 +2695,8 @@ def download_nse_range():
                             if mcap_data:
                                 symbol_name_map = dict(zip(mcap_data['df']['Security Name'], mcap_data['df']['Symbol']))
                                 
-                        bulk_upsert_symbol_daily_from_df(pr_df, date_iso, 'pr', source='nse_download', symbol_name_map=symbol_name_map)
+                        bulk_upsert_symbol_daily_from_df(pr_df, date_iso, 'pr', source='nse_download', symbol_name_map=symbol_name_map,
+                                                         refresh_aggregates=False)
                         pr_records = len(pr_df)
                     else:
                         pr_records = 0
@@ -2141,13 +2704,16 @@ def download_nse_range():
                 result_entry['pr_records'] = pr_records
 
                 is_cached = (result_entry['status'] == 'cached' and result_entry['pr_status'] == 'cached')
+                is_skipped = result_entry['status'] == 'skipped'
                 
                 return index, {
                     'entries': [result_entry],
                     'errors': [],
                     'cached_count': 1 if is_cached else 0,
-                    'fetched_count': 0 if is_cached else 1,
-                    'failed_count': 0
+                    'fetched_count': 0 if (is_cached or is_skipped) else 1,
+                    'skipped_count': 1 if is_skipped else 0,
+                    'failed_count': 0,
+                    'retryable': bool({result_entry.get('reason'), result_entry.get('pr_reason')} & BHAV_RETRYABLE_REASONS)
                 }
 
             except Exception as e:
@@ -2160,63 +2726,87 @@ def download_nse_range():
                     'failed_count': 1
                 }
 
-        futures = {}
-        with ThreadPoolExecutor(max_workers=parallel_workers) as executor:
-            for idx, trade_date in enumerate(trading_dates):
-                futures[executor.submit(process_trade_date, idx, trade_date)] = idx
+        # Network/HTTP failures are re-queued with jittered backoff; pacing against NSE
+        # itself comes from the shared adaptive limiter inside the NSE client
+        scheduler = RetryScheduler(workers=parallel_workers, max_attempts=int(data.get('max_attempts', 3) or 3))
+        outcomes = scheduler.run(
+            list(enumerate(trading_dates)),
+            lambda item, attempt: process_trade_date(item[0], item[1], attempt),
+            should_retry=lambda out: not isinstance(out, Exception) and out[1].get('retryable', False)
+        )
 
-            results_by_index = {}
-            for future in as_completed(futures):
-                idx = futures[future]
-                try:
-                    idx, res = future.result()
-                    results_by_index[idx] = res
-                except Exception as exc:
-                    results_by_index[idx] = {
-                        'entries': [],
-                        'errors': [{
-                            'date': trading_dates[idx].strftime('%d-%b-%Y'),
-                            'error': f'Worker error: {exc}'
-                        }],
-                        'cached_count': 0,
-                        'fetched_count': 0,
-                        'failed_count': 1
-                    }
+        # Derived aggregate fields once for the whole range, not once per downloaded day
+        if aggregate_engine is not None:
+            try:
+                aggregate_engine.refresh_pending()
+                get_reference_data().invalidate('aggregates')
+            except Exception as exc:
+                print(f"⚠️ Aggregate refresh after range download failed: {exc}")
 
-        for idx in range(len(trading_dates)):
+        results_by_index = {}
+        for idx, outcome in enumerate(outcomes):
+            if not isinstance(outcome, Exception):
+                results_by_index[idx] = outcome[1]
+            else:
+                results_by_index[idx] = {
+                    'entries': [],
+                    'errors': [{
+                        'date': trading_dates[idx].strftime('%d-%b-%Y'),
+                        'error': f'Worker error: {outcome}'
+                    }],
+                    'cached_count': 0,
+                    'fetched_count': 0,
+                    'failed_count': 1
+                }
+
+        for idx in range(len(trading_dates)):
             res = results_by_index.get(idx, None)
             if res is None:
                 continue
             downloads_summary['cached_count'] += res['cached_count']
             downloads_summary['fetched_count'] += res['fetched_count']
+            downloads_summary['skipped_count'] += res.get('skipped_count', 0)
             downloads_summary['failed_count'] += res['failed_count']
             downloads_summary['entries'].extend(res['entries'])
             downloads_summary['errors'].extend(res['errors'])
 
-        # Categorize errors for better user feedback
-        error_categories = {
-            'holidays': [],
-            'network': [],
-            'other': []
-        }
-        
+        # Categorize failures by the reason recorded at fetch time, MCAP and PR separately
+        # ({reason: {date: [types]}}); a date listed once per reason, tagged when only one type missed
+        by_reason = {}
+        for entry in downloads_summary['entries']:
+            for data_type, field in (('MCAP', 'reason'), ('PR', 'pr_reason')):
+                reason = entry.get(field)
+                if reason:
+                    by_reason.setdefault(reason, {}).setdefault(entry['date'], []).append(data_type)
+
+        other_errors = []
         for error in downloads_summary['errors']:
             error_msg = error.get('error', '').lower()
             if '404' in error_msg or 'no data available' in error_msg or 'holiday' in error_msg:
-                error_categories['holidays'].append(error['date'])
+                by_reason.setdefault(BHAV_NO_DATA, {}).setdefault(error['date'], []).extend(['MCAP', 'PR'])
             elif 'connection' in error_msg or 'resolve' in error_msg or 'getaddrinfo' in error_msg or 'timeout' in error_msg:
-                error_categories['network'].append(error['date'])
+                by_reason.setdefault(BHAV_NETWORK_ERROR, {}).setdefault(error['date'], []).extend(['MCAP', 'PR'])
             else:
-                error_categories['other'].append(error)
-        
-        # Build helpful error summary
+                other_errors.append(error)
+
+        reason_labels = {
+            BHAV_HOLIDAY: "NSE holidays",
+            BHAV_NO_DATA: "No data published (possibly an unlisted holiday; retried in a few days)",
+            BHAV_NOT_PUBLISHED: "Not published yet (retried shortly)",
+            BHAV_MISSING_FILE: "File missing from the NSE archive",
+        }
         error_summary = []
-        if error_categories['holidays']:
-            error_summary.append(f"No data available (likely holidays): {', '.join(error_categories['holidays'])}")
-        if error_categories['network']:
-            error_summary.append(f"Network/connection errors: {', '.join(error_categories['network'])} - Try again later or check internet connection")
-        if error_categories['other']:
-            error_summary.append(f"{len(error_categories['other'])} other errors - check details below")
+        network_dates = []
+        for reason, dates in by_reason.items():
+            labelled = [d if len(set(types)) > 1 else f"{d} ({types[0]})" for d, types in sorted(dates.items())]
+            if reason in BHAV_RETRYABLE_REASONS:
+                network_dates.extend(labelled)
+            else:
+                error_summary.append(f"{reason_labels.get(reason, reason)}: {', '.join(labelled)}")
+        if network_dates:
+            error_summary.append(f"Network/connection errors: {', '.join(network_dates)} - Try again later or check internet connection")
+        if other_errors:
+            error_summary.append(f"{len(other_errors)} other errors - check details below")
 
         return jsonify({
             'success': True,
@@ -2224,9 +2814,12 @@ def download_nse_range():
                 'total_requested': downloads_summary['total_requested'],
                 'cached': downloads_summary['cached_count'],
                 'fetched': downloads_summary['fetched_count'],
+                'skipped_known_missing': downloads_summary['skipped_count'],
+                'retries': scheduler.stats['retries'],
                 'failed': downloads_summary['failed_count'],
                 'refresh_mode': refresh_mode,
                 'parallel_workers': parallel_workers,
+                'skipped_non_trading': skipped_non_trading,
                 'error_summary': error_summary
             },
             'entries': downloads_summary['entries'],
@@ -2238,6 +2831,159 @@ def download_nse_range():
         return jsonify({'error': str(e)}), 500
 
 
+def resolve_dashboard_symbols(provided_symbols, total_limit=1100):
+    """
+    Symbols for the symbol dashboard: the request's list, else the top
+    symbols by average market cap, else nosubject/Market_Cap.xlsx.
+    Returns an ordered, de-duplicated list (empty when nothing was found).
+    """
+    symbols_to_process = list(provided_symbols) if provided_symbols else []
+
+    if not symbols_to_process:
+        if symbol_aggregates_collection is not None:
+            # Reference table is already ranked by average MCAP and excludes 'PERMITTED'
+            symbols_to_process = get_reference_data().top_mcap_symbols(total_limit)
+
+    # GLOBAL FILTER: Ensure 'PERMITTED' is removed from any provided list as well
+    if symbols_to_process:
+        symbols_to_process = [s for s in symbols_to_process if str(s).strip().upper() != 'PERMITTED']
+
+    if not symbols_to_process:
+        market_cap_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'nosubject', 'Market_Cap.xlsx')
+        if os.path.exists(market_cap_path):
+            df = pd.read_excel(market_cap_path)
+            sym_col = next((c for c in df.columns if str(c).strip().lower() in ['symbol', 'symbols']), None)
+            if sym_col:
+                symbols_to_process = df[sym_col].astype(str).tolist()[:total_limit]
+
+    if not symbols_to_process:
+        return []
+
+    final_symbols = list(dict.fromkeys(symbols_to_process))[:total_limit]
+    for rs in ['GANECOS', 'ALLCARGO']:
+        if rs not in final_symbols: final_symbols.append(rs)
+
+    if nifty_indices_collection is not None:
+        known = get_reference_data().indices(['GANECOS', 'ALLCARGO'])
+        for _sym in ['GANECOS', 'ALLCARGO']:
+            if (known.get(_sym) or {}).get('primary_index') == 'NIFTY MICROCAP 250':
+                continue
+            nifty_indices_collection.update_one({'symbol': _sym}, {'$set': {'symbol': _sym, 'indices': ['NIFTY MICROCAP 250'], 'primary_index': 'NIFTY MICROCAP 250', 'last_updated': datetime.now()}}, upsert=True)
+            get_reference_data().invalidate('indices')
+
+    return final_symbols
+
+
+def load_dashboard_lookups(symbols, as_on):
+    """
+    Load everything the dashboard joins onto quote rows for these symbols:
+    PR/MCAP aggregates, Nifty index membership and today's stored metrics.
+    Served from the in-memory reference tables (no Mongo round trip per batch).
+    Returns (symbol_pr_data, symbol_mcap_data, index_mapping, metrics_cache).
+    """
+    symbol_pr_data, symbol_mcap_data, index_mapping, metrics_cache = {}, {}, {}, {}
+    reference = get_reference_data()
+
+    if symbol_aggregates_collection is not None:
+        for sym, docs_by_type in reference.aggregates(symbols).items():
+            for dtype, doc in docs_by_type.items():
+                if dtype == 'pr':
+                    # Robust key check for legacy/new naming
+                    nz_days = doc.get('non_zero_days') if doc.get('non_zero_days') is not None else doc.get('Non Zero Days', 0)
+                    symbol_pr_data[sym] = {
+                        'days_with_data': doc.get('days_with_data', 0), 
+                        'non_zero_days': nz_days,
+                        'total_possible_days': doc.get('total_possible_days', 0),
+                        'avg_pr': doc.get('average')
+                    }
+                    if sym not in symbol_mcap_data: symbol_mcap_data[sym] = {}
+                    symbol_mcap_data[sym]['total_traded_value'] = doc.get('average')
+                    # Propagate consistency fields to the main map used by fetcher
+                    symbol_mcap_data[sym]['non_zero_days'] = nz_days
+                    symbol_mcap_data[sym]['total_possible_days'] = doc.get('total_possible_days', 0)
+                elif dtype == 'mcap':
+                    if sym not in symbol_mcap_data: symbol_mcap_data[sym] = {}
+                    symbol_mcap_data[sym]['avg_mcap'] = doc.get('average')
+                    symbol_mcap_data[sym]['total_possible_days'] = doc.get('total_possible_days', 0)
+                    # Robust key check for legacy/new naming
+                    symbol_mcap_data[sym]['non_zero_days'] = doc.get('non_zero_days') if doc.get('non_zero_days') is not None else doc.get('Non Zero Days', 0)
+
+    if nifty_indices_collection is not None:
+        # Check if the collection has data; if not, auto-fetch from Nifty CSV files
+        if not reference.indices():
+            print("[nse-symbol-dashboard] nifty_indices_collection is EMPTY. Auto-fetching from Nifty CSV files...")
+            try:
+                fetcher_tmp = SymbolMetricsFetcher()
+                auto_index_map = fetcher_tmp.fetch_nifty_indices()
+                if auto_index_map:
+                    from pymongo import UpdateOne as _UO
+                    _ops = []
+                    _ts = datetime.now()
+                    for _sym, _idxs in auto_index_map.items():
+                        _sym = str(_sym).strip().upper()
+                        if _sym == 'PERMITTED' or not _idxs:
+                            continue
+                        _filtered = [i for i in _idxs if str(i).strip().upper() != 'PERMITTED']
+                        if not _filtered:
+                            continue
+                        _ops.append(_UO(
+                            {'symbol': _sym},
+                            {'$set': {'symbol': _sym, 'indices': _filtered, 'primary_index': _filtered[0], 'last_updated': _ts}},
+                            upsert=True
+                        ))
+                    if _ops:
+                        nifty_indices_collection.bulk_write(_ops, ordered=False)
+                        reference.invalidate('indices')
+                        print(f"[nse-symbol-dashboard] Auto-stored {len(_ops)} symbols to nifty_indices_collection")
+            except Exception as _ae:
+                print(f"[nse-symbol-dashboard] Auto-fetch indices failed: {_ae}")
+
+        for sym, doc in reference.indices(symbols).items():
+            if doc.get('indices'):
+                index_mapping[sym] = doc['indices']
+                # Inject live data from MongoDB Constituents (if available)
+                if sym not in symbol_mcap_data: symbol_mcap_data[sym] = {}
+                symbol_mcap_data[sym]['live_mc'] = doc.get('live_mc')
+                symbol_mcap_data[sym]['live_ff'] = doc.get('live_ff')
+
+    if symbol_metrics_collection is not None:
+        metrics_cache = reference.metrics_for(as_on, symbols)
+
+    return symbol_pr_data, symbol_mcap_data, index_mapping, metrics_cache
+
+
+def enrich_dashboard_rows(rows, symbols, index_mapping, symbol_pr_data, symbol_mcap_data):
+    """Inject DB index membership and aggregate day counts into dashboard rows (in place)."""
+    index_map_detailed = primary_index_map_from_db(symbols)
+    for row in rows:
+        row.pop('_id', None)
+        sym = str(row.get('symbol') or '').strip().upper()
+
+        # Inject index from DB mapping if available
+        if sym in index_mapping:
+            indices_list = [idx for idx in index_mapping[sym] if str(idx).strip().upper() != 'PERMITTED']
+            row['index'] = indices_list[0] if indices_list else row.get('index')
+            row['indexList'] = indices_list
+
+        if sym in index_map_detailed: 
+            row['primary_index'] = index_map_detailed[sym]
+        elif sym in index_mapping:
+            indices_list = [idx for idx in index_mapping[sym] if str(idx).strip().upper() != 'PERMITTED']
+            row['primary_index'] = indices_list[0] if indices_list else None
+        else:
+            row['primary_index'] = row.get('primary_index')  # Keep existing value, don't clear
+
+        # Inject metrics from DB aggregates
+        if sym in symbol_pr_data:
+            row['days_with_data'] = symbol_pr_data[sym].get('days_with_data', 0)
+            row['non_zero_days'] = symbol_pr_data[sym].get('non_zero_days', 0)
+            row['total_possible_days'] = symbol_pr_data[sym].get('total_possible_days', 0)
+        elif sym in symbol_mcap_data:
+            row['non_zero_days'] = symbol_mcap_data[sym].get('non_zero_days', 0)
+            row['total_possible_days'] = symbol_mcap_data[sym].get('total_possible_days', 0)
+    return rows
+
+
 @app.route('/api/nse-symbol-dashboard', methods=['POST'])
 def nse_symbol_dashboard():
     """
@@ -2261,41 +3007,10 @@ def nse_symbol_dashboard():
         TOTAL_SYMBOLS = 1100
         BATCH_SIZE = 100
 
-        symbols_to_process = provided_symbols[:] if provided_symbols else []
-        
-        if not symbols_to_process:
-            if symbol_aggregates_collection is not None:
-                db_symbols = list(symbol_aggregates_collection.find(
-                    {'type': 'mcap'},
-                    {'symbol': 1, 'average': 1}
-                ).sort([('average', -1), ('symbol', 1)]).limit(TOTAL_SYMBOLS))
-                if db_symbols:
-                    # STRICT FILTER: Never include 'PERMITTED' 
-                    symbols_to_process = [s['symbol'] for s in db_symbols if str(s.get('symbol')).strip().upper() != 'PERMITTED']
-        
-        # GLOBAL FILTER: Ensure 'PERMITTED' is removed from any provided list as well
-        if symbols_to_process:
-            symbols_to_process = [s for s in symbols_to_process if str(s).strip().upper() != 'PERMITTED']
-
-        if not symbols_to_process:
-            market_cap_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'nosubject', 'Market_Cap.xlsx')
-            if os.path.exists(market_cap_path):
-                df = pd.read_excel(market_cap_path)
-                sym_col = next((c for c in df.columns if str(c).strip().lower() in ['symbol', 'symbols']), None)
-                if sym_col:
-                    symbols_to_process = df[sym_col].astype(str).tolist()[:TOTAL_SYMBOLS]
-
-        if not symbols_to_process:
+        final_symbols = resolve_dashboard_symbols(provided_symbols, TOTAL_SYMBOLS)
+        if not final_symbols:
             return jsonify({'error': 'No symbols found'}), 400
 
-        final_symbols = list(dict.fromkeys(symbols_to_process))[:TOTAL_SYMBOLS]
-        for rs in ['GANECOS', 'ALLCARGO']:
-            if rs not in final_symbols: final_symbols.append(rs)
-
-        if nifty_indices_collection is not None:
-            for _sym in ['GANECOS', 'ALLCARGO']:
-                nifty_indices_collection.update_one({'symbol': _sym}, {'$set': {'symbol': _sym, 'indices': ['NIFTY MICROCAP 250'], 'primary_index': 'NIFTY MICROCAP 250', 'last_updated': datetime.now()}}, upsert=True)
-
         total_count = len(final_symbols)
         if batch_index is None:
             batch_symbols = final_symbols
@@ -2308,78 +3023,7 @@ def nse_symbol_dashboard():
                 return jsonify({'success': True, 'complete': True, 'rows': []}), 200
             batch_symbols = symbol_batches[batch_idx]
 
-        symbol_pr_data, symbol_mcap_data, index_mapping, metrics_cache = {}, {}, {}, {}
-
-        if symbol_aggregates_collection is not None:
-            for doc in symbol_aggregates_collection.find({'symbol': {'$in': batch_symbols}}):
-                sym = str(doc.get('symbol') or '').strip().upper()
-                dtype = doc.get('type')
-                if not sym: continue
-                
-                if dtype == 'pr':
-                    # Robust key check for legacy/new naming
-                    nz_days = doc.get('non_zero_days') if doc.get('non_zero_days') is not None else doc.get('Non Zero Days', 0)
-                    symbol_pr_data[sym] = {
-                        'days_with_data': doc.get('days_with_data', 0), 
-                        'non_zero_days': nz_days,
-                        'total_possible_days': doc.get('total_possible_days', 0),
-                        'avg_pr': doc.get('average')
-                    }
-                    if sym not in symbol_mcap_data: symbol_mcap_data[sym] = {}
-                    symbol_mcap_data[sym]['total_traded_value'] = doc.get('average')
-                    # Propagate consistency fields to the main map used by fetcher
-                    symbol_mcap_data[sym]['non_zero_days'] = nz_days
-                    symbol_mcap_data[sym]['total_possible_days'] = doc.get('total_possible_days', 0)
-                elif dtype == 'mcap':
-                    if sym not in symbol_mcap_data: symbol_mcap_data[sym] = {}
-                    symbol_mcap_data[sym]['avg_mcap'] = doc.get('average')
-                    symbol_mcap_data[sym]['total_possible_days'] = doc.get('total_possible_days', 0)
-                    # Robust key check for legacy/new naming
-                    symbol_mcap_data[sym]['non_zero_days'] = doc.get('non_zero_days') if doc.get('non_zero_days') is not None else doc.get('Non Zero Days', 0)
-
-        if nifty_indices_collection is not None:
-            # Check if the collection has data; if not, auto-fetch from Nifty CSV files
-            indices_count = nifty_indices_collection.count_documents({})
-            if indices_count == 0:
-                print("[nse-symbol-dashboard] nifty_indices_collection is EMPTY. Auto-fetching from Nifty CSV files...")
-                try:
-                    fetcher_tmp = SymbolMetricsFetcher()
-                    auto_index_map = fetcher_tmp.fetch_nifty_indices()
-                    if auto_index_map:
-                        from pymongo import UpdateOne as _UO
-                        _ops = []
-                        _ts = datetime.now()
-                        for _sym, _idxs in auto_index_map.items():
-                            _sym = str(_sym).strip().upper()
-                            if _sym == 'PERMITTED' or not _idxs:
-                                continue
-                            _filtered = [i for i in _idxs if str(i).strip().upper() != 'PERMITTED']
-                            if not _filtered:
-                                continue
-                            _ops.append(_UO(
-                                {'symbol': _sym},
-                                {'$set': {'symbol': _sym, 'indices': _filtered, 'primary_index': _filtered[0], 'last_updated': _ts}},
-                                upsert=True
-                            ))
-                        if _ops:
-                            nifty_indices_collection.bulk_write(_ops, ordered=False)
-                            print(f"[nse-symbol-dashboard] Auto-stored {len(_ops)} symbols to nifty_indices_collection")
-                except Exception as _ae:
-                    print(f"[nse-symbol-dashboard] Auto-fetch indices failed: {_ae}")
-
-            for doc in nifty_indices_collection.find({'symbol': {'$in': batch_symbols}}):
-                sym = str(doc.get('symbol') or '').strip().upper()
-                if sym and doc.get('indices'):
-                    index_mapping[sym] = doc['indices']
-                    # Inject live data from MongoDB Constituents (if available)
-                    if sym not in symbol_mcap_data: symbol_mcap_data[sym] = {}
-                    symbol_mcap_data[sym]['live_mc'] = doc.get('live_mc')
-                    symbol_mcap_data[sym]['live_ff'] = doc.get('live_ff')
-
-        if symbol_metrics_collection is not None:
-            for doc in symbol_metrics_collection.find({'as_on': as_on, 'symbol': {'$in': batch_symbols}}):
-                sym = str(doc.get('symbol') or '').strip().upper()
-                if sym: metrics_cache[sym] = doc
+        symbol_pr_data, symbol_mcap_data, index_mapping, metrics_cache = load_dashboard_lookups(batch_symbols, as_on)
 
         fetcher = SymbolMetricsFetcher()
         # CRITICAL FIX: Only pass external_index_mapping if it is non-empty.
@@ -2390,39 +3034,14 @@ def nse_symbol_dashboard():
             batch_symbols, as_of=as_on, parallel=True, max_workers=50, 
             chunk_size=len(batch_symbols),  # Single batch = all symbols processed in parallel
             symbol_pr_data=symbol_pr_data, symbol_mcap_data=symbol_mcap_data,
-            external_index_mapping=effective_index_mapping, external_metrics_cache=metrics_cache
+            external_index_mapping=effective_index_mapping, external_metrics_cache=metrics_cache,
+            fetch_backend=data.get('fetch_backend') or NSE_FETCH_BACKEND
         )
         
         rows = result.get('rows', [])
         errors = result.get('errors', [])
 
-        index_map_detailed = primary_index_map_from_db(batch_symbols)
-        for row in rows:
-            row.pop('_id', None)
-            sym = str(row.get('symbol') or '').strip().upper()
-            
-            # Inject index from DB mapping if available
-            if sym in index_mapping:
-                indices_list = [idx for idx in index_mapping[sym] if str(idx).strip().upper() != 'PERMITTED']
-                row['index'] = indices_list[0] if indices_list else row.get('index')
-                row['indexList'] = indices_list
-            
-            if sym in index_map_detailed: 
-                row['primary_index'] = index_map_detailed[sym]
-            elif sym in index_mapping:
-                indices_list = [idx for idx in index_mapping[sym] if str(idx).strip().upper() != 'PERMITTED']
-                row['primary_index'] = indices_list[0] if indices_list else None
-            else:
-                row['primary_index'] = row.get('primary_index')  # Keep existing value, don't clear
-            
-            # Inject metrics from DB aggregates
-            if sym in symbol_pr_data:
-                row['days_with_data'] = symbol_pr_data[sym].get('days_with_data', 0)
-                row['non_zero_days'] = symbol_pr_data[sym].get('non_zero_days', 0)
-                row['total_possible_days'] = symbol_pr_data[sym].get('total_possible_days', 0)
-            elif sym in symbol_mcap_data:
-                row['non_zero_days'] = symbol_mcap_data[sym].get('non_zero_days', 0)
-                row['total_possible_days'] = symbol_mcap_data[sym].get('total_possible_days', 0)
+        enrich_dashboard_rows(rows, batch_symbols, index_mapping, symbol_pr_data, symbol_mcap_data)
         
         # High-performance bulk upsert
         bulk_upsert_symbol_metrics(rows, source='symbol_dashboard')
@@ -2445,6 +3064,108 @@ def nse_symbol_dashboard():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/nse-symbol-dashboard/stream', methods=['POST'])
+def nse_symbol_dashboard_stream():
+    """
+    Build the whole symbol dashboard in one streaming response instead of
+    client-driven batches. Lookup data is loaded once for every symbol and a
+    single fetcher is reused; rows and progress are flushed as each chunk of
+    quotes completes. Output is NDJSON, or Server-Sent Events when the client
+    sends `Accept: text/event-stream` (or `format: "sse"`). Heartbeats keep
+    the Render proxy from closing an idle connection.
+    """
+    data = request.get_json(silent=True) or {}
+    as_on = datetime.now().strftime('%Y-%m-%d')
+    chunk_size = max(1, int(data.get('chunk_size', 50) or 50))
+    fetch_backend = data.get('fetch_backend') or NSE_FETCH_BACKEND
+    use_sse = data.get('format') == 'sse' or 'text/event-stream' in (request.headers.get('Accept') or '')
+    heartbeat_seconds = float(os.getenv('DASHBOARD_STREAM_HEARTBEAT', 10))
+
+    final_symbols = resolve_dashboard_symbols(data.get('symbols') or [], 1100)
+    if not final_symbols:
+        return jsonify({'error': 'No symbols found'}), 400
+
+    events = queue.Queue()
+    cancelled = threading.Event()
+
+    def _produce():
+        started = time.perf_counter()
+        total = len(final_symbols)
+        processed, row_count, error_count = 0, 0, 0
+        try:
+            events.put(('progress', {'stage': 'lookups', 'processed': 0, 'total': total, 'percentage': 0}))
+            symbol_pr_data, symbol_mcap_data, index_mapping, metrics_cache = load_dashboard_lookups(final_symbols, as_on)
+            fetcher = SymbolMetricsFetcher()
+            effective_index_mapping = index_mapping if index_mapping else None
+
+            for i in range(0, total, chunk_size):
+                if cancelled.is_set():
+                    print("[symbol-dashboard-stream] Client disconnected - stopping")
+                    return
+                chunk = final_symbols[i:i + chunk_size]
+                result = fetcher.build_dashboard(
+                    chunk, as_of=as_on, parallel=True, max_workers=50,
+                    chunk_size=len(chunk),
+                    symbol_pr_data=symbol_pr_data, symbol_mcap_data=symbol_mcap_data,
+                    external_index_mapping=effective_index_mapping, external_metrics_cache=metrics_cache,
+                    fetch_backend=fetch_backend
+                )
+                rows = result.get('rows', [])
+                errors = result.get('errors', [])
+                enrich_dashboard_rows(rows, chunk, index_mapping, symbol_pr_data, symbol_mcap_data)
+                bulk_upsert_symbol_metrics(rows, source='symbol_dashboard')
+
+                processed += len(chunk)
+                row_count += len(rows)
+                error_count += len(errors)
+                events.put(('rows', {'rows': rows, 'errors': errors, 'count': len(rows)}))
+                events.put(('progress', {
+                    'stage': 'quotes', 'processed': processed, 'total': total,
+                    'percentage': int(processed * 100 / total)
+                }))
+
+            events.put(('done', {
+                'success': True, 'count': row_count, 'error_count': error_count,
+                'total_symbols': total, 'complete': True, 'percentage': 100,
+                'elapsed_seconds': round(time.perf_counter() - started, 2),
+                'message': f'Dashboard complete: {row_count}/{total} symbols'
+            }))
+        except Exception as exc:
+            import traceback
+            traceback.print_exc()
+            events.put(('error', {'error': str(exc)}))
+        finally:
+            events.put(None)
+
+    def _encode(event, payload):
+        payload = convert_nan_to_none(payload)
+        if use_sse:
+            return f"event: {event}\ndata: {json.dumps(payload, cls=NumpyEncoder, default=str)}\n\n"
+        return json.dumps({'event': event, 'data': payload}, cls=NumpyEncoder, default=str) + "\n"
+
+    def _generate():
+        try:
+            while True:
+                try:
+                    item = events.get(timeout=heartbeat_seconds)
+                except queue.Empty:
+                    yield ": heartbeat\n\n" if use_sse else '{"event": "heartbeat"}\n'
+                    continue
+                if item is None:
+                    break
+                yield _encode(*item)
+        finally:
+            cancelled.set()
+
+    threading.Thread(target=_produce, name='symbol-dashboard-stream', daemon=True).start()
+    headers = {
+        'Cache-Control': 'no-cache, no-store',
+        'X-Accel-Buffering': 'no'  # disable proxy buffering so chunks flush immediately
+    }
+    mimetype = 'text/event-stream' if use_sse else 'application/x-ndjson'
+    return Response(_generate(), mimetype=mimetype, headers=headers)
+
+
 def process_symbol_batch(symbols, as_on, max_workers, timeout, symbol_pr_data=None, symbol_mcap_data=None):
     """Process a batch of symbols with 10 workers for parallel processing."""
     fetcher = SymbolMetricsFetcher()
@@ -2471,7 +3192,9 @@ def process_symbol_batch(symbols, as_on, max_workers, timeout, symbol_pr_data=No
             symbol_mcap_data=batch_mcap_data,
             max_time_seconds=timeout,
             fetch_indices_from_csv=False,
-            nifty_indices_collection=nifty_indices_collection
+            external_index_mapping={
+                sym: doc['indices'] for sym, doc in get_reference_data().indices(symbols).items() if doc.get('indices')
+            } if nifty_indices_collection is not None else None
         )
         return result.get('rows', []), result.get('errors', [])
     except Exception as exc:
@@ -2480,7 +3203,7 @@ def process_symbol_batch(symbols, as_on, max_workers, timeout, symbol_pr_data=No
 
 @app.route('/api/nse-symbol-dashboard/download', methods=['GET'])
 def download_symbol_dashboard_file():
-    if excel_results_collection is None:
+    if excel_results_collection is None and artifact_store is None:
         return jsonify({'error': 'Database not connected'}), 500
 
     file_id = request.args.get('id')
@@ -2488,18 +3211,29 @@ def download_symbol_dashboard_file():
         return jsonify({'error': 'Missing id parameter'}), 400
 
     try:
-        oid = ObjectId(file_id)
-    except Exception:
-        return jsonify({'error': 'Invalid file id'}), 400
+        doc = None
+        if excel_results_collection is not None:
+            try:
+                oid = ObjectId(file_id)
+            except Exception:
+                return jsonify({'error': 'Invalid file id'}), 400
+            doc = excel_results_collection.find_one({'_id': oid})
+            if not doc:
+                return jsonify({'error': 'File not found'}), 404
+        else:
+            doc = {'artifact_id': file_id}
 
-    try:
-        doc = excel_results_collection.find_one({'_id': oid})
-        if not doc:
-            return jsonify({'error': 'File not found'}), 404
+        mimetype = doc.get('file_type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        if doc.get('artifact_id'):
+            try:
+                return send_artifact(doc['artifact_id'], filename=doc.get('filename'), mimetype=mimetype)
+            except ArtifactNotFound:
+                return jsonify({'error': 'File expired'}), 410
 
+        # Legacy rows stored the workbook inline
         return send_file(
             BytesIO(doc['file_data']),
-            mimetype=doc.get('file_type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+            mimetype=mimetype,
             as_attachment=True,
             download_name=doc.get('filename', 'Symbol_Dashboard.xlsx')
         )
@@ -2559,6 +3293,396 @@ def nse_symbol_dashboard_save_excel():
         return jsonify({'error': str(e)}), 500
 
 
+def parse_consolidation_request(payload):
+    """
+    Validate a consolidate-saved payload.
+    Returns (params, None) on success or (None, error_message) for a 400 response.
+    """
+    date_str = payload.get('date')
+    start_date_str = payload.get('start_date')
+    end_date_str = payload.get('end_date')
+    file_type = payload.get('file_type', 'both')
+    output_format = str(payload.get('output_format') or 'xlsx').lower()
+
+    if file_type not in ['mcap', 'pr', 'both']:
+        return None, 'Invalid file_type (mcap, pr, or both)'
+    format_error = validate_output_format(output_format)
+    if format_error:
+        return None, format_error
+
+    # Build date list
+    date_iso_list = []
+    try:
+        if date_str:
+            date_dt = date_parser.parse(date_str)
+            date_iso_list = [date_dt.strftime('%Y-%m-%d')]
+        elif start_date_str and end_date_str:
+            start_dt = date_parser.parse(start_date_str)
+            end_dt = date_parser.parse(end_date_str)
+            if start_dt > end_dt:
+                return None, 'start_date cannot be after end_date'
+            date_iso_list = get_trading_calendar().trading_days_iso(start_dt, end_dt)
+        else:
+            return None, 'Provide either date or start_date/end_date'
+    except Exception:
+        return None, 'Invalid date format. Use DD-Mon-YYYY (e.g., 03-Dec-2025)'
+
+    return {
+        'date_iso_list': date_iso_list,
+        'file_type': file_type,
+        'output_format': output_format,
+        'use_cache': payload.get('use_cache', True),
+        'fast_mode': payload.get('fast_mode', False),
+        'skip_daily': payload.get('skip_daily', True),
+        'allow_missing': payload.get('allow_missing', True),
+        'optimize_memory': payload.get('optimize_memory', True),
+        'max_records_per_batch': payload.get('max_records_per_batch', 5000)
+    }, None
+
+
+def consolidation_cache_key(params):
+    """
+    Export cache key for validated params, or None when caching does not apply.
+    The key covers only parameters that change the output plus each requested
+    date's bhavcache version (stored_at/records). PR exports also hash the MCAP
+    name map and the PR alias table they resolve names through, so a changed
+    alias or company name misses instead of serving stale symbols. Persisting
+    runs (fast_mode off) use it too, through cached_export_for().
+    """
+    if export_cache is None or not params.get('use_cache', True):
+        return None
+    date_iso_list = params['date_iso_list']
+    types = ['mcap', 'pr'] if params['file_type'] == 'both' else [params['file_type']]
+    fingerprint = {}
+    for data_type in types:
+        meta = get_cached_csv_metadata_bulk(date_iso_list, data_type)
+        fingerprint[data_type] = sorted((d, m.get('stored_at'), m.get('records')) for d, m in meta.items())
+    if 'pr' in types:
+        name_map = get_reference_data().name_to_symbol() if symbol_aggregates_collection is not None else {}
+        fingerprint['pr_name_map'] = export_cache.mapping_fingerprint(name_map)
+        fingerprint['pr_aliases'] = export_cache.mapping_fingerprint(get_alias_table().mapping())
+    return export_cache.make_key({
+        'dates': date_iso_list,
+        'file_type': params['file_type'],
+        'output_format': params.get('output_format', 'xlsx'),
+        'allow_missing': bool(params.get('allow_missing', True))
+    }, fingerprint)
+
+
+def cached_export_for(params, cache_key, log_fn=None):
+    """
+    Export cache entry for cache_key, or None. A hit on a persisting run (fast_mode
+    off) first moves the incremental aggregates to the requested window; types
+    whose window is already there are left alone (the key pins the data version
+    and downloads fold into the window as they land). Runs that must rewrite
+    symbol_daily (skip_daily off) or can't persist without the consolidated frame
+    (no aggregate engine) are treated as misses.
+    """
+    if not cache_key:
+        return None
+    if not params['fast_mode'] and (aggregate_engine is None or not params['skip_daily']):
+        return None
+    cached = export_cache.get(cache_key)
+    if not cached or params['fast_mode']:
+        return cached
+    date_iso_list = params['date_iso_list']
+    start_iso, end_iso = min(date_iso_list), max(date_iso_list)
+    types = ['mcap', 'pr'] if params['file_type'] == 'both' else [params['file_type']]
+    try:
+        for data_type in types:
+            state = aggregate_engine.get_state(data_type)
+            if (state['start'], state['end']) == (start_iso, end_iso):
+                if log_fn: log_fn(f"✓ {data_type.upper()} aggregates already cover {start_iso}..{end_iso}")
+                continue
+            summary = aggregate_engine.set_window(data_type, start_iso, end_iso)
+            get_reference_data().invalidate('aggregates')
+            if summary['applied_days'] == 0:
+                # symbol_daily doesn't cover the range: only a full run can persist it
+                return None
+            if log_fn: log_fn(f"✓ Incremental {data_type.upper()} aggregates: +{summary['added_days']}/-{summary['removed_days']} days")
+    except Exception as exc:
+        if log_fn: log_fn(f"⚠️ Aggregates not moved for cached export: {exc}")
+        return None
+    return cached
+
+
+def build_consolidation_export(params, work_dir, progress_fn=None, log_fn=None):
+    """
+    Run the MCAP + PR consolidation and Excel build for already-validated params.
+    Stages report through progress_fn(stage, percentage, message) so the same
+    pipeline serves the synchronous endpoint and background export jobs.
+
+    Returns dict with excel_path, excel_filename, excel_size_mb, results.
+    For non-xlsx output_format no file is written: the dict carries the scaled
+    sheets plus filename/mimetype for stream_sheets instead.
+    Raises ValueError/RuntimeError on failure.
+    """
+    date_iso_list = params['date_iso_list']
+    file_type = params['file_type']
+    fast_mode = params['fast_mode']
+    skip_daily = params['skip_daily']
+    allow_missing = params['allow_missing']
+    optimize_memory = params['optimize_memory']
+
+    def add_log(message):
+        if log_fn:
+            log_fn(message)
+        else:
+            print(message)
+
+    def report(stage, percentage, message=None):
+        if message:
+            add_log(message)
+        if progress_fn:
+            progress_fn(stage, percentage, message)
+
+    # Check memory limits - if too many dates, force batching
+    if len(date_iso_list) > 7 and not optimize_memory:
+        optimize_memory = True
+        print(f"[consolidate-saved][warning] Processing {len(date_iso_list)} dates - forcing memory optimization")
+
+    results = {}
+
+    def make_consolidator_from_cache_optimized(data_type, allowed_symbols=None, symbol_name_map=None):
+        """Memory-optimized consolidation from cache"""
+        memory_before = get_memory_usage_mb()
+        
+        # IMPORTANT: Don't batch the consolidation itself - that causes data loss!
+        # Instead, rely on build_consolidated_from_cache's internal optimizations
+        # Only for EXTREMELY large date ranges (6+ months), process all at once
+        
+        add_log(f"Processing {data_type.upper()} for {len(date_iso_list)} dates")
+        
+        df, dates_list, avg_col = build_consolidated_from_cache(
+            date_iso_list, data_type, allow_missing=allow_missing, log_fn=add_log,
+            allowed_symbols=allowed_symbols, symbol_name_map=symbol_name_map
+        )
+        
+        if df is None or df.empty:
+            raise ValueError(f"No {data_type.upper()} data available for requested dates")
+        
+        memory_after = get_memory_usage_mb()
+        add_log(f"{data_type.upper()} consolidated: {len(df)} companies across {len(dates_list)} dates")
+        add_log(f"Memory usage: {memory_before:.1f}MB -> {memory_after:.1f}MB (Δ{memory_after-memory_before:+.1f}MB)")
+        
+        cons = MarketCapConsolidator(work_dir, file_type=data_type)
+        cons.df_consolidated = df
+        cons.dates_list = dates_list
+        cons.avg_col = avg_col
+        cons.days_col = 'Days With Data'
+        return cons, len(df), len(dates_list)
+
+    # Initialize memory optimizer
+    optimizer = MemoryOptimizedExporter(compression_level=9)  # Maximum compression
+
+    # Build a label for filenames based on requested dates
+    if len(date_iso_list) == 1:
+        date_label = date_iso_list[0]
+    elif len(date_iso_list) > 1:
+        date_label = f"{date_iso_list[0]}_to_{date_iso_list[-1]}"
+    else:
+        date_label = "dates"
+    date_label = date_label.replace('/', '-').replace(' ', '_')
+
+    # Data collection for multi-sheet Excel
+    excel_sheets = {}
+
+    # Company Name -> Symbol mapping from the reference tables allows parallel processing
+    report('prefetch', 5)
+    prefetched_name_map = {}
+    if symbol_aggregates_collection is not None:
+        try:
+            prefetched_name_map = dict(get_reference_data().name_to_symbol())
+            if prefetched_name_map:
+                add_log(f"✓ Pre-fetched {len(prefetched_name_map)} symbol mappings (reference v{get_reference_data().versions()['aggregates']})")
+        except:
+            pass
+
+    def run_mcap():
+        try:
+            mcap_start = time.perf_counter()
+            report('mcap', 10, "Stage: MCAP consolidation")
+            cons, count, d_count = make_consolidator_from_cache_optimized('mcap')
+            
+            # Extract map for PR just in case it's more up-to-date
+            m_map = dict(zip(cons.df_consolidated['Symbol'], cons.df_consolidated['Company Name']))
+            
+            sheet_df = cons.df_consolidated.copy()
+            
+            if not fast_mode:
+                persist_start = time.perf_counter()
+                add_log(f"Starting MCAP persistence to Mongo...")
+                update_aggregates_for_window(cons, 'mcap', date_iso_list, skip_daily=skip_daily, log_fn=add_log)
+                add_log(f"✓ Persisted {count} MCAP averages in {time.perf_counter() - persist_start:.2f}s")
+            
+            return {
+                'cons': cons, 'sheet_df': sheet_df, 'm_map': m_map, 
+                'results': {'companies': count, 'dates': d_count, 'files': len(date_iso_list), 'persisted': not fast_mode},
+                'duration': time.perf_counter() - mcap_start
+            }
+        except Exception as e:
+            return {'error': f"MCAP failed: {e}"}
+
+    def run_pr(name_map):
+        try:
+            pr_start = time.perf_counter()
+            report('pr', 45, "Stage: PR consolidation")
+            # Use provided name_map (pre-fetched or live)
+            pr_map = {v: k for k, v in name_map.items()} if name_map else None
+            cons, count, d_count = make_consolidator_from_cache_optimized(
+                'pr', allowed_symbols=None, symbol_name_map=pr_map
+            )
+            
+            sheet_df = cons.df_consolidated.copy()
+            
+            if not fast_mode:
+                persist_start = time.perf_counter()
+                add_log(f"Starting PR persistence to Mongo...")
+                update_aggregates_for_window(cons, 'pr', date_iso_list, skip_daily=skip_daily, log_fn=add_log)
+                add_log(f"✓ Persisted {count} PR averages in {time.perf_counter() - persist_start:.2f}s")
+            
+            return {
+                'cons': cons, 'sheet_df': sheet_df,
+                'results': {'companies': count, 'dates': d_count, 'files': len(date_iso_list), 'persisted': not fast_mode},
+                'duration': time.perf_counter() - pr_start
+            }
+        except Exception as e:
+            return {'error': f"PR failed: {e}"}
+
+    # Parallel Execution
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        mcap_task = None
+        pr_task = None
+        
+        if file_type in ['mcap', 'both']:
+            mcap_task = executor.submit(run_mcap)
+        
+        # If only PR, run with prefetched map
+        if file_type == 'pr':
+            pr_task = executor.submit(run_pr, prefetched_name_map)
+        
+        # Wait for MCAP if it's running, then start PR if 'both'
+        mcap_data = mcap_task.result() if mcap_task else None
+        if mcap_data and 'error' in mcap_data:
+            raise RuntimeError(mcap_data['error'])
+        
+        if mcap_data:
+            excel_sheets['Market_Cap'] = mcap_data['sheet_df']
+            results['mcap'] = mcap_data['results']
+            add_log(f"MCAP stage done in {mcap_data['duration']:.2f}s")
+            
+            # If both, we can now run PR with potentially better map from MCAP
+            if file_type == 'both':
+                # Merge prefetched and live map
+                combined_map = {**prefetched_name_map, **(mcap_data['m_map'] or {})}
+                pr_task = executor.submit(run_pr, combined_map)
+        
+        # We can now clear MCAP cons from memory if it finished
+        if mcap_data and 'cons' in mcap_data:
+            del mcap_data['cons'].df_consolidated
+            del mcap_data['cons']
+            gc.collect()
+
+        pr_data = pr_task.result() if pr_task else None
+        if pr_data and 'error' in pr_data:
+            raise RuntimeError(pr_data['error'])
+        
+        if pr_data:
+            excel_sheets['Net_Traded_Value'] = pr_data['sheet_df']
+            results['pr'] = pr_data['results']
+            add_log(f"PR stage done in {pr_data['duration']:.2f}s")
+            
+            # Clear memory
+            if 'cons' in pr_data:
+                del pr_data['cons'].df_consolidated
+                del pr_data['cons']
+            gc.collect()
+
+    if not excel_sheets:
+        raise RuntimeError('No data collected for Excel creation')
+
+    report('scale', 75, "Stage: scaling sheets to Crores")
+    # Scale values to Crores and round to 2 decimal places for consolidation Excel only
+    for sheet_name, df_sheet in excel_sheets.items():
+        # REQUIREMENT: Hide intermediate count columns from final report
+        cols_to_drop = [c for c in ['non_zero_days', 'total_possible_days'] if c in df_sheet.columns]
+        if cols_to_drop:
+            df_sheet.drop(columns=cols_to_drop, inplace=True)
+        
+        # Identify columns that should be numeric (excluding Symbol, Company Name, Days With Data)
+        cols_to_scale = [c for c in df_sheet.columns if c not in ['Symbol', 'Company Name', 'Days With Data']]
+        for col in cols_to_scale:
+            try:
+                df_sheet[col] = pd.to_numeric(df_sheet[col], errors='coerce')
+                if pd.api.types.is_numeric_dtype(df_sheet[col]):
+                    # IMPORTANT: Only scale MCAP and Traded Value, NOT impact cost or ratios
+                    # These columns only contain MCAP or Net Traded Value depending on the sheet
+                    df_sheet[col] = (df_sheet[col] / 10000000).round(2)
+            except:
+                pass
+        add_log(f"✓ Scaled to Crores and cleaned up sheet '{sheet_name}'")
+
+    output_format = params.get('output_format', 'xlsx')
+    if output_format != 'xlsx':
+        sheet_names = list(excel_sheets.keys())
+        report('done', 100, f"Sheets ready for {output_format} export: {sheet_names}")
+        return {
+            'sheets': excel_sheets,
+            'output_format': output_format,
+            'filename': export_filename(date_label, output_format, sheet_names),
+            'mimetype': export_mimetype(output_format, sheet_names),
+            'results': results
+        }
+
+    # Create single Excel file with multiple sheets
+    excel_creation_start = time.perf_counter()
+    excel_filename = f"Market_Data_{date_label}.xlsx"
+    excel_path = os.path.join(work_dir, excel_filename)
+    
+    report('excel', 80, f"Creating multi-sheet Excel file: {excel_filename}")
+    add_log(f"Sheets to create: {list(excel_sheets.keys())}")
+    
+    if optimize_memory:
+        def excel_progress(fraction):
+            if progress_fn:
+                progress_fn('excel', 80 + int(fraction * 15), None)
+        optimizer.create_multi_sheet_excel(excel_sheets, excel_path, progress_fn=excel_progress)
+    else:
+        # Fallback to openpyxl for multiple sheets
+        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
+            for sheet_name, df in excel_sheets.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+    
+    # Get file size and log
+    excel_size_mb = os.path.getsize(excel_path) / 1024 / 1024
+    add_log(f"✓ Multi-sheet Excel created: {excel_size_mb:.1f}MB in {time.perf_counter() - excel_creation_start:.2f}s")
+    
+    # Clear sheets data from memory
+    del excel_sheets
+    gc.collect()
+
+    # Always copy Market_Cap sheet to nosubject/ if MCAP data exists
+    try:
+        nosubject_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'nosubject')
+        if not os.path.exists(nosubject_dir):
+            os.makedirs(nosubject_dir)
+        if 'mcap' in results:
+            # Copy the multi-sheet file as Market_Cap.xlsx for backward compatibility
+            market_cap_dest = os.path.join(nosubject_dir, 'Market_Cap.xlsx')
+            shutil.copy2(excel_path, market_cap_dest)
+            add_log(f"✓ Multi-sheet Excel copied to {market_cap_dest}")
+    except Exception as exc:
+        add_log(f"⚠️ Could not copy Excel to nosubject/: {exc}")
+
+    report('done', 100)
+    return {
+        'excel_path': excel_path,
+        'excel_filename': excel_filename,
+        'excel_size_mb': excel_size_mb,
+        'results': results
+    }
+
+
 @app.route('/api/consolidate-saved', methods=['POST'])
 def consolidate_saved():
     """
@@ -2572,330 +3696,209 @@ def consolidate_saved():
         "fast_mode": true/false  # default true, skip DB writes when true
         "optimize_memory": true/false  # default true, use memory optimization
         "max_records_per_batch": 5000  # default 5000, process data in batches
+        "output_format": "xlsx" | "csv.gz" | "parquet" | "arrow"  # default xlsx
+        "use_cache": true/false  # default true, serve/store repeat exports from the export cache
     }
 
     Response: Excel file (zip when both MCAP and PR are produced).
+    Non-xlsx formats are streamed without a temp file; with both sheets the body
+    is a zip holding Market_Cap.<ext> and Net_Traded_Value.<ext>.
+    For long ranges use POST /api/consolidate-saved/jobs instead (no request timeout).
     """
     work_dir = None  # Initialize early to avoid UnboundLocalError in exception handlers
     req_id = None
     try:
-        try:
-            payload = request.get_json() or {}
-            req_id = f"consolidate-{int(time.time() * 1000)}"
-            stage_start = time.perf_counter()
-            
-            # Memory optimization settings
-            optimize_memory = payload.get('optimize_memory', True)
-            max_records_per_batch = payload.get('max_records_per_batch', 5000)
-            
-            # Log initial memory usage
-            initial_memory = get_memory_usage_mb()
-            print(f"[consolidate-saved][start] id={req_id} initial_memory={initial_memory:.1f}MB optimize_memory={optimize_memory}")
-            
-            date_str = payload.get('date')
-            start_date_str = payload.get('start_date')
-            end_date_str = payload.get('end_date')
-            file_type = payload.get('file_type', 'both')
-            fast_mode = payload.get('fast_mode', False)
-            skip_daily = payload.get('skip_daily', True)
-            allow_missing = payload.get('allow_missing', True)
-
-            if file_type not in ['mcap', 'pr', 'both']:
-                return jsonify({'error': 'Invalid file_type (mcap, pr, or both)'}), 400
-
-            # Build date list
-            date_iso_list = []
-            try:
-                if date_str:
-                    date_dt = date_parser.parse(date_str)
-                    date_iso_list = [date_dt.strftime('%Y-%m-%d')]
-                elif start_date_str and end_date_str:
-                    start_dt = date_parser.parse(start_date_str)
-                    end_dt = date_parser.parse(end_date_str)
-                    if start_dt > end_dt:
-                        return jsonify({'error': 'start_date cannot be after end_date'}), 400
-                    current = start_dt
-                    while current <= end_dt:
-                        # Removed weekend skip: Include Saturdays and Sundays as well
-                        date_iso_list.append(current.strftime('%Y-%m-%d'))
-                        current += timedelta(days=1)
-                else:
-                    return jsonify({'error': 'Provide either date or start_date/end_date'}), 400
-            except Exception:
-                return jsonify({'error': 'Invalid date format. Use DD-Mon-YYYY (e.g., 03-Dec-2025)'}), 400
-
-            # Check memory limits - if too many dates, force batching
-            if len(date_iso_list) > 7 and not optimize_memory:
-                optimize_memory = True
-                print(f"[consolidate-saved][warning] Processing {len(date_iso_list)} dates - forcing memory optimization")
-
-            logs = []
-            work_dir = tempfile.mkdtemp()
-            results = {}
-
-            def add_log(message):
-                logs.append(message)
-                print(message)
-
-            def make_consolidator_from_cache_optimized(data_type, allowed_symbols=None, symbol_name_map=None):
-                """Memory-optimized consolidation from cache"""
-                memory_before = get_memory_usage_mb()
-                
-                # IMPORTANT: Don't batch the consolidation itself - that causes data loss!
-                # Instead, rely on build_consolidated_from_cache's internal optimizations
-                # Only for EXTREMELY large date ranges (6+ months), process all at once
-                
-                add_log(f"Processing {data_type.upper()} for {len(date_iso_list)} dates")
-                
-                df, dates_list, avg_col = build_consolidated_from_cache(
-                    date_iso_list, data_type, allow_missing=allow_missing, log_fn=add_log,
-                    allowed_symbols=allowed_symbols, symbol_name_map=symbol_name_map
-                )
-                
-                if df is None or df.empty:
-                    raise ValueError(f"No {data_type.upper()} data available for requested dates")
-                
-                memory_after = get_memory_usage_mb()
-                add_log(f"{data_type.upper()} consolidated: {len(df)} companies across {len(dates_list)} dates")
-                add_log(f"Memory usage: {memory_before:.1f}MB -> {memory_after:.1f}MB (Δ{memory_after-memory_before:+.1f}MB)")
-                
-                cons = MarketCapConsolidator(work_dir, file_type=data_type)
-                cons.df_consolidated = df
-                cons.dates_list = dates_list
-                cons.avg_col = avg_col
-                cons.days_col = 'Days With Data'
-                return cons, len(df), len(dates_list)
-
-            mcap_output_path = None
-            pr_output_path = None
-            mcap_symbols = None
-            mcap_name_map = None
-
-            # Initialize memory optimizer
-            optimizer = MemoryOptimizedExporter(compression_level=9)  # Maximum compression
-
-            # Build a label for filenames based on requested dates
-            if len(date_iso_list) == 1:
-                date_label = date_iso_list[0]
-            elif len(date_iso_list) > 1:
-                date_label = f"{date_iso_list[0]}_to_{date_iso_list[-1]}"
-            else:
-                date_label = "dates"
-            date_label = date_label.replace('/', '-').replace(' ', '_')
+        payload = request.get_json() or {}
+        req_id = f"consolidate-{int(time.time() * 1000)}"
+        stage_start = time.perf_counter()
+
+        params, error = parse_consolidation_request(payload)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Log initial memory usage
+        initial_memory = get_memory_usage_mb()
+        print(f"[consolidate-saved][start] id={req_id} initial_memory={initial_memory:.1f}MB optimize_memory={params['optimize_memory']}")
+
+        logs = []
+
+        def add_log(message):
+            logs.append(message)
+            print(message)
+
+        cache_key = consolidation_cache_key(params)
+        cached = cached_export_for(params, cache_key, log_fn=add_log)
+        if cached:
+            print(f"[consolidate-saved][cache-hit] id={req_id} key={cache_key[:12]} size={cached['size_bytes'] / 1024 / 1024:.1f}MB")
+            response = send_file(cached['path'], mimetype=cached['mimetype'], as_attachment=True, download_name=cached['filename'])
+            response.headers['X-Export-Cache'] = 'hit'
+            return response
 
-            # Data collection for multi-sheet Excel
-            excel_sheets = {}
+        work_dir = tempfile.mkdtemp()
+        export = build_consolidation_export(params, work_dir, log_fn=add_log)
+        if 'sheets' in export:
+            # csv.gz / parquet / arrow: encode chunks straight into the response body
+            sheets = export['sheets']
+            total_elapsed = time.perf_counter() - stage_start
+            add_log(f"Streaming {export['output_format']} export after {total_elapsed:.2f}s consolidation")
 
-            # Pre-fetch Company Name -> Symbol mapping from Mongo to allow parallel processing
-            prefetched_name_map = {}
-            if symbol_aggregates_collection is not None:
+            def generate():
                 try:
-                    for doc in symbol_aggregates_collection.find({'type': 'mcap'}, {'symbol': 1, 'company_name': 1}):
-                        s, c = doc.get('symbol'), doc.get('company_name')
-                        if s and c: prefetched_name_map[c] = s
-                    if prefetched_name_map:
-                        add_log(f"✓ Pre-fetched {len(prefetched_name_map)} symbol mappings from DB")
-                except:
-                    pass
+                    if cache_key is None:
+                        yield from stream_sheets(sheets, export['output_format'])
+                        return
+                    # Tee into the export cache; a disconnect mid-stream discards the entry
+                    with export_cache.writer(cache_key, export['filename'], export['mimetype'],
+                                             params['date_iso_list'], summary=export['results']) as fh:
+                        for data in stream_sheets(sheets, export['output_format']):
+                            fh.write(data)
+                            yield data
+                finally:
+                    sheets.clear()
+                    gc.collect()
+                    print(f"[consolidate-saved][done] id={req_id} format={export['output_format']} elapsed={time.perf_counter() - stage_start:.2f}s")
 
-            def run_mcap():
-                try:
-                    mcap_start = time.perf_counter()
-                    cons, count, d_count = make_consolidator_from_cache_optimized('mcap')
-                    
-                    # Extract map for PR just in case it's more up-to-date
-                    m_map = dict(zip(cons.df_consolidated['Symbol'], cons.df_consolidated['Company Name']))
-                    
-                    sheet_df = cons.df_consolidated.copy()
-                    
-                    if not fast_mode:
-                        persist_start = time.perf_counter()
-                        add_log(f"Starting MCAP persistence to Mongo...")
-                        persist_consolidated_results(cons, 'mcap', source='cached_db', skip_daily=skip_daily)
-                        add_log(f"✓ Persisted {count} MCAP averages in {time.perf_counter() - persist_start:.2f}s")
-                    
-                    return {
-                        'cons': cons, 'sheet_df': sheet_df, 'm_map': m_map, 
-                        'results': {'companies': count, 'dates': d_count, 'files': len(date_iso_list), 'persisted': not fast_mode},
-                        'duration': time.perf_counter() - mcap_start
-                    }
-                except Exception as e:
-                    return {'error': f"MCAP failed: {e}"}
+            response = Response(generate(), mimetype=export['mimetype'])
+            response.headers['Content-Disposition'] = f"attachment; filename={export['filename']}"
+            response.headers['X-Export-Cache'] = 'miss'
+            response.headers['X-Export-Log'] = ' | '.join(logs).encode('ascii', errors='ignore').decode('ascii')
+            response.call_on_close(lambda: shutil.rmtree(work_dir, ignore_errors=True))
+            return response
 
-            def run_pr(name_map):
-                try:
-                    pr_start = time.perf_counter()
-                    # Use provided name_map (pre-fetched or live)
-                    pr_map = {v: k for k, v in name_map.items()} if name_map else None
-                    cons, count, d_count = make_consolidator_from_cache_optimized(
-                        'pr', allowed_symbols=None, symbol_name_map=pr_map
-                    )
-                    
-                    sheet_df = cons.df_consolidated.copy()
-                    
-                    if not fast_mode:
-                        persist_start = time.perf_counter()
-                        add_log(f"Starting PR persistence to Mongo...")
-                        persist_consolidated_results(cons, 'pr', source='cached_db', skip_daily=skip_daily)
-                        add_log(f"✓ Persisted {count} PR averages in {time.perf_counter() - persist_start:.2f}s")
-                    
-                    return {
-                        'cons': cons, 'sheet_df': sheet_df,
-                        'results': {'companies': count, 'dates': d_count, 'files': len(date_iso_list), 'persisted': not fast_mode},
-                        'duration': time.perf_counter() - pr_start
-                    }
-                except Exception as e:
-                    return {'error': f"PR failed: {e}"}
+        excel_path = export['excel_path']
+        excel_filename = export['excel_filename']
+        excel_size_mb = export['excel_size_mb']
+        if cache_key:
+            try:
+                export_cache.put_file(cache_key, excel_path, excel_filename, EXPORT_FORMATS['xlsx'][1],
+                                      params['date_iso_list'], summary=export['results'])
+            except Exception as exc:
+                add_log(f"⚠️ Export not cached: {exc}")
 
-            # Parallel Execution
-            with ThreadPoolExecutor(max_workers=2) as executor:
-                mcap_task = None
-                pr_task = None
-                
-                if file_type in ['mcap', 'both']:
-                    mcap_task = executor.submit(run_mcap)
-                
-                # If only PR, run with prefetched map
-                if file_type == 'pr':
-                    pr_task = executor.submit(run_pr, prefetched_name_map)
-                
-                # Wait for MCAP if it's running, then start PR if 'both'
-                mcap_data = mcap_task.result() if mcap_task else None
-                if mcap_data and 'error' in mcap_data:
-                    shutil.rmtree(work_dir, ignore_errors=True)
-                    return jsonify({'error': mcap_data['error']}), 500
-                
-                if mcap_data:
-                    excel_sheets['Market_Cap'] = mcap_data['sheet_df']
-                    results['mcap'] = mcap_data['results']
-                    add_log(f"MCAP stage done in {mcap_data['duration']:.2f}s")
-                    
-                    # If both, we can now run PR with potentially better map from MCAP
-                    if file_type == 'both':
-                        # Merge prefetched and live map
-                        combined_map = {**prefetched_name_map, **(mcap_data['m_map'] or {})}
-                        pr_task = executor.submit(run_pr, combined_map)
-                
-                # We can now clear MCAP cons from memory if it finished
-                if mcap_data and 'cons' in mcap_data:
-                    del mcap_data['cons'].df_consolidated
-                    del mcap_data['cons']
-                    gc.collect()
+        # Send the single Excel file (no ZIP needed!)
+        final_memory = get_memory_usage_mb()
+        total_elapsed = time.perf_counter() - stage_start
+        add_log(f"Export completed: {total_elapsed:.2f}s, Peak memory: {final_memory:.1f}MB, File size: {excel_size_mb:.1f}MB")
+        
+        response = send_file(
+            excel_path,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=excel_filename
+        )
+        response.headers['Content-Disposition'] = f"attachment; filename={excel_filename}"
+        response.headers['X-Export-Cache'] = 'miss'
+        
+        if logs:
+            safe_log = ' | '.join(logs)
+            safe_log = safe_log.encode('ascii', errors='ignore').decode('ascii')
+            response.headers['X-Export-Log'] = safe_log
 
-                pr_data = pr_task.result() if pr_task else None
-                if pr_data and 'error' in pr_data:
-                    shutil.rmtree(work_dir, ignore_errors=True)
-                    return jsonify({'error': pr_data['error']}), 500
-                
-                if pr_data:
-                    excel_sheets['Net_Traded_Value'] = pr_data['sheet_df']
-                    results['pr'] = pr_data['results']
-                    add_log(f"PR stage done in {pr_data['duration']:.2f}s")
-                    
-                    # Clear memory
-                    if 'cons' in pr_data:
-                        del pr_data['cons'].df_consolidated
-                        del pr_data['cons']
-                    gc.collect()
+        print(f"[consolidate-saved][done] id={req_id} sheets={list(export['results'].keys())} elapsed={total_elapsed:.2f}s memory={final_memory:.1f}MB size={excel_size_mb:.1f}MB")
 
-            if not excel_sheets:
-                shutil.rmtree(work_dir, ignore_errors=True)
-                return jsonify({'error': 'No data collected for Excel creation'}), 500
+        response.call_on_close(lambda: [shutil.rmtree(work_dir, ignore_errors=True), gc.collect()])
+        return response
+
+    except Exception as e:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        error_msg = f"id={req_id} {e}" if req_id else str(e)
+        print(f"[consolidate-saved][error] {error_msg}")
+        return jsonify({'error': str(e)}), 500
 
-            # Scale values to Crores and round to 2 decimal places for consolidation Excel only
-            for sheet_name, df_sheet in excel_sheets.items():
-                # REQUIREMENT: Hide intermediate count columns from final report
-                cols_to_drop = [c for c in ['non_zero_days', 'total_possible_days'] if c in df_sheet.columns]
-                if cols_to_drop:
-                    df_sheet.drop(columns=cols_to_drop, inplace=True)
-                
-                # Identify columns that should be numeric (excluding Symbol, Company Name, Days With Data)
-                cols_to_scale = [c for c in df_sheet.columns if c not in ['Symbol', 'Company Name', 'Days With Data']]
-                for col in cols_to_scale:
-                    try:
-                        df_sheet[col] = pd.to_numeric(df_sheet[col], errors='coerce')
-                        if pd.api.types.is_numeric_dtype(df_sheet[col]):
-                            # IMPORTANT: Only scale MCAP and Traded Value, NOT impact cost or ratios
-                            # These columns only contain MCAP or Net Traded Value depending on the sheet
-                            df_sheet[col] = (df_sheet[col] / 10000000).round(2)
-                    except:
-                        pass
-                add_log(f"✓ Scaled to Crores and cleaned up sheet '{sheet_name}'")
-
-            # Create single Excel file with multiple sheets
-            excel_creation_start = time.perf_counter()
-            excel_filename = f"Market_Data_{date_label}.xlsx"
-            excel_path = os.path.join(work_dir, excel_filename)
-            
-            add_log(f"Creating multi-sheet Excel file: {excel_filename}")
-            add_log(f"Sheets to create: {list(excel_sheets.keys())}")
-            
-            if optimize_memory:
-                optimizer.create_multi_sheet_excel(excel_sheets, excel_path)
-            else:
-                # Fallback to openpyxl for multiple sheets
-                with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                    for sheet_name, df in excel_sheets.items():
-                        df.to_excel(writer, sheet_name=sheet_name, index=False)
-            
-            # Get file size and log
-            excel_size_mb = os.path.getsize(excel_path) / 1024 / 1024
-            add_log(f"✓ Multi-sheet Excel created: {excel_size_mb:.1f}MB in {time.perf_counter() - excel_creation_start:.2f}s")
-            
-            # Clear sheets data from memory
-            del excel_sheets
-            gc.collect()
 
-            # Always copy Market_Cap sheet to nosubject/ if MCAP data exists
+def _run_consolidation_job(job, params):
+    """Export job body: runs the consolidation pipeline and keeps the workbook (or streamed format) as the job result."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        cache_key = consolidation_cache_key(params)
+        cached = cached_export_for(params, cache_key, log_fn=job.log)
+        if cached:
+            job.log(f"Served from export cache ({cache_key[:12]})")
+            path = os.path.join(work_dir, cached['filename'])
+            shutil.copyfile(cached['path'], path)
+            job.store_result(path, cached['filename'], cached['mimetype'], summary=cached.get('summary'))
+            return
+
+        export = build_consolidation_export(params, work_dir, progress_fn=job.progress, log_fn=job.log)
+        if 'sheets' in export:
+            path = write_sheets(export['sheets'], export['output_format'], os.path.join(work_dir, export['filename']))
+            filename, mimetype = export['filename'], export['mimetype']
+        else:
+            path, filename = export['excel_path'], export['excel_filename']
+            mimetype = EXPORT_FORMATS['xlsx'][1]
+        if cache_key:
             try:
-                nosubject_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'nosubject')
-                if not os.path.exists(nosubject_dir):
-                    os.makedirs(nosubject_dir)
-                if 'mcap' in results:
-                    # Copy the multi-sheet file as Market_Cap.xlsx for backward compatibility
-                    market_cap_dest = os.path.join(nosubject_dir, 'Market_Cap.xlsx')
-                    shutil.copy2(excel_path, market_cap_dest)
-                    add_log(f"✓ Multi-sheet Excel copied to {market_cap_dest}")
+                export_cache.put_file(cache_key, path, filename, mimetype, params['date_iso_list'], summary=export['results'])
             except Exception as exc:
-                add_log(f"⚠️ Could not copy Excel to nosubject/: {exc}")
-
-            # Send the single Excel file (no ZIP needed!)
-            final_memory = get_memory_usage_mb()
-            total_elapsed = time.perf_counter() - stage_start
-            add_log(f"Export completed: {total_elapsed:.2f}s, Peak memory: {final_memory:.1f}MB, File size: {excel_size_mb:.1f}MB")
-            
-            response = send_file(
-                excel_path,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=excel_filename
-            )
-            response.headers['Content-Disposition'] = f"attachment; filename={excel_filename}"
-            
-            if logs:
-                safe_log = ' | '.join(logs)
-                safe_log = safe_log.encode('ascii', errors='ignore').decode('ascii')
-                response.headers['X-Export-Log'] = safe_log
+                job.log(f"⚠️ Export not cached: {exc}")
+        job.store_result(path, filename, mimetype, summary=export['results'])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
-            print(f"[consolidate-saved][done] id={req_id} sheets={list(results.keys())} elapsed={total_elapsed:.2f}s memory={final_memory:.1f}MB size={excel_size_mb:.1f}MB")
 
-            response.call_on_close(lambda: [shutil.rmtree(work_dir, ignore_errors=True), gc.collect()])
-            return response
-
-        except Exception as e:
-            if work_dir:
-                shutil.rmtree(work_dir, ignore_errors=True)
-            error_msg = f"id={req_id} {e}" if req_id else str(e)
-            print(f"[consolidate-saved][error] {error_msg}")
-            return jsonify({'error': str(e)}), 500
+@app.route('/api/consolidate-saved/jobs', methods=['POST'])
+def submit_consolidation_job():
+    """
+    Queue a consolidate-saved export in the background worker pool.
+    Accepts the same payload as /api/consolidate-saved and returns a job id immediately.
+    """
+    try:
+        payload = request.get_json() or {}
+        params, error = parse_consolidation_request(payload)
+        if error:
+            return jsonify({'error': error}), 400
 
+        job_id = export_job_queue.submit('consolidate_saved', _run_consolidation_job, params)
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f"/api/consolidate-saved/jobs/{job_id}",
+            'download_url': f"/api/consolidate-saved/jobs/{job_id}/result"
+        }), 202
     except Exception as e:
-        if work_dir:
-            shutil.rmtree(work_dir, ignore_errors=True)
-        print(f"[consolidate-saved][error] {e}")
+        print(f"[consolidate-job][error] {e}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/consolidate-saved/jobs/<job_id>', methods=['GET'])
+def consolidation_job_status(job_id):
+    """Poll a background export: status, stage, percentage and memory stats."""
+    job = export_job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    response = jsonify(job)
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200
+
+
+@app.route('/api/consolidate-saved/jobs/<job_id>/result', methods=['GET'])
+def consolidation_job_result(job_id):
+    """Download the workbook produced by a finished export job."""
+    job = export_job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.get('status') != 'done':
+        return jsonify({'error': f"Job is {job.get('status')}", 'status': job.get('status')}), 409
+    result = job.get('result') or {}
+    path = export_job_queue.result_path(job_id)
+    if not path:
+        # produced on another host: serve the uploaded copy
+        artifact_id = export_job_queue.result_artifact(job_id)
+        if artifact_id and artifact_store is not None:
+            try:
+                return send_artifact(artifact_id, filename=result.get('filename'), mimetype=result.get('mimetype'))
+            except ArtifactNotFound:
+                pass
+        return jsonify({'error': 'Result file expired'}), 410
+    return send_file(
+        path,
+        mimetype=result.get('mimetype', 'application/octet-stream'),
+        as_attachment=True,
+        download_name=result.get('filename', os.path.basename(path))
+    )
+
+
 @app.route('/api/nifty-indices/fetch-and-store', methods=['POST'])
 def fetch_and_store_nifty_indices():
     """
@@ -2990,6 +3993,7 @@ def fetch_and_store_nifty_indices():
             nifty_indices_collection.delete_many({})
             
             result = nifty_indices_collection.bulk_write(bulk_operations, ordered=True)
+            get_reference_data().invalidate('indices')
             print(f"[fetch-and-store-indices] ✓ synchronized {len(index_mapping)} symbols with DB")
             print(f"[fetch-and-store-indices] Matched: {result.matched_count}, Modified: {result.modified_count}, Upserted: {result.upserted_count}")
             
@@ -3114,6 +4118,36 @@ def get_db_status():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/bhavcache/migrate-columnar', methods=['POST'])
+def migrate_bhavcache_columnar():
+    """Convert legacy CSV bhavcache documents to Parquet. Payload: {"dry_run": bool, "batch_size": int}"""
+    if bhavcache_collection is None:
+        return jsonify({'error': 'Database not connected'}), 500
+    try:
+        data = request.get_json(silent=True) or {}
+        summary = migrate_bhavcache_to_columnar(
+            batch_size=int(data.get('batch_size', 50) or 50),
+            dry_run=bool(data.get('dry_run', False))
+        )
+        return jsonify({'success': not summary['errors'], **summary}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/symbol-metrics-daily/migrate-buckets', methods=['POST'])
+def migrate_symbol_metrics_daily():
+    """Copy legacy symbol_metrics_daily arrays into symbol_metrics_monthly buckets."""
+    if metrics_bucket_store is None or symbol_metrics_daily_collection is None:
+        return jsonify({'error': 'Database not connected'}), 500
+    data = request.get_json(silent=True) or {}
+    try:
+        summary = metrics_bucket_store.migrate_from_legacy(
+            symbol_metrics_daily_collection, dry_run=bool(data.get('dry_run', False))
+        )
+        return jsonify({'success': True, **summary}), 200
+    except Exception as exc:
+        return jsonify({'error': str(exc)}), 500
+
+
 @app.route('/api/db-prune', methods=['POST'])
 def prune_db():
     """Prune old database entries to free up space."""
@@ -3122,19 +4156,30 @@ def prune_db():
     try:
         data = request.get_json() or {}
         days = int(data.get('days', 60))
+        drop_all_zips = bool(data.get('drop_all_zips', False))
         
-        # 1. Clear excel_results
+        # 1. Clear excel_results and the artifacts they point to
+        if artifact_store is not None:
+            for doc in db['excel_results'].find({'artifact_id': {'$exists': True}}, {'artifact_id': 1}):
+                artifact_store.delete(doc['artifact_id'])
+            artifact_store.cleanup_expired()
         res_excel = db['excel_results'].delete_many({})
         
         # 2. Clear old bhavcache
         cutoff_date = datetime.now() - timedelta(days=days)
         cutoff_iso = cutoff_date.strftime('%Y-%m-%d')
+        # 3. Retained bhavcopy archives (all of them with drop_all_zips)
+        removed_zip_files, removed_zip_docs = prune_bundle_zips(None if drop_all_zips else cutoff_iso)
         res_cache = db['bhavcache'].delete_many({'date': {'$lt': cutoff_iso}})
+        removed_local = columnar_store.delete_before(cutoff_iso) if columnar_store is not None else 0
         
         return jsonify({
             'message': 'Database pruned successfully',
             'deleted_excel_results': res_excel.deleted_count,
             'deleted_old_cache': res_cache.deleted_count,
+            'deleted_local_cache_files': removed_local,
+            'deleted_zip_files': removed_zip_files,
+            'deleted_zip_docs': removed_zip_docs,
             'pruned_before': cutoff_iso
         })
     except Exception as e:
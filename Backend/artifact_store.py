@@ -0,0 +1,254 @@
+"""
+Artifact store for generated workbooks and exports
+Files are uploaded and served in chunks (GridFS in production, a local
+directory for development/tests) instead of being buffered whole into an
+inline `Binary` field, so artifacts are not bound by Mongo's 16MB document
+limit. Every artifact carries an expiry; cleanup_expired() removes stale ones.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import gridfs
+from bson import ObjectId
+
+CHUNK_SIZE = 255 * 1024  # GridFS default chunk size
+
+
+class ArtifactNotFound(KeyError):
+    pass
+
+
+class _BaseArtifactStore:
+    backend = None
+
+    def __init__(self, ttl_hours=72, cleanup_interval_seconds=600):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.cleanup_interval = cleanup_interval_seconds
+        self._cleaned_at = 0.0
+        self._cleanup_lock = threading.Lock()
+        self.stats = {'stored': 0, 'bytes_stored': 0, 'served': 0, 'expired': 0}
+
+    def expiry(self, ttl_hours=None):
+        return datetime.now() + (timedelta(hours=ttl_hours) if ttl_hours is not None else self.ttl)
+
+    def put_file(self, path, filename, content_type, metadata=None, ttl_hours=None):
+        """Upload a file in chunks. Returns the artifact info dict (id, length, expires_at, ...)."""
+        self.maybe_cleanup()
+        with open(path, 'rb') as fh:
+            info = self._put_stream(fh, filename, content_type, metadata or {}, self.expiry(ttl_hours))
+        self.stats['stored'] += 1
+        self.stats['bytes_stored'] += info['length']
+        return info
+
+    def iter_range(self, artifact_id, start=0, end=None, chunk_size=CHUNK_SIZE):
+        """Yield bytes [start, end) of an artifact without loading it whole."""
+        fh = self.open(artifact_id)
+        try:
+            fh.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                data = fh.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not data:
+                    break
+                if remaining is not None:
+                    remaining -= len(data)
+                yield data
+            self.stats['served'] += 1
+        finally:
+            fh.close()
+
+    def maybe_cleanup(self):
+        """Run cleanup_expired at most once per cleanup interval."""
+        now = time.monotonic()
+        if now - self._cleaned_at < self.cleanup_interval or not self._cleanup_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._cleaned_at = now
+            return self.cleanup_expired()
+        finally:
+            self._cleanup_lock.release()
+
+    def get_stats(self):
+        return {**self.stats, 'backend': self.backend, 'ttl_hours': self.ttl.total_seconds() / 3600}
+
+
+class GridFSArtifactStore(_BaseArtifactStore):
+    backend = 'gridfs'
+
+    def __init__(self, db, bucket_name='artifacts', **kwargs):
+        super().__init__(**kwargs)
+        self.db = db
+        self.bucket_name = bucket_name
+        self.bucket = gridfs.GridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=CHUNK_SIZE)
+        self.files = db[f"{bucket_name}.files"]
+        try:
+            self.files.create_index([('metadata.expires_at', 1)], name='expires_at')
+        except Exception as exc:
+            print(f"⚠️ {bucket_name}.files index not created: {exc}")
+
+    def _put_stream(self, fh, filename, content_type, metadata, expires_at):
+        file_id = self.bucket.upload_from_stream(filename, fh, metadata={
+            **metadata, 'content_type': content_type, 'expires_at': expires_at
+        })
+        return self.info(str(file_id))
+
+    def info(self, artifact_id):
+        try:
+            doc = self.files.find_one({'_id': ObjectId(artifact_id)})
+        except Exception:
+            doc = None
+        if not doc:
+            raise ArtifactNotFound(artifact_id)
+        meta = doc.get('metadata') or {}
+        return {
+            'id': str(doc['_id']),
+            'filename': doc.get('filename'),
+            'length': doc.get('length', 0),
+            'content_type': meta.get('content_type', 'application/octet-stream'),
+            'uploaded_at': doc.get('uploadDate'),
+            'expires_at': meta.get('expires_at'),
+            'backend': self.backend
+        }
+
+    def open(self, artifact_id):
+        """Seekable GridOut reading one chunk document at a time."""
+        try:
+            return self.bucket.open_download_stream(ObjectId(artifact_id))
+        except Exception as exc:
+            raise ArtifactNotFound(artifact_id) from exc
+
+    def delete(self, artifact_id):
+        try:
+            self.bucket.delete(ObjectId(artifact_id))
+            return True
+        except Exception:
+            return False
+
+    def cleanup_expired(self):
+        """Delete expired files with their chunks (a TTL index would orphan the chunks)."""
+        removed = 0
+        try:
+            for doc in self.files.find({'metadata.expires_at': {'$lt': datetime.now()}}, {'_id': 1}):
+                if self.delete(str(doc['_id'])):
+                    removed += 1
+        except Exception as exc:
+            print(f"⚠️ Artifact cleanup failed: {exc}")
+        self.stats['expired'] += removed
+        return removed
+
+
+class LocalArtifactStore(_BaseArtifactStore):
+    backend = 'local'
+
+    def __init__(self, root_dir, **kwargs):
+        super().__init__(**kwargs)
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _paths(self, artifact_id):
+        if not artifact_id or not all(c in '0123456789abcdef' for c in artifact_id):
+            raise ArtifactNotFound(artifact_id)
+        return os.path.join(self.root_dir, f"{artifact_id}.bin"), os.path.join(self.root_dir, f"{artifact_id}.json")
+
+    def _put_stream(self, fh, filename, content_type, metadata, expires_at):
+        artifact_id = uuid.uuid4().hex
+        data_path, meta_path = self._paths(artifact_id)
+        fd, tmp = tempfile.mkstemp(dir=self.root_dir, suffix='.part')
+        length = 0
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                data = fh.read(CHUNK_SIZE)
+                if not data:
+                    break
+                out.write(data)
+                length += len(data)
+        os.replace(tmp, data_path)
+        info = {
+            'id': artifact_id,
+            'filename': filename,
+            'length': length,
+            'content_type': content_type,
+            'uploaded_at': datetime.now().isoformat(),
+            'expires_at': expires_at.isoformat(),
+            'backend': self.backend,
+            'metadata': metadata
+        }
+        with open(meta_path, 'w') as f:
+            json.dump(info, f, default=str)
+        return info
+
+    def info(self, artifact_id):
+        data_path, meta_path = self._paths(artifact_id)
+        if not os.path.exists(data_path):
+            raise ArtifactNotFound(artifact_id)
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def open(self, artifact_id):
+        data_path, _ = self._paths(artifact_id)
+        try:
+            return open(data_path, 'rb')
+        except FileNotFoundError as exc:
+            raise ArtifactNotFound(artifact_id) from exc
+
+    def delete(self, artifact_id):
+        existed = False
+        for path in self._paths(artifact_id):
+            try:
+                os.remove(path)
+                existed = True
+            except FileNotFoundError:
+                pass
+        return existed
+
+    def cleanup_expired(self):
+        removed = 0
+        now_iso = datetime.now().isoformat()
+        for name in os.listdir(self.root_dir):
+            if not name.endswith('.json'):
+                continue
+            artifact_id = name[:-5]
+            try:
+                if self.info(artifact_id).get('expires_at', now_iso) < now_iso:
+                    removed += int(self.delete(artifact_id))
+            except Exception:
+                self.delete(artifact_id)
+        self.stats['expired'] += removed
+        return removed
+
+
+def parse_range(range_header, length):
+    """
+    Resolve a single-range `Range: bytes=...` header against length.
+    Returns (start, end_exclusive), None for no/unsupported range, or False when unsatisfiable.
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    first, _, last = range_header[6:].strip().partition('-')
+    try:
+        if first == '':
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            return max(0, length - suffix), length
+        start = int(first)
+        end = min(int(last) + 1, length) if last else length
+    except ValueError:
+        return None
+    if start >= length or end <= start:
+        return False
+    return start, end
+
+
+def create_artifact_store(db=None, backend=None, root_dir=None, ttl_hours=72):
+    """GridFS when a database is available (unless backend='local'), else the local directory."""
+    backend = backend or ('gridfs' if db is not None else 'local')
+    if backend == 'gridfs' and db is not None:
+        return GridFSArtifactStore(db, ttl_hours=ttl_hours)
+    return LocalArtifactStore(root_dir, ttl_hours=ttl_hours)
@@ -0,0 +1,189 @@
+"""
+asyncio backend for NSE GetQuoteApi symbol fetches
+One event loop with a semaphore-bounded number of in-flight requests replaces
+the per-chunk thread pools in SymbolMetricsFetcher.fetch_many, so a single
+worker can fetch the full symbol universe without thread churn.
+"""
+
+import asyncio
+import json
+import time
+from urllib.parse import urlparse
+
+from rate_limiter import ERROR, TIMEOUT, classify_status, get_limiter
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency - fetch_many falls back to threads
+    aiohttp = None
+
+
+def async_backend_available():
+    """Return True when aiohttp is installed."""
+    return aiohttp is not None
+
+
+class AsyncQuoteFetcher:
+    def __init__(self, fetcher, concurrency=50, request_timeout=None, symbol_deadline=None):
+        """
+        Args:
+            fetcher: SymbolMetricsFetcher supplying headers, parsing and the NSE client
+            concurrency: maximum simultaneous HTTP requests
+            request_timeout: per-request deadline in seconds (defaults to fetcher.timeout)
+            symbol_deadline: cap for one symbol across all series fallbacks
+        """
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is not installed; use the thread backend")
+        self.fetcher = fetcher
+        self.concurrency = max(1, int(concurrency))
+        self.request_timeout = request_timeout or fetcher.timeout
+        self.symbol_deadline = symbol_deadline or self.request_timeout * 3
+        self._cookie_lock = None
+        self._cookies_version = 0
+
+    async def _refresh_cookies(self, http, seen_version):
+        """Re-prime cookies once per 401/403 wave (other tasks reuse the result)."""
+        async with self._cookie_lock:
+            if self._cookies_version != seen_version:
+                return
+            loop = asyncio.get_running_loop()
+            cookies = await loop.run_in_executor(None, lambda: self.fetcher.client.cookie_snapshot(force=True))
+            http.cookie_jar.update_cookies(cookies)
+            self._cookies_version += 1
+
+    async def _limited_get(self, http, params):
+        """One GET paced by the host's shared adaptive limiter (same one NSEClient uses)."""
+        limiter = get_limiter(urlparse(self.fetcher.BASE_URL).netloc)
+        while True:
+            wait = limiter.try_acquire()
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+        outcome = ERROR
+        try:
+            async with http.get(self.fetcher.BASE_URL, params=params, headers=self.fetcher.headers) as resp:
+                status = resp.status
+                body = await resp.read() if status == 200 else b''
+            outcome = classify_status(status)
+            return status, body
+        except (asyncio.TimeoutError, asyncio.CancelledError, aiohttp.ClientConnectionError):
+            outcome = TIMEOUT
+            raise
+        finally:
+            limiter.release(outcome)
+
+    async def _call_symbol(self, http, symbol, series):
+        params = self.fetcher._quote_params(symbol, series)
+        for attempt in range(2):
+            version = self._cookies_version
+            status, body = await self._limited_get(http, params)
+            if status in (401, 403) and attempt == 0:
+                await self._refresh_cookies(http, version)
+                continue
+            break
+        if status != 200:
+            raise ValueError(f"NSE getSymbolData error {status} for {symbol} ({series})")
+        try:
+            payload = json.loads(body) if body else {}
+        except Exception:
+            raise ValueError(f"Invalid JSON for {symbol} ({series})")
+        return self.fetcher._extract_quote_item(payload, symbol, series)
+
+    async def _fetch_symbol(self, http, symbol, series, as_on):
+        """Same series fallback as SymbolMetricsFetcher.fetch_symbol_data."""
+        last_exc = None
+        order, cached = self.fetcher.resolve_series_order(symbol, series)
+        for ser in order:
+            try:
+                data = await self._call_symbol(http, symbol, ser)
+                self.fetcher.record_series(symbol, cached, ser)
+                return self.fetcher.build_quote_row(data, symbol, ser, as_on)
+            except ValueError as exc:
+                last_exc = exc
+                if not self.fetcher.is_series_miss(exc):
+                    raise
+                if ser == cached:
+                    # Memory-only here; the Mongo delete is deferred so the loop never blocks
+                    self.fetcher.series_cache.invalidate(symbol, persist=False)
+        raise last_exc or ValueError(f"No data for {symbol}")
+
+    async def _run(self, symbols, as_on, max_time_seconds, external_metrics_cache, log_fn):
+        start_time = time.time()
+        sem = asyncio.Semaphore(self.concurrency)
+        self._cookie_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        cookies = await loop.run_in_executor(None, self.fetcher.client.cookie_snapshot)
+
+        total = len(symbols)
+        done = 0
+        last_pct = -1
+
+        def _report():
+            nonlocal last_pct
+            pct = int(done * 100 / total) if total else 100
+            if log_fn and pct // 10 != last_pct // 10:
+                last_pct = pct
+                log_fn(f"Fetched {done}/{total} symbols", percentage=pct)
+
+        async def _one(sym):
+            nonlocal done
+            try:
+                if external_metrics_cache and sym in external_metrics_cache:
+                    cached_data = external_metrics_cache[sym]
+                    if cached_data.get('total_market_cap') is not None or cached_data.get('last_price') is not None:
+                        return ('ok', cached_data)
+                if str(sym).strip().upper() == 'PERMITTED':
+                    return ('skip', None)
+
+                # One slot per symbol (its series fallbacks run sequentially), so the
+                # per-symbol deadline starts when the first request is sent, not while queued
+                async with sem:
+                    deadline = self.symbol_deadline
+                    if max_time_seconds:
+                        remaining = max_time_seconds - (time.time() - start_time)
+                        if remaining <= 0:
+                            return ('timeout', {'symbol': sym, 'error': 'Skipped - time limit reached'})
+                        deadline = min(deadline, remaining)
+                    try:
+                        row = await asyncio.wait_for(self._fetch_symbol(http, sym, 'EQ', as_on), timeout=deadline)
+                        return ('ok', row)
+                    except asyncio.TimeoutError:
+                        return ('timeout', {'symbol': sym, 'error': f'Deadline of {deadline:.1f}s exceeded', 'retryable': True})
+                    except aiohttp.ClientError as exc:
+                        return ('err', {'symbol': sym, 'error': str(exc), 'retryable': True})
+                    except Exception as exc:
+                        return ('err', {'symbol': sym, 'error': str(exc), 'retryable': self.fetcher.is_retryable_error(exc)})
+            finally:
+                done += 1
+                _report()
+
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector, cookies=cookies) as http:
+            return await asyncio.gather(*(_one(sym) for sym in symbols))
+
+    def fetch_many(self, symbols, as_of=None, max_time_seconds=None, external_metrics_cache=None, log_fn=None):
+        """
+        Fetch all symbols on a private event loop. Returns (rows, errors) in the
+        same shape as SymbolMetricsFetcher.fetch_many.
+        """
+        as_on = self.fetcher.normalize_as_on(as_of)
+        msg = f"Async fetch of {len(symbols)} symbols (concurrency={self.concurrency})..."
+        print(f"[fetch-symbols] {msg}")
+        if log_fn:
+            log_fn(msg, percentage=0)
+
+        results = asyncio.run(self._run(symbols, as_on, max_time_seconds, external_metrics_cache, log_fn))
+
+        rows, errors = [], []
+        skipped = 0
+        for status, payload in results:
+            if status == 'ok':
+                rows.append(payload)
+            elif status == 'timeout' and payload.get('error', '').startswith('Skipped'):
+                skipped += 1
+            elif status != 'skip':
+                errors.append(payload)
+        if skipped:
+            errors.append({'symbol': 'timeout', 'error': f'Time limit reached. {skipped} symbols skipped.'})
+        return rows, errors
@@ -0,0 +1,190 @@
+"""
+Negative cache for bhavcopy downloads
+Records why a (date, type) bhavcopy could not be fetched and when it is worth
+asking NSE again, so `missing_only` range downloads stop re-requesting
+holidays and unpublished dates on every run. Holidays confirmed by the
+calendar seed are never retried; a past weekday answered with no data is
+retried after a long window (it may have been a transient NSE failure),
+unpublished dates after a short wait, and network/HTTP failures with
+exponential backoff. Backed by the `bhavcache_misses` collection when available.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import DeleteOne, UpdateOne
+
+# Reasons recorded by download_nse_csv
+HOLIDAY = 'holiday'          # seed-confirmed holiday
+NO_DATA = 'no_data'          # past weekday answered 404/empty, not (yet) a confirmed holiday
+NOT_PUBLISHED = 'not_published'
+MISSING_FILE = 'missing_file'
+HTTP_ERROR = 'http_error'
+NETWORK_ERROR = 'network_error'
+
+# Seconds before the first retry; None = never retry
+DEFAULT_RETRY_POLICY = {
+    HOLIDAY: None,
+    NO_DATA: 3 * 24 * 60 * 60,
+    NOT_PUBLISHED: 30 * 60,
+    MISSING_FILE: 12 * 60 * 60,
+    HTTP_ERROR: 5 * 60,
+    NETWORK_ERROR: 2 * 60,
+}
+BACKOFF_REASONS = {HTTP_ERROR, NETWORK_ERROR}
+RETRYABLE_REASONS = BACKOFF_REASONS
+MAX_BACKOFF_SECONDS = 6 * 60 * 60
+
+
+class BhavMissCache:
+    def __init__(self, collection=None, retry_policy=None, holiday_check=None):
+        """
+        Args:
+            collection: Mongo collection (`bhavcache_misses`), docs shaped
+                {_id: 'TYPE:YYYY-MM-DD', type, date, reason, detail, attempts,
+                 last_failed_at, retry_after (None = never)}
+            holiday_check: callable(date_iso) -> bool confirming a holiday; stored
+                never-retry entries it does not confirm fall back to the no_data window
+        """
+        self.collection = collection
+        self.holiday_check = holiday_check
+        self.retry_policy = {**DEFAULT_RETRY_POLICY, **(retry_policy or {})}
+        self._entries = {}      # key -> doc
+        self._loaded = set()
+        self._lock = threading.Lock()
+        self.stats = {'skips': 0, 'recorded': 0, 'cleared': 0}
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        if self.collection is None:
+            return
+        try:
+            self.collection.create_index([('type', 1), ('date', 1)], name='type_date_miss')
+        except Exception as exc:
+            print(f"⚠️ bhavcache_misses index not created: {exc}")
+
+    @staticmethod
+    def _key(date_iso, data_type):
+        return f"{data_type}:{date_iso}"
+
+    def preload(self, date_iso_list, data_type):
+        """Bulk-load misses for dates not yet looked up (one Mongo query)."""
+        keys = [self._key(d, data_type) for d in date_iso_list]
+        with self._lock:
+            missing = [k for k in keys if k not in self._loaded]
+        if missing and self.collection is not None:
+            try:
+                docs = list(self.collection.find({'_id': {'$in': missing}}))
+            except Exception as exc:
+                print(f"⚠️ Miss cache preload failed: {exc}")
+                return
+            with self._lock:
+                for doc in docs:
+                    self._entries[doc['_id']] = doc
+        with self._lock:
+            self._loaded.update(missing)
+
+    def lookup(self, date_iso, data_type, now=None):
+        """Return the recorded miss while it is still in effect, else None."""
+        key = self._key(date_iso, data_type)
+        with self._lock:
+            loaded = key in self._loaded
+        if not loaded:
+            self.preload([date_iso], data_type)
+        now = now or datetime.now()
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            retry_after = entry.get('retry_after')
+            if retry_after is None and entry.get('reason') == HOLIDAY and self.holiday_check is not None \
+                    and not self.holiday_check(entry['date']) and entry.get('last_failed_at'):
+                # recorded as a holiday before only seed holidays were final
+                retry_after = entry['last_failed_at'] + timedelta(seconds=self.retry_policy[NO_DATA])
+            if retry_after is not None and retry_after <= now:
+                return None
+            self.stats['skips'] += 1
+            return dict(entry)
+
+    def reason(self, date_iso, data_type):
+        """Reason of the last recorded miss (regardless of its retry window), or None."""
+        with self._lock:
+            entry = self._entries.get(self._key(date_iso, data_type))
+            return entry.get('reason') if entry else None
+
+    def record(self, date_iso, data_type, reason, detail=None):
+        """Record a failed fetch; the retry window follows the reason's policy."""
+        key = self._key(date_iso, data_type)
+        now = datetime.now()
+        with self._lock:
+            previous = self._entries.get(key) or {}
+            attempts = previous.get('attempts', 0) + 1 if previous.get('reason') == reason else 1
+            delay = self.retry_policy.get(reason, DEFAULT_RETRY_POLICY[NETWORK_ERROR])
+            if delay is not None and reason in BACKOFF_REASONS:
+                delay = min(delay * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+            entry = {
+                '_id': key,
+                'type': data_type,
+                'date': date_iso,
+                'reason': reason,
+                'detail': detail,
+                'attempts': attempts,
+                'last_failed_at': now,
+                'retry_after': now + timedelta(seconds=delay) if delay is not None else None
+            }
+            self._entries[key] = entry
+            self._loaded.add(key)
+            self.stats['recorded'] += 1
+        if self.collection is not None:
+            try:
+                self.collection.bulk_write([UpdateOne({'_id': key}, {'$set': entry}, upsert=True)])
+            except Exception as exc:
+                print(f"⚠️ Miss cache write for {key} failed: {exc}")
+        return entry
+
+    def clear(self, date_iso, data_type):
+        """Forget a miss once the bhavcopy has been fetched."""
+        key = self._key(date_iso, data_type)
+        with self._lock:
+            existed = self._entries.pop(key, None) is not None
+            self._loaded.add(key)
+            if existed:
+                self.stats['cleared'] += 1
+        if existed and self.collection is not None:
+            try:
+                self.collection.bulk_write([DeleteOne({'_id': key})])
+            except Exception as exc:
+                print(f"⚠️ Miss cache delete for {key} failed: {exc}")
+        return existed
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'entries': len(self._entries),
+            'persistent': self.collection is not None
+        }
+
+
+_cache = BhavMissCache(None)
+_cache_lock = threading.Lock()
+
+
+def configure_miss_cache(collection, holiday_check=None):
+    """Swap in a Mongo-backed cache (called once the DB connection is up)."""
+    global _cache
+    overrides = {}
+    if os.getenv('BHAV_MISS_UNPUBLISHED_RETRY'):
+        overrides[NOT_PUBLISHED] = int(os.getenv('BHAV_MISS_UNPUBLISHED_RETRY'))
+    if os.getenv('BHAV_MISS_NO_DATA_RETRY'):
+        overrides[NO_DATA] = int(os.getenv('BHAV_MISS_NO_DATA_RETRY'))
+    if os.getenv('BHAV_MISS_NETWORK_RETRY'):
+        overrides[NETWORK_ERROR] = int(os.getenv('BHAV_MISS_NETWORK_RETRY'))
+    with _cache_lock:
+        _cache = BhavMissCache(collection, retry_policy=overrides, holiday_check=holiday_check)
+    return _cache
+
+
+def get_miss_cache():
+    """Return the process-wide bhavcopy miss cache."""
+    return _cache
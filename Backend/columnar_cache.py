@@ -0,0 +1,173 @@
+"""
+Columnar on-disk store for cached NSE bhavcopy data (MCAP / PR)
+Stores one Parquet file per (type, date) so consolidation can decode only the
+symbol/value/name columns instead of re-parsing whole CSV blobs.
+"""
+
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+import pandas as pd
+
+# Columns consolidation actually needs for each cached data type
+BHAV_COLUMNS = {
+    'mcap': {'symbol': 'Symbol', 'value': 'Market Cap(Rs.)', 'name': 'Security Name'},
+    'pr': {'symbol': 'SECURITY', 'value': 'NET_TRDVAL', 'name': 'SECURITY'},
+}
+
+
+def parquet_available():
+    """Return True when a Parquet engine (pyarrow) is installed."""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def consolidation_columns(data_type):
+    """Ordered, de-duplicated list of columns consolidation reads for a data type."""
+    cols = BHAV_COLUMNS.get(data_type, BHAV_COLUMNS['mcap'])
+    return list(dict.fromkeys([cols['symbol'], cols['value'], cols['name']]))
+
+
+def df_to_parquet_bytes(df):
+    """Serialize a bhavcopy DataFrame to compressed Parquet bytes."""
+    out = df.copy()
+    out.columns = [str(c).strip() for c in out.columns]
+    # Mixed-type object columns (e.g. '-' in numeric fields) break Arrow's type inference
+    for col in out.columns:
+        if out[col].dtype == 'object':
+            out[col] = out[col].astype('string')
+    buf = BytesIO()
+    out.to_parquet(buf, engine='pyarrow', compression='zstd', index=False)
+    return buf.getvalue()
+
+
+def read_parquet_bytes(data, columns=None):
+    """Decode Parquet bytes, reading only the requested columns when given."""
+    buf = BytesIO(data)
+    if columns:
+        available = _parquet_columns(data)
+        columns = [c for c in columns if c in available]
+    return pd.read_parquet(buf, engine='pyarrow', columns=columns or None)
+
+
+def _parquet_columns(data):
+    import pyarrow.parquet as pq
+    return set(pq.ParquetFile(BytesIO(data)).schema_arrow.names)
+
+
+class ColumnarBhavStore:
+    """
+    Local Parquet store laid out as <root>/<type>/<YYYY-MM-DD>.parquet.
+    Writes are atomic (temp file + rename) so concurrent range downloads are safe.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, date_iso, data_type):
+        return os.path.join(self.root_dir, data_type, f"{date_iso}.parquet")
+
+    def has(self, date_iso, data_type):
+        return os.path.exists(self._path(date_iso, data_type))
+
+    def write_bytes(self, date_iso, data_type, data):
+        """Persist already-encoded Parquet bytes for a date/type."""
+        path = self._path(date_iso, data_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return len(data)
+
+    def write(self, date_iso, data_type, df):
+        """Encode and persist a DataFrame. Returns the Parquet bytes written."""
+        data = df_to_parquet_bytes(df)
+        self.write_bytes(date_iso, data_type, data)
+        return data
+
+    def read(self, date_iso, data_type, columns=None):
+        path = self._path(date_iso, data_type)
+        if not os.path.exists(path):
+            return None
+        try:
+            if columns:
+                import pyarrow.parquet as pq
+                available = set(pq.ParquetFile(path).schema_arrow.names)
+                columns = [c for c in columns if c in available]
+            return pd.read_parquet(path, engine='pyarrow', columns=columns or None)
+        except Exception as exc:
+            print(f"⚠️ Corrupt columnar cache file {path}: {exc}")
+            self.delete(date_iso, data_type)
+            return None
+
+    def read_many(self, date_iso_list, data_type, columns=None):
+        """Read every locally available date. Returns {date_iso: DataFrame}."""
+        results = {}
+        for date_iso in date_iso_list:
+            df = self.read(date_iso, data_type, columns=columns)
+            if df is not None:
+                results[date_iso] = df
+        return results
+
+    def delete(self, date_iso, data_type):
+        try:
+            os.remove(self._path(date_iso, data_type))
+            return True
+        except OSError:
+            return False
+
+    def delete_before(self, cutoff_iso):
+        """Remove cached files older than cutoff (YYYY-MM-DD). Returns count removed."""
+        removed = 0
+        for data_type in os.listdir(self.root_dir):
+            type_dir = os.path.join(self.root_dir, data_type)
+            if not os.path.isdir(type_dir):
+                continue
+            for fname in os.listdir(type_dir):
+                if fname.endswith('.parquet') and fname[:-len('.parquet')] < cutoff_iso:
+                    try:
+                        os.remove(os.path.join(type_dir, fname))
+                        removed += 1
+                    except OSError:
+                        pass
+        return removed
+
+
+def main(argv=None):
+    """CLI entry point: `python columnar_cache.py migrate [--dry-run] [--batch-size N]`."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Columnar bhavcache utilities')
+    sub = parser.add_subparsers(dest='command')
+    migrate = sub.add_parser('migrate', help='Convert CSV bhavcache documents to Parquet')
+    migrate.add_argument('--dry-run', action='store_true', help='Report what would be converted')
+    migrate.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if args.command != 'migrate':
+        parser.print_help()
+        return 1
+
+    # Imported lazily: app.py owns the Mongo connection
+    from app import migrate_bhavcache_to_columnar
+    summary = migrate_bhavcache_to_columnar(batch_size=args.batch_size, dry_run=args.dry_run)
+    print(summary)
+    return 0 if not summary.get('errors') else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,23 +3,119 @@ import json
 import os
 import re
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
+from multiprocessing import shared_memory
 
 import xlsxwriter
 import numpy as np
 
 import pandas as pd
 
+from corporate_actions import CorporateActions
+from name_aliases import configure_alias_mapping, get_alias_table
+from name_index import get_name_index
+
+SUMMARY_SYMBOLS = {'TOTAL', 'LISTED', 'TOTALLISTED', 'LISTEDTOTAL'}
+
+# Per-process state of the process-pool loader, set once by _init_load_worker
+_worker_state = {}
+
+
+def _init_load_worker(columns, mcap_lookup, aliases):
+    _worker_state['columns'] = columns
+    _worker_state['mcap_lookup'] = mcap_lookup
+    # NameIndex.resolve reads learned aliases from the module-level table
+    configure_alias_mapping(aliases)
+
+
+def _load_file_to_shm(csv_file, date_str, date_idx):
+    """
+    Parse one CSV in a loader process. Rows go into a shared memory block laid
+    out as int32 file-local symbol codes followed by float64 value columns
+    (value[, free float]); only the block name, the file's symbol/company-name
+    vocabulary and the load stats are pickled back to the parent.
+    """
+    start = time.perf_counter()
+    cols = _worker_state['columns']
+    mcap_lookup = _worker_state['mcap_lookup']
+    meta = {'file': csv_file, 'rows': 0}
+    try:
+        df = pd.read_csv(csv_file)
+        df.columns = df.columns.str.strip()
+    except Exception:
+        return None, {**meta, 'status': 'error', 'reason': 'read failed', 'elapsed': time.perf_counter() - start}
+    value_cols = [c for c in (cols['value'], cols['free_float']) if c]
+    if any(c not in df.columns for c in [cols['symbol'], cols['name']] + value_cols):
+        return None, {**meta, 'status': 'skipped', 'reason': 'missing columns', 'elapsed': time.perf_counter() - start}
+
+    sym_upper = df[cols['symbol']].astype(str).str.upper()
+    sym_norm = sym_upper.str.replace(r'[^A-Z0-9]', '', regex=True)
+    df = df[~(sym_norm.isin(SUMMARY_SYMBOLS) | sym_upper.str.startswith(('TOTAL', 'LISTED')))]
+    after_summary_rows = len(df)
+
+    if mcap_lookup is not None:
+        symbols = mcap_lookup.resolve(df[cols['name']])
+        if cols['symbol'] != cols['name']:
+            symbols = symbols.combine_first(mcap_lookup.resolve(df[cols['symbol']]))
+        names = mcap_lookup.canonical_names(symbols).fillna(df[cols['name']])
+    else:
+        symbols = df[cols['symbol']].astype(str).str.strip()
+        names = df[cols['name']].astype(str).str.strip()
+    keep = symbols.notna().to_numpy()
+    if not keep.any():
+        return None, {**meta, 'status': 'empty after mapping', 'elapsed': time.perf_counter() - start}
+
+    codes, vocab = pd.factorize(symbols[keep])
+    vocab_names = np.empty(len(vocab), dtype=object)
+    vocab_names[codes] = names[keep].astype(str).to_numpy(dtype=object)  # last row per symbol wins
+
+    rows = len(codes)
+    shm = shared_memory.SharedMemory(create=True, size=rows * (4 + 8 * len(value_cols)))
+    try:
+        np.ndarray(rows, dtype=np.int32, buffer=shm.buf)[:] = codes
+        for i, col in enumerate(value_cols):
+            values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)[keep]
+            np.ndarray(rows, dtype=np.float64, buffer=shm.buf, offset=rows * (4 + 8 * i))[:] = values
+    finally:
+        shm.close()
+    block = {
+        'shm': shm.name, 'rows': rows, 'series': len(value_cols), 'date_idx': date_idx,
+        'symbols': vocab.tolist(), 'names': vocab_names.tolist()
+    }
+    return block, {
+        **meta, 'status': 'ok', 'rows': rows, 'elapsed': time.perf_counter() - start,
+        'details': {'after_summary_rows': after_summary_rows, 'date': date_str}
+    }
+
+
+def _read_shm_block(block):
+    """Copy a loader block out of shared memory (codes, [value columns]) and free it."""
+    shm = shared_memory.SharedMemory(name=block['shm'])
+    try:
+        rows = block['rows']
+        codes = np.ndarray(rows, dtype=np.int32, buffer=shm.buf).copy()
+        series = [
+            np.ndarray(rows, dtype=np.float64, buffer=shm.buf, offset=rows * (4 + 8 * i)).copy()
+            for i in range(block['series'])
+        ]
+    finally:
+        shm.close()
+        shm.unlink()
+    return codes, series
+
 
 class MarketCapConsolidator:
-    def __init__(self, data_folder, output_file='Finished_Product.xlsx', config_file='corporate_actions.json', file_type='mcap'):
+    def __init__(self, data_folder, output_file='Finished_Product.xlsx', config_file='corporate_actions.json', file_type='mcap', load_mode=None):
         self.data_folder = data_folder
         self.output_file = os.path.join(data_folder, output_file)
         self.config_file = os.path.join(data_folder, config_file)
         self.df_consolidated = None
+        self.ff_daily = None  # Symbol x date free float, kept only when corporate actions need it
         self.dates_list = []
         self.file_type = file_type  # 'mcap' or 'pr'
+        # 'thread' (default) or 'process': CSV parsing in a process pool, rows returned via shared memory
+        self.load_mode = load_mode or os.getenv('CONSOLIDATE_LOAD_MODE', 'thread')
         self.corporate_actions = self._load_corporate_actions()
         self._detect_columns()
 
@@ -59,7 +155,8 @@ class MarketCapConsolidator:
         return {
             "splits": [],
             "name_changes": [],
-            "delistings": []
+            "delistings": [],
+            "remaps": []
         }
 
     def _extract_date_from_filename(self, filename):
@@ -79,37 +176,22 @@ class MarketCapConsolidator:
         except Exception:
             return None
 
-    def _normalize_name(self, name):
-        if not isinstance(name, str):
-            name = str(name)
-        name = name.lower().strip()
-        name = re.sub(r'[^a-z0-9]+', ' ', name)
-        return name.strip()
-
     def _build_mcap_lookup(self):
-        lookup = {}
+        """Shared name index over the latest MCAP file's Security Name -> Symbol pairs (None if unavailable)."""
         pattern = os.path.join(self.data_folder, 'mcap*.csv')
         mcap_files = sorted(glob.glob(pattern))
         if not mcap_files:
-            return lookup
+            return None
 
         mcap_file = mcap_files[-1]
         try:
             df_mcap = pd.read_csv(mcap_file, usecols=['Security Name', 'Symbol'], dtype=str)
             df_mcap.columns = df_mcap.columns.str.strip()
             df_mcap = df_mcap.dropna(subset=['Security Name', 'Symbol'])
-            df_mcap['name_key'] = df_mcap['Security Name'].apply(self._normalize_name)
-            df_mcap['symbol_key'] = df_mcap['Symbol'].apply(self._normalize_name)
-
-            for name_key, symbol, sec_name in zip(df_mcap['name_key'], df_mcap['Symbol'], df_mcap['Security Name']):
-                if name_key and name_key not in lookup:
-                    lookup[name_key] = {'symbol': symbol, 'name': sec_name}
-            for symbol_key, symbol, sec_name in zip(df_mcap['symbol_key'], df_mcap['Symbol'], df_mcap['Security Name']):
-                if symbol_key and symbol_key not in lookup:
-                    lookup[symbol_key] = {'symbol': symbol, 'name': sec_name}
+            return get_name_index(df_mcap['Security Name'], df_mcap['Symbol'])
         except Exception as exc:
             print(f"Warning: could not read MCAP file {mcap_file}: {exc}")
-        return lookup
+        return None
 
     def load_and_consolidate_data(self):
         stage_start = time.perf_counter()
@@ -121,10 +203,13 @@ class MarketCapConsolidator:
 
         print(f"Found {len(csv_files)} {self.file_type.upper()} CSV files")
 
-        mcap_lookup = {}
+        mcap_lookup = None
         if self.file_type == 'pr':
             mcap_lookup = self._build_mcap_lookup()
-            print(f"Loaded {len(mcap_lookup)} MCAP security names for PR filtering")
+            print(f"Loaded {mcap_lookup.size if mcap_lookup else 0} MCAP security names for PR filtering")
+
+        if self.load_mode == 'process':
+            return self._load_with_processes(csv_files, mcap_lookup, stage_start)
 
         frames = []
         self.dates_list = []
@@ -157,18 +242,13 @@ class MarketCapConsolidator:
             if df_local.empty:
                 return None, date_str_local, {'file': csv_file, 'status': 'empty after summary filter', 'rows': 0, 'elapsed': time.perf_counter() - start}
 
-            if self.file_type == 'pr' and mcap_lookup:
-                sym_map = {k: v.get('symbol') for k, v in mcap_lookup.items() if v.get('symbol')}
-                name_map = {k: v.get('name') for k, v in mcap_lookup.items() if v.get('name')}
-
-                df_local['norm_name'] = df_local[self.name_col].astype(str).str.lower().str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
-                df_local['norm_symbol'] = df_local[self.symbol_col].astype(str).str.lower().str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
-
-                mapped_symbol = df_local['norm_name'].map(sym_map).combine_first(df_local['norm_symbol'].map(sym_map))
-                mapped_name = df_local['norm_name'].map(name_map).combine_first(df_local['norm_symbol'].map(name_map)).fillna(df_local[self.name_col])
+            if self.file_type == 'pr' and mcap_lookup is not None and mcap_lookup.size:
+                mapped_symbol = mcap_lookup.resolve(df_local[self.name_col])
+                if self.symbol_col != self.name_col:
+                    mapped_symbol = mapped_symbol.combine_first(mcap_lookup.resolve(df_local[self.symbol_col]))
 
                 df_local['Symbol'] = mapped_symbol
-                df_local['Company Name'] = mapped_name
+                df_local['Company Name'] = mcap_lookup.canonical_names(mapped_symbol).fillna(df_local[self.name_col])
                 df_local = df_local[df_local['Symbol'].notna()]
             else:
                 df_local['Symbol'] = df_local[self.symbol_col].astype(str).str.strip()
@@ -203,19 +283,7 @@ class MarketCapConsolidator:
             for future in as_completed(future_map):
                 df_local, date_str_local, meta = future.result()
                 if meta:
-                    status = meta.get('status', 'unknown')
-                    rows = meta.get('rows', 0)
-                    elapsed = meta.get('elapsed', 0)
-                    fname = os.path.basename(meta.get('file', ''))
-                    reason = meta.get('reason', '')
-                    details = meta.get('details', {})
-                    if status == 'ok':
-                        extra = f" date={details.get('date','')} after_summary_rows={details.get('after_summary_rows', rows)}"
-                        print(f"[worker] {fname}: {rows} rows in {elapsed:.2f}s{extra}")
-                    elif reason:
-                        print(f"[worker] {fname}: {status} ({reason}) in {elapsed:.2f}s")
-                    else:
-                        print(f"[worker] {fname}: {status} in {elapsed:.2f}s")
+                    self._log_load_meta(meta)
                 if date_str_local:
                     self.dates_list.append((date_str_local, self._parse_date_string(date_str_local)))
                 if df_local is not None and not df_local.empty:
@@ -246,30 +314,111 @@ class MarketCapConsolidator:
             # Add prefix to FF columns to avoid collision if necessary, but we only need the average
             ff_avg = pivot_ff[sorted_dates].mean(axis=1)
             pivot[self.avg_ff_col] = ff_avg
+            if CorporateActions(self.corporate_actions):
+                self.ff_daily = pivot_ff[['Symbol'] + sorted_dates]
 
         name_lookup = df_all.dropna(subset=['Company Name']).drop_duplicates(subset=['Symbol'], keep='last').set_index('Symbol')['Company Name'].to_dict()
+        return self._finish_pivot(pivot, name_lookup, merge_start)
+
+    def _log_load_meta(self, meta):
+        status = meta.get('status', 'unknown')
+        rows = meta.get('rows', 0)
+        elapsed = meta.get('elapsed', 0)
+        fname = os.path.basename(meta.get('file', ''))
+        reason = meta.get('reason', '')
+        details = meta.get('details', {})
+        if status == 'ok':
+            extra = f" date={details.get('date','')} after_summary_rows={details.get('after_summary_rows', rows)}"
+            print(f"[worker] {fname}: {rows} rows in {elapsed:.2f}s{extra}")
+        elif reason:
+            print(f"[worker] {fname}: {status} ({reason}) in {elapsed:.2f}s")
+        else:
+            print(f"[worker] {fname}: {status} in {elapsed:.2f}s")
+
+    def _load_with_processes(self, csv_files, mcap_lookup, stage_start):
+        """
+        Process-pool variant of the CSV load: workers get the column names and the
+        PR name index once (pool initializer) and hand rows back as shared memory
+        blocks of (symbol code, value) for their file's date index; the parent
+        writes them straight into a symbol x date matrix instead of concat + pivot.
+        """
+        dated = []
+        for csv_file in csv_files:
+            date_str = self._extract_date_from_filename(os.path.basename(csv_file))
+            if not date_str or self._parse_date_string(date_str) is None:
+                self._log_load_meta({'file': csv_file, 'status': 'skipped', 'reason': 'no date'})
+                continue
+            dated.append((csv_file, date_str))
+        self.dates_list = sorted({(d, self._parse_date_string(d)) for _, d in dated}, key=lambda x: x[1])
+        sorted_dates = [d[0] for d in self.dates_list]
+        date_pos = {d: i for i, d in enumerate(sorted_dates)}
+
+        columns = {
+            'symbol': self.symbol_col,
+            'name': self.name_col,
+            'value': self.value_col,
+            'free_float': self.free_float_col if self.file_type == 'mcap' else None
+        }
+        lookup = mcap_lookup if self.file_type == 'pr' and mcap_lookup is not None and mcap_lookup.size else None
+        aliases = dict(get_alias_table().mapping()) if lookup is not None else {}
+
+        workers = min(os.cpu_count() or 2, max(1, len(dated)))
+        print(f"Loading CSVs with {workers} processes...")
+        blocks = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_load_worker, initargs=(columns, lookup, aliases)) as executor:
+            futures = [executor.submit(_load_file_to_shm, csv_file, date_str, date_pos[date_str]) for csv_file, date_str in dated]
+            for future in as_completed(futures):
+                block, meta = future.result()
+                self._log_load_meta(meta)
+                if block is not None:
+                    block['codes'], block['values'] = _read_shm_block(block)
+                    blocks.append(block)
+
+        print(f"Loaded CSVs in {time.perf_counter() - stage_start:.2f}s; merging...")
+        merge_start = time.perf_counter()
+        if not blocks:
+            print("No symbols found after processing files")
+            return 0, len(sorted_dates)
+
+        # File-local codes -> one global symbol code space; later dates win the company name
+        blocks.sort(key=lambda b: b['date_idx'])
+        code_of = {}
+        for block in blocks:
+            to_global = np.fromiter(
+                (code_of.setdefault(sym, len(code_of)) for sym in block['symbols']),
+                dtype=np.int32, count=len(block['symbols'])
+            )
+            block['codes'] = to_global[block['codes']]
+            block['to_global'] = to_global
+        names = np.empty(len(code_of), dtype=object)
+        matrix = np.full((len(code_of), len(sorted_dates)), np.nan)
+        ff_matrix = np.full_like(matrix, np.nan) if self.file_type == 'mcap' else None
+        for block in blocks:
+            names[block['to_global']] = block['names']
+            matrix[block['codes'], block['date_idx']] = block['values'][0]
+            if ff_matrix is not None:
+                ff_matrix[block['codes'], block['date_idx']] = block['values'][1]
+
+        used = sorted({block['date_idx'] for block in blocks})
+        pivot = pd.DataFrame(matrix[:, used], columns=[sorted_dates[i] for i in used])
+        pivot.insert(0, 'Symbol', list(code_of))
+        if ff_matrix is not None:
+            pivot[self.avg_ff_col] = pd.DataFrame(ff_matrix[:, used]).mean(axis=1)
+            if CorporateActions(self.corporate_actions):
+                self.ff_daily = pd.DataFrame(ff_matrix[:, used], columns=[sorted_dates[i] for i in used])
+                self.ff_daily.insert(0, 'Symbol', list(code_of))
+        return self._finish_pivot(pivot, dict(zip(code_of, names)), merge_start)
+
+    def _finish_pivot(self, pivot, name_lookup, merge_start):
+        """Company names, summary columns, column order and sort for a Symbol x date pivot."""
         pivot['Company Name'] = pivot['Symbol'].map(name_lookup).fillna(pivot['Symbol'])
 
         date_cols = [c for c in pivot.columns if isinstance(c, str) and re.match(r"\d{2}-\d{2}-\d{4}", c)]
         date_cols = sorted(date_cols, key=lambda d: datetime.strptime(d, '%d-%m-%Y'))
 
-        numeric_dates = pivot[date_cols].apply(pd.to_numeric, errors='coerce') if date_cols else pd.DataFrame()
-        pivot[self.days_col] = numeric_dates.count(axis=1) if not numeric_dates.empty else 0
-        pivot[self.avg_col] = numeric_dates.mean(axis=1) if not numeric_dates.empty else None
-        
-        # Non Zero Days: count of days where value > 0 (actually traded, not just present)
-        pivot[self.non_zero_days_col] = (numeric_dates > 0).sum(axis=1) if not numeric_dates.empty else 0
-        
-        # Calculate Total Possible Trading Days (from first appearance to end of range)
-        if not numeric_dates.empty:
-            # Find the first index (0-based) where data is not NaN for each symbol
-            first_appearance_idx = numeric_dates.notna().values.argmax(axis=1)
-            pivot['total_possible_days'] = len(date_cols) - first_appearance_idx
-        else:
-            pivot['total_possible_days'] = 0
+        self._fill_summary_columns(pivot, date_cols)
 
         if self.file_type == 'mcap':
-            pivot[self.avg_ff_col] = ff_avg
             columns_order = ['Symbol', 'Company Name', self.days_col, self.non_zero_days_col, 'total_possible_days', self.avg_col, self.avg_ff_col] + date_cols
         else:
             columns_order = ['Symbol', 'Company Name', self.days_col, self.non_zero_days_col, 'total_possible_days', self.avg_col] + date_cols
@@ -284,6 +433,33 @@ class MarketCapConsolidator:
         print(f"\nConsolidated data: {companies_count} companies across {dates_count} dates (merge/pivot in {time.perf_counter() - merge_start:.2f}s)")
         return companies_count, dates_count
 
+    def _fill_summary_columns(self, frame, date_cols):
+        """Days with data, average, non-zero days and total possible days from the date columns."""
+        numeric_dates = frame[date_cols].apply(pd.to_numeric, errors='coerce') if date_cols else pd.DataFrame()
+        frame[self.days_col] = numeric_dates.count(axis=1) if not numeric_dates.empty else 0
+        frame[self.avg_col] = numeric_dates.mean(axis=1) if not numeric_dates.empty else None
+        
+        # Non Zero Days: count of days where value > 0 (actually traded, not just present)
+        frame[self.non_zero_days_col] = (numeric_dates > 0).sum(axis=1) if not numeric_dates.empty else 0
+        
+        # Calculate Total Possible Trading Days (from first appearance to end of range)
+        if not numeric_dates.empty:
+            # Find the first index (0-based) where data is not NaN for each symbol
+            first_appearance_idx = numeric_dates.notna().values.argmax(axis=1)
+            frame['total_possible_days'] = len(date_cols) - first_appearance_idx
+        else:
+            frame['total_possible_days'] = 0
+
+    def _fill_average_free_float(self, frame, actions, date_cols):
+        """Average Free Float after corporate actions: the same actions run on the daily FF values."""
+        if self.ff_daily is None:
+            # no daily FF kept (frame built elsewhere): blank rather than show the pre-action average
+            frame.loc[frame['Symbol'].isin(actions.symbols()), self.avg_ff_col] = np.nan
+            return
+        ff, _ = actions.apply(self.ff_daily)
+        ff_avg = ff.set_index('Symbol')[[c for c in date_cols if c in ff.columns]].mean(axis=1)
+        frame[self.avg_ff_col] = frame['Symbol'].map(ff_avg)
+
     def apply_corporate_actions(self):
         if self.df_consolidated is None:
             return
@@ -291,35 +467,20 @@ class MarketCapConsolidator:
         print("\nApplying corporate actions...")
         start = time.perf_counter()
 
-        for split in self.corporate_actions.get('splits', []):
-            old_symbol = split.get('old_symbol', '').strip()
-            split_date = split.get('split_date', '')
-            if old_symbol not in self.df_consolidated['Symbol'].values:
-                continue
-            date_columns = [col for col in self.df_consolidated.columns if col not in ['Symbol', 'Company Name']]
-            split_dt = self._parse_date_string(split_date)
-            if not split_dt:
-                continue
-            for date_col in date_columns:
-                col_dt = self._parse_date_string(date_col)
-                if col_dt and col_dt < split_dt:
-                    self.df_consolidated.loc[self.df_consolidated['Symbol'] == old_symbol, date_col] = None
-
-        for change in self.corporate_actions.get('name_changes', []):
-            old_symbol = change.get('old_symbol', '').strip()
-            change_date = change.get('change_date', '')
-            if old_symbol not in self.df_consolidated['Symbol'].values:
-                continue
-            date_columns = [col for col in self.df_consolidated.columns if col not in ['Symbol', 'Company Name']]
-            change_dt = self._parse_date_string(change_date)
-            if not change_dt:
-                continue
-            for date_col in date_columns:
-                col_dt = self._parse_date_string(date_col)
-                if col_dt and col_dt < change_dt:
-                    self.df_consolidated.loc[self.df_consolidated['Symbol'] == old_symbol, date_col] = None
+        actions = CorporateActions(self.corporate_actions)
+        df, stats = actions.apply(self.df_consolidated)
+        if stats['remapped'] or stats['blanked_cells']:
+            # Averages and day counts follow the stitched/blanked history
+            date_cols = [d[0] for d in self.dates_list if d[0] in df.columns]
+            self._fill_summary_columns(df, date_cols)
+            if self.file_type == 'mcap':
+                self._fill_average_free_float(df, actions, date_cols)
+            df = df.sort_values(by=self.avg_col, ascending=False, na_position='last').reset_index(drop=True)
+        self.df_consolidated = df
 
-        print(f"Corporate actions done in {time.perf_counter() - start:.2f}s")
+        print(f"Corporate actions: {stats['remapped']} remapped ({stats['stitched_cells']} days stitched), "
+              f"{stats['blanked_cells']} values blanked, {stats['skipped']} incomplete entries skipped "
+              f"in {time.perf_counter() - start:.2f}s")
 
     def format_excel_output(self, output_file=None):
         if output_file:
@@ -452,6 +613,14 @@ class MarketCapConsolidator:
                         "delisting_date": "DD-MM-YYYY",
                         "description": "Company delisted - blank from this date onwards"
                     }
+                ],
+                "remaps": [
+                    {
+                        "old_symbol": "MERGED",
+                        "new_symbol": "SURVIVOR",
+                        "effective_date": "DD-MM-YYYY",
+                        "description": "Rename/merger - old history before this date fills the new symbol's missing days"
+                    }
                 ]
             }
             with open(self.config_file, 'w') as f:
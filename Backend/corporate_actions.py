@@ -0,0 +1,136 @@
+"""
+Corporate actions for consolidated symbol x date frames
+Applies the splits / name changes / delistings / remaps from
+corporate_actions.json to a consolidated frame (one row per symbol, one
+DD-MM-YYYY column per trading day) in a few array operations. Column dates
+are parsed once; blanking actions are folded into a single symbol x date mask
+and remaps (old -> new for renames and mergers) stitch the old symbol's
+history into the new row instead of blanking it.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+DATE_FORMAT = '%d-%m-%Y'
+DATE_COLUMN_RE = re.compile(r'^\d{2}-\d{2}-\d{4}$')
+
+
+def _symbol(value):
+    return str(value or '').strip()
+
+
+def _date(value):
+    """datetime64 for a DD-MM-YYYY string, or None when missing/unparseable."""
+    parsed = pd.to_datetime(value, format=DATE_FORMAT, errors='coerce') if value else pd.NaT
+    return None if pd.isna(parsed) else np.datetime64(parsed, 'D')
+
+
+class CorporateActions:
+    def __init__(self, config):
+        """
+        Args:
+            config: corporate_actions.json content:
+                splits        [{old_symbol, split_date}]        old symbol blanked before the date
+                name_changes  [{old_symbol, new_symbol, change_date, remap?}]
+                              blanked before the date, or remapped when remap is true
+                delistings    [{symbol, delisting_date}]        blanked from the date onwards
+                remaps        [{old_symbol, new_symbol, effective_date?}]
+                              old history (before the date, all of it when omitted)
+                              fills the new symbol's missing days; the old row is dropped
+        """
+        config = config or {}
+        self.blank_before = []   # (symbol, cutoff)
+        self.blank_from = []     # (symbol, cutoff)
+        self.remaps = []         # (old, new, cutoff or None)
+        self.skipped = 0
+
+        for split in config.get('splits', []):
+            self._add(self.blank_before, split.get('old_symbol'), split.get('split_date'))
+        for change in config.get('name_changes', []):
+            if change.get('remap'):
+                self._add_remap(change.get('old_symbol'), change.get('new_symbol'), change.get('change_date'))
+            else:
+                self._add(self.blank_before, change.get('old_symbol'), change.get('change_date'))
+        for delisting in config.get('delistings', []):
+            self._add(self.blank_from, delisting.get('symbol'), delisting.get('delisting_date'))
+        for remap in config.get('remaps', []):
+            self._add_remap(remap.get('old_symbol'), remap.get('new_symbol'), remap.get('effective_date'), optional_date=True)
+
+    def _add(self, target, symbol, date_str):
+        symbol, cutoff = _symbol(symbol), _date(date_str)
+        if symbol and cutoff is not None:
+            target.append((symbol, cutoff))
+        else:
+            # template placeholders ('DD-MM-YYYY') and incomplete entries
+            self.skipped += 1
+
+    def _add_remap(self, old, new, date_str, optional_date=False):
+        old, new, cutoff = _symbol(old), _symbol(new), _date(date_str)
+        if old and new and old != new and (cutoff is not None or (optional_date and not date_str)):
+            self.remaps.append((old, new, cutoff))
+        else:
+            self.skipped += 1
+
+    def __bool__(self):
+        return bool(self.blank_before or self.blank_from or self.remaps)
+
+    def symbols(self):
+        """Every symbol an action can change (blanked rows, remap sources and targets)."""
+        touched = {sym for sym, _ in self.blank_before + self.blank_from}
+        for old, new, _ in self.remaps:
+            touched.update((old, new))
+        return touched
+
+    def apply(self, df, symbol_col='Symbol'):
+        """
+        Return (frame, stats). Only DD-MM-YYYY columns are touched; remapped old
+        rows are dropped. The caller recomputes any per-row summary columns.
+        """
+        stats = {'remapped': 0, 'stitched_cells': 0, 'blanked_cells': 0, 'skipped': self.skipped}
+        date_cols = [c for c in df.columns if isinstance(c, str) and DATE_COLUMN_RE.match(c)]
+        if df.empty or not date_cols or not self:
+            return df, stats
+
+        col_dates = pd.to_datetime(pd.Index(date_cols), format=DATE_FORMAT, errors='coerce').values.astype('datetime64[D]')
+        values = df[date_cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float, copy=True)
+        symbols = df[symbol_col].astype(str).str.strip().to_numpy(dtype=object, copy=True)
+        row_of = {sym: i for i, sym in enumerate(symbols)}
+        keep = np.ones(len(symbols), dtype=bool)
+
+        # Remaps run in config order so chains (A -> B, B -> C) end on C
+        for old, new, cutoff in self.remaps:
+            o = row_of.pop(old, None)
+            if o is None:
+                continue
+            n = row_of.get(new)
+            window = np.ones(len(date_cols), dtype=bool) if cutoff is None else col_dates < cutoff
+            if n is None:
+                # new symbol not listed in this range yet: carry the old row under the new ticker
+                symbols[o] = new
+                row_of[new] = o
+            else:
+                take = window & np.isnan(values[n]) & ~np.isnan(values[o])
+                values[n, take] = values[o, take]
+                keep[o] = False
+                stats['stitched_cells'] += int(take.sum())
+            stats['remapped'] += 1
+
+        # Every blanking action folded into one symbol x date mask
+        mask = np.zeros(values.shape, dtype=bool)
+        for actions, before in ((self.blank_before, True), (self.blank_from, False)):
+            hits = [(row_of[sym], cutoff) for sym, cutoff in actions if sym in row_of]
+            if not hits:
+                continue
+            rows = np.fromiter((r for r, _ in hits), dtype=np.intp, count=len(hits))
+            cutoffs = np.array([c for _, c in hits], dtype='datetime64[D]')[:, None]
+            window = col_dates[None, :] < cutoffs if before else col_dates[None, :] >= cutoffs
+            np.logical_or.at(mask, rows, window)
+        stats['blanked_cells'] = int((mask & ~np.isnan(values)).sum())
+        values[mask] = np.nan
+
+        out = df.copy()
+        out[symbol_col] = symbols
+        out[date_cols] = values
+        return out[keep].reset_index(drop=True), stats
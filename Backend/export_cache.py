@@ -0,0 +1,268 @@
+"""
+Content-addressed cache for consolidate-saved export results
+An entry is keyed by the output-determining request parameters plus a
+fingerprint of the cached bhavcopy versions for the requested dates, so a
+repeat export is a file copy instead of a full consolidation. Entries are
+evicted least-recently-used once their total size exceeds max_bytes, and
+dropped as soon as any date they cover is re-downloaded.
+
+The directory is shared by every worker process: changes happen under a
+flock on `.lock` and bump a counter in `.version`; a process whose in-memory
+index is behind that counter re-scans the directory, and eviction always
+re-scans first so the size limit holds across processes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: threads within one process are still serialized
+    fcntl = None
+
+PART_MAX_AGE_SECONDS = 6 * 3600  # .part/.tmp files older than this are leftovers of a crashed write
+
+
+class ExportResultCache:
+    def __init__(self, root_dir, max_bytes=2 * 1024 ** 3):
+        """
+        Args:
+            root_dir: directory holding <key>.bin result files and <key>.json metadata
+            max_bytes: total size of result files kept before LRU eviction
+        """
+        self.root_dir = root_dir
+        self.max_bytes = int(max_bytes)
+        os.makedirs(root_dir, exist_ok=True)
+        self._entries = OrderedDict()  # key -> meta, least recently used first
+        self._total_bytes = 0
+        self._version = None           # .version counter the in-memory index reflects
+        self._lock = threading.Lock()
+        self._lock_path = os.path.join(root_dir, '.lock')
+        self._version_path = os.path.join(root_dir, '.version')
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0, 'invalidated': 0, 'rescans': 0}
+        with self._locked():
+            pass
+
+    # ----- storage -----
+    def _paths(self, key):
+        return os.path.join(self.root_dir, f"{key}.bin"), os.path.join(self.root_dir, f"{key}.json")
+
+    @contextmanager
+    def _locked(self, rescan=False):
+        """
+        Thread lock plus an exclusive flock on the directory, with the in-memory
+        index brought up to date. The lock file is opened per call so forked
+        workers never share one open file description.
+        """
+        with self._lock:
+            lock_file = open(self._lock_path, 'a+') if fcntl is not None else None
+            try:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                version = self._read_version()
+                if rescan or version != self._version:
+                    self._load()
+                    self._version = version
+                yield
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def _read_version(self):
+        try:
+            with open(self._version_path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _bump_version(self):
+        """Tell other processes the entry set changed (caller holds the lock)."""
+        self._version = self._read_version() + 1
+        fd, tmp = tempfile.mkstemp(dir=self.root_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(self._version))
+        os.replace(tmp, self._version_path)
+
+    def _load(self):
+        """Rebuild the index from the directory (caller holds the lock)."""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.root_dir):
+            if name.endswith(('.part', '.tmp')):
+                # left behind by an interrupted write; younger ones may be another process's write in flight
+                path = os.path.join(self.root_dir, name)
+                try:
+                    if now - os.path.getmtime(path) > PART_MAX_AGE_SECONDS:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not name.endswith('.json'):
+                continue
+            key = name[:-5]
+            data_path, meta_path = self._paths(key)
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                meta['size_bytes'] = os.path.getsize(data_path)
+                entries.append(meta)
+            except Exception:
+                self._remove_files(key)
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        for meta in sorted(entries, key=lambda m: m.get('last_access') or ''):
+            self._entries[meta['key']] = meta
+            self._total_bytes += meta['size_bytes']
+        self.stats['rescans'] += 1
+
+    def _write_meta(self, meta):
+        _, meta_path = self._paths(meta['key'])
+        fd, tmp = tempfile.mkstemp(dir=self.root_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f, default=str)
+        os.replace(tmp, meta_path)
+
+    def _remove_files(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _drop(self, key):
+        """Forget an entry (caller holds the lock)."""
+        meta = self._entries.pop(key, None)
+        if meta:
+            self._total_bytes -= meta['size_bytes']
+            self._remove_files(key)
+        return meta
+
+    # ----- keys -----
+    @staticmethod
+    def make_key(params, fingerprint):
+        """sha256 over the canonical JSON of the request parameters and data fingerprint."""
+        blob = json.dumps({'params': params, 'data': fingerprint}, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def mapping_fingerprint(mapping):
+        """Short content hash of a lookup dict (name map, alias table) for make_key fingerprints."""
+        items = sorted((str(k), str(v)) for k, v in dict(mapping or {}).items())
+        return hashlib.sha256(json.dumps(items).encode('utf-8')).hexdigest()[:16]
+
+    # ----- access -----
+    def get(self, key):
+        """Return the entry's metadata (with 'path') and mark it recently used, else None."""
+        with self._locked():
+            meta = self._entries.get(key)
+            if meta is None:
+                self.stats['misses'] += 1
+                return None
+            data_path, _ = self._paths(key)
+            if not os.path.exists(data_path):
+                self._drop(key)
+                self._bump_version()
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            meta['last_access'] = datetime.now().isoformat()
+            meta['hits'] = meta.get('hits', 0) + 1
+            self.stats['hits'] += 1
+            snapshot = dict(meta)
+            # access time lands in the entry's json (read by the next re-scan); no version bump needed
+            try:
+                self._write_meta(snapshot)
+            except Exception as exc:
+                print(f"⚠️ Export cache access time not saved for {key[:12]}: {exc}")
+        return {**snapshot, 'path': data_path}
+
+    @contextmanager
+    def writer(self, key, filename, mimetype, dates, summary=None):
+        """
+        Open a file for a new entry; it is committed when the block exits cleanly
+        and discarded on error (e.g. a client that disconnects mid-stream).
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.root_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                yield fh
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._commit(key, tmp, filename, mimetype, dates, summary)
+
+    def put_file(self, key, src_path, filename, mimetype, dates, summary=None):
+        """Copy an already-written result file into the cache."""
+        fd, tmp = tempfile.mkstemp(dir=self.root_dir, suffix='.part')
+        os.close(fd)
+        shutil.copyfile(src_path, tmp)
+        self._commit(key, tmp, filename, mimetype, dates, summary)
+
+    def _commit(self, key, tmp_path, filename, mimetype, dates, summary):
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            os.remove(tmp_path)
+            return None
+        now_iso = datetime.now().isoformat()
+        meta = {
+            'key': key,
+            'filename': filename,
+            'mimetype': mimetype,
+            'dates': sorted(dates),
+            'summary': summary or {},
+            'size_bytes': size,
+            'created_at': now_iso,
+            'last_access': now_iso,
+            'hits': 0
+        }
+        data_path, _ = self._paths(key)
+        # re-scan: other processes' entries and access times count towards the limit
+        with self._locked(rescan=True):
+            self._drop(key)
+            os.replace(tmp_path, data_path)
+            self._write_meta(meta)
+            self._entries[key] = meta
+            self._total_bytes += size
+            self.stats['stored'] += 1
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.stats['evicted'] += 1
+            self._bump_version()
+        return meta
+
+    def invalidate_dates(self, date_iso_list):
+        """Drop every entry whose date range includes one of the given dates."""
+        changed = set(date_iso_list)
+        with self._locked():
+            stale = [key for key, meta in self._entries.items() if changed.intersection(meta.get('dates') or [])]
+            for key in stale:
+                self._drop(key)
+            if stale:
+                self._bump_version()
+            self.stats['invalidated'] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._locked():
+            for key in list(self._entries):
+                self._drop(key)
+            self._bump_version()
+
+    def get_stats(self):
+        with self._locked():
+            return {
+                **self.stats,
+                'entries': len(self._entries),
+                'total_mb': round(self._total_bytes / 1024 / 1024, 2),
+                'max_mb': round(self.max_bytes / 1024 / 1024, 2)
+            }
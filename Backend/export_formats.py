@@ -0,0 +1,151 @@
+"""
+Streaming machine-readable exports for consolidated MCAP / PR sheets
+Writes the consolidated frames straight into the HTTP response as gzip CSV,
+Parquet or an Arrow IPC stream, chunk by chunk, so scripts and notebooks get
+their data without waiting for an xlsx build or a temp file in work_dir.
+When several sheets are exported they are packed as members of a streamed zip.
+"""
+
+import gzip
+import io
+import zipfile
+
+from columnar_cache import parquet_available
+
+# output_format -> (file extension, mimetype, needs pyarrow)
+EXPORT_FORMATS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', False),
+    'csv.gz': ('csv.gz', 'application/gzip', False),
+    'parquet': ('parquet', 'application/vnd.apache.parquet', True),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.stream', True),
+}
+ROWS_PER_CHUNK = 5000
+
+
+def validate_output_format(output_format):
+    """Return an error message for an unusable output_format, else None."""
+    if output_format not in EXPORT_FORMATS:
+        return f"Invalid output_format ({', '.join(EXPORT_FORMATS)})"
+    if EXPORT_FORMATS[output_format][2] and not parquet_available():
+        return f"output_format '{output_format}' requires pyarrow on the server"
+    return None
+
+
+def export_filename(date_label, output_format, sheet_names):
+    """Download name: the bare file for one sheet, a zip of members for several."""
+    ext = EXPORT_FORMATS[output_format][0]
+    if len(sheet_names) == 1:
+        return f"{sheet_names[0]}_{date_label}.{ext}"
+    return f"Market_Data_{date_label}.{ext}.zip"
+
+
+def export_mimetype(output_format, sheet_names):
+    return EXPORT_FORMATS[output_format][1] if len(sheet_names) == 1 else 'application/zip'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable file object whose bytes are drained by the response generator."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_table(df, schema=None):
+    import pyarrow as pa
+    out = df.copy()
+    out.columns = [str(c) for c in out.columns]
+    for col in ('Symbol', 'Company Name'):
+        if col in out.columns:
+            out[col] = out[col].astype('string')
+    return pa.Table.from_pandas(out, schema=schema, preserve_index=False)
+
+
+def _write_frame(df, output_format, fileobj, sheet_name, rows_per_chunk):
+    """
+    Serialize df into fileobj one row chunk at a time.
+    Generator: yields after each chunk so the caller can flush what was written.
+    """
+    if output_format == 'csv.gz':
+        with gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=6) as gz:
+            text = io.TextIOWrapper(gz, encoding='utf-8', newline='')
+            for start in range(0, max(len(df), 1), rows_per_chunk):
+                df.iloc[start:start + rows_per_chunk].to_csv(text, index=False, header=start == 0)
+                text.flush()
+                yield
+            text.detach()
+        yield
+        return
+
+    import pyarrow as pa
+    first = _arrow_table(df.iloc[:rows_per_chunk])
+    schema = first.schema.with_metadata({**(first.schema.metadata or {}), b'sheet': sheet_name.encode()})
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(fileobj, schema, compression='zstd')
+        write = writer.write_table
+    else:
+        writer = pa.ipc.new_stream(fileobj, schema)
+        write = writer.write_table
+    try:
+        write(first.replace_schema_metadata(schema.metadata))
+        yield
+        for start in range(rows_per_chunk, len(df), rows_per_chunk):
+            write(_arrow_table(df.iloc[start:start + rows_per_chunk], schema=schema))
+            yield
+    finally:
+        writer.close()
+    yield
+
+
+def stream_sheets(sheets, output_format, rows_per_chunk=ROWS_PER_CHUNK):
+    """
+    Yield the encoded bytes of {sheet_name: DataFrame} in output_format.
+    One sheet is streamed as a bare file; several become stored members of a zip
+    (already compressed formats gain nothing from deflate).
+    """
+    sink = _ChunkSink()
+    ext = EXPORT_FORMATS[output_format][0]
+    if len(sheets) == 1:
+        sheet_name, df = next(iter(sheets.items()))
+        for _ in _write_frame(df, output_format, sink, sheet_name, rows_per_chunk):
+            data = sink.drain()
+            if data:
+                yield data
+        return
+
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for sheet_name, df in sheets.items():
+            with zf.open(f"{sheet_name}.{ext}", mode='w', force_zip64=True) as member:
+                for _ in _write_frame(df, output_format, member, sheet_name, rows_per_chunk):
+                    data = sink.drain()
+                    if data:
+                        yield data
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def write_sheets(sheets, output_format, path, rows_per_chunk=ROWS_PER_CHUNK):
+    """Write the same stream to a file (background export jobs keep results on disk)."""
+    with open(path, 'wb') as fh:
+        for data in stream_sheets(sheets, output_format, rows_per_chunk):
+            fh.write(data)
+    return path
@@ -0,0 +1,295 @@
+"""
+Background job queue for long-running exports
+Jobs run on a local worker pool; their state lives in a persistent job table
+(Mongo collection, or in-process dict when the DB is unavailable) so clients
+can poll progress and download the result after the HTTP request has returned.
+
+Several processes (gunicorn workers, hosts) share the job table: every job
+records its owner (host, pid, per-process token) and the owner refreshes a
+heartbeat while the job is queued or running. Only jobs whose heartbeat went
+stale are failed as interrupted, never jobs of a live sibling process.
+"""
+
+import os
+import shutil
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from memory_optimized_export import get_memory_usage_mb
+
+HEARTBEAT_SECONDS = 30
+STALE_AFTER_SECONDS = 4 * HEARTBEAT_SECONDS  # a few missed beats before a job counts as orphaned
+ACTIVE_STATUSES = ['queued', 'running']
+
+
+class JobContext:
+    """Handle passed to a running job for progress, logs and result storage."""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+        self._peak_memory = 0.0
+        self._last_percentage = -1
+
+    def progress(self, stage, percentage, message=None):
+        memory_mb = get_memory_usage_mb()
+        self._peak_memory = max(self._peak_memory, memory_mb)
+        percentage = int(max(0, min(100, percentage)))
+        # Skip redundant writes from tight loops (e.g. per-chunk Excel progress)
+        if percentage == self._last_percentage and not message:
+            return
+        self._last_percentage = percentage
+        fields = {
+            'stage': stage,
+            'percentage': percentage,
+            'memory_mb': round(memory_mb, 1),
+            'peak_memory_mb': round(self._peak_memory, 1),
+            'updated_at': datetime.now().isoformat()
+        }
+        if message:
+            fields['message'] = message
+        self.queue._update(self.job_id, fields)
+
+    def log(self, message):
+        print(f"[job {self.job_id[:8]}] {message}")
+        self.queue._push_log(self.job_id, message)
+
+    def store_result(self, path, filename, mimetype, summary=None):
+        """
+        Move the produced file into the queue's result directory, and upload it
+        to the shared result store (when configured) so any process can serve it.
+        """
+        dest_dir = os.path.join(self.queue.result_dir, self.job_id)
+        os.makedirs(dest_dir, exist_ok=True)
+        dest = os.path.join(dest_dir, filename)
+        shutil.move(path, dest)
+        result = {
+            'path': dest,
+            'host': socket.gethostname(),
+            'filename': filename,
+            'mimetype': mimetype,
+            'size_bytes': os.path.getsize(dest),
+            'summary': summary or {}
+        }
+        if self.queue.result_store is not None:
+            try:
+                artifact = self.queue.result_store.put_file(
+                    dest, filename, mimetype, metadata={'kind': 'export_job', 'job_id': self.job_id},
+                    ttl_hours=self.queue.result_ttl.total_seconds() / 3600
+                )
+                result['artifact_id'] = artifact['id']
+            except Exception as exc:
+                self.log(f"⚠️ Result not uploaded to the shared store: {exc}")
+        self.queue._update(self.job_id, {'result': result})
+
+
+class JobQueue:
+    def __init__(self, jobs_collection=None, max_workers=2, result_dir=None, result_ttl_hours=24, result_store=None):
+        """
+        Args:
+            jobs_collection: job table (`export_jobs`); None keeps jobs in this process only
+            result_store: artifact store results are also uploaded to, for processes
+                that don't share result_dir (None: results stay on local disk)
+        """
+        self.collection = jobs_collection
+        self.result_dir = result_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'job_results')
+        self.result_ttl = timedelta(hours=result_ttl_hours)
+        self.result_store = result_store
+        os.makedirs(self.result_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export-job')
+        self._memory_jobs = {}
+        self._lock = threading.Lock()
+        self._owner = None          # this process's owner stamp, made lazily (forked workers get their own)
+        self._heartbeat_pid = None  # pid the heartbeat thread was started in
+        self._reap_stale_jobs()
+
+    # ----- persistence -----
+    def _insert(self, doc):
+        if self.collection is not None:
+            self.collection.insert_one(dict(doc))
+        else:
+            with self._lock:
+                self._memory_jobs[doc['_id']] = dict(doc)
+
+    def _update(self, job_id, fields):
+        try:
+            if self.collection is not None:
+                self.collection.update_one({'_id': job_id}, {'$set': fields})
+            else:
+                with self._lock:
+                    self._memory_jobs.get(job_id, {}).update(fields)
+        except Exception as exc:
+            print(f"⚠️ Failed to update job {job_id}: {exc}")
+
+    def _push_log(self, job_id, message):
+        try:
+            if self.collection is not None:
+                self.collection.update_one({'_id': job_id}, {'$push': {'logs': {'$each': [message], '$slice': -200}}})
+            else:
+                with self._lock:
+                    logs = self._memory_jobs.get(job_id, {}).setdefault('logs', [])
+                    logs.append(message)
+                    del logs[:-200]
+        except Exception as exc:
+            print(f"⚠️ Failed to append log for job {job_id}: {exc}")
+
+    # ----- ownership -----
+    def owner(self):
+        """{host, pid, token} of the current process; the token tells a reused pid apart."""
+        pid = os.getpid()
+        if self._owner is None or self._owner['pid'] != pid:
+            self._owner = {'host': socket.gethostname(), 'pid': pid, 'token': uuid.uuid4().hex}
+        return self._owner
+
+    def _ensure_heartbeat(self):
+        """Start this process's heartbeat thread (threads don't survive a fork, so per pid)."""
+        if self.collection is None or self._heartbeat_pid == os.getpid():
+            return
+        with self._lock:
+            if self._heartbeat_pid == os.getpid():
+                return
+            self._heartbeat_pid = os.getpid()
+        threading.Thread(target=self._heartbeat_loop, name='export-job-heartbeat', daemon=True).start()
+
+    def _heartbeat_loop(self):
+        while True:
+            try:
+                self.collection.update_many(
+                    {'owner.token': self.owner()['token'], 'status': {'$in': ACTIVE_STATUSES}},
+                    {'$set': {'heartbeat_at': datetime.now().isoformat()}}
+                )
+                self._reap_stale_jobs()
+            except Exception as exc:
+                print(f"⚠️ Export job heartbeat failed: {exc}")
+            time.sleep(HEARTBEAT_SECONDS)
+
+    @staticmethod
+    def _is_stale(doc):
+        cutoff = (datetime.now() - timedelta(seconds=STALE_AFTER_SECONDS)).isoformat()
+        return (doc.get('heartbeat_at') or doc.get('updated_at') or '') < cutoff
+
+    def _reap_stale_jobs(self):
+        """
+        Fail queued/running jobs whose owner stopped beating (process died or
+        restarted). Jobs from before owners existed fall back to updated_at.
+        """
+        if self.collection is None:
+            return 0
+        cutoff = (datetime.now() - timedelta(seconds=STALE_AFTER_SECONDS)).isoformat()
+        try:
+            res = self.collection.update_many(
+                {'status': {'$in': ACTIVE_STATUSES}, '$or': [
+                    {'heartbeat_at': {'$lt': cutoff}},
+                    {'heartbeat_at': {'$exists': False}, 'updated_at': {'$lt': cutoff}}
+                ]},
+                {'$set': {'status': 'failed', 'error': 'Interrupted: worker stopped responding', 'finished_at': datetime.now().isoformat()}}
+            )
+            if res.modified_count:
+                print(f"⚠️ Marked {res.modified_count} interrupted export jobs as failed")
+            return res.modified_count
+        except Exception as exc:
+            print(f"⚠️ Could not reconcile export jobs: {exc}")
+            return 0
+
+    # ----- public API -----
+    def submit(self, kind, fn, params):
+        """Queue fn(job_context, params). Returns the new job id."""
+        self.cleanup_expired()
+        self._ensure_heartbeat()
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        self._insert({
+            '_id': job_id,
+            'kind': kind,
+            'params': params,
+            'status': 'queued',
+            'stage': 'queued',
+            'percentage': 0,
+            'owner': self.owner(),
+            'heartbeat_at': now,
+            'created_at': now,
+            'updated_at': now,
+            'logs': []
+        })
+        self._executor.submit(self._run, job_id, fn, params)
+        return job_id
+
+    def _run(self, job_id, fn, params):
+        ctx = JobContext(self, job_id)
+        started = datetime.now()
+        self._update(job_id, {'status': 'running', 'started_at': started.isoformat()})
+        try:
+            fn(ctx, params)
+            self._update(job_id, {
+                'status': 'done',
+                'stage': 'done',
+                'percentage': 100,
+                'finished_at': datetime.now().isoformat(),
+                'elapsed_seconds': round((datetime.now() - started).total_seconds(), 2),
+                'peak_memory_mb': round(ctx._peak_memory, 1)
+            })
+        except Exception as exc:
+            traceback.print_exc()
+            self._update(job_id, {
+                'status': 'failed',
+                'error': str(exc),
+                'finished_at': datetime.now().isoformat(),
+                'elapsed_seconds': round((datetime.now() - started).total_seconds(), 2)
+            })
+
+    def get(self, job_id):
+        """Return the public view of a job (no filesystem paths) or None."""
+        if self.collection is not None:
+            doc = self.collection.find_one({'_id': job_id})
+            if doc and doc.get('status') in ACTIVE_STATUSES and self._is_stale(doc):
+                # owner died and no live process has reaped it yet
+                self._reap_stale_jobs()
+                doc = self.collection.find_one({'_id': job_id})
+        else:
+            with self._lock:
+                doc = dict(self._memory_jobs[job_id]) if job_id in self._memory_jobs else None
+        if not doc:
+            return None
+        doc['job_id'] = doc.pop('_id')
+        result = doc.get('result')
+        if result:
+            doc['result'] = {k: v for k, v in result.items() if k not in ('path', 'host', 'artifact_id')}
+        return doc
+
+    def result_path(self, job_id):
+        """Local result file, when this host holds it."""
+        path = self._result(job_id).get('path')
+        return path if path and os.path.exists(path) else None
+
+    def result_artifact(self, job_id):
+        """Artifact id of the uploaded result (servable from any process), or None."""
+        return self._result(job_id).get('artifact_id')
+
+    def _result(self, job_id):
+        if self.collection is not None:
+            doc = self.collection.find_one({'_id': job_id}, {'result': 1})
+        else:
+            doc = self._memory_jobs.get(job_id)
+        return (doc or {}).get('result') or {}
+
+    def cleanup_expired(self):
+        """Delete result files (and job rows) older than the TTL."""
+        cutoff = datetime.now() - self.result_ttl
+        try:
+            for job_id in os.listdir(self.result_dir):
+                job_dir = os.path.join(self.result_dir, job_id)
+                if os.path.isdir(job_dir) and datetime.fromtimestamp(os.path.getmtime(job_dir)) < cutoff:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+            if self.collection is not None:
+                self.collection.delete_many({'created_at': {'$lt': cutoff.isoformat()}, 'status': {'$in': ['done', 'failed']}})
+            else:
+                with self._lock:
+                    for job_id in [k for k, v in self._memory_jobs.items() if v.get('created_at', '') < cutoff.isoformat()]:
+                        self._memory_jobs.pop(job_id, None)
+        except Exception as exc:
+            print(f"⚠️ Export job cleanup failed: {exc}")
@@ -0,0 +1,287 @@
+"""
+Dense symbol x trading-day matrices for MCAP / PR values
+One float64 matrix per data type, memory-mapped from disk, with a symbol
+index (rows) and a date index (columns); NaN means "no value that day".
+Consolidation, averages, non-zero-day counts and total_possible_days become
+NumPy reductions over a column slice instead of Mongo $push groups or CSV
+re-parsing + unstack.
+
+Several worker processes share one directory: every read and write takes a
+file lock (shared / exclusive) and reloads meta.json when another process
+has replaced it, so a worker never keeps an old symbol/date index or a memmap
+of a values file that was grown (replaced) elsewhere.
+"""
+
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: threads within one process are still serialized
+    fcntl = None
+
+
+class SymbolDateMatrix:
+    """Memory-mapped (symbols x dates) float64 matrix for one data type."""
+
+    def __init__(self, root_dir, data_type, initial_symbols=4096, initial_days=512):
+        self.dir = os.path.join(root_dir, data_type)
+        self.data_type = data_type
+        os.makedirs(self.dir, exist_ok=True)
+        self._values_path = os.path.join(self.dir, 'values.f64')
+        self._meta_path = os.path.join(self.dir, 'meta.json')
+        self._lock_path = os.path.join(self.dir, '.lock')
+        self._lock = threading.RLock()
+        self._initial_capacity = (initial_symbols, initial_days)
+        self.symbols = []        # row -> symbol
+        self.names = []          # row -> company name
+        self.dates = []          # column -> ISO date (arrival order)
+        self.stale = set()       # dates whose symbol_daily rows changed since the column was filled
+        self.symbol_index = {}
+        self.date_index = {}
+        self.capacity = self._initial_capacity
+        self.version = 0
+        self._meta_stamp = None  # (inode, mtime_ns) of the meta.json this process loaded
+        self._values = None
+        with self._locked(exclusive=True):
+            pass
+
+    # ----- storage -----
+    @contextmanager
+    def _locked(self, exclusive=False):
+        """
+        Thread lock plus a flock on the directory's lock file, then reload meta
+        if another process saved it. The lock file is opened per call so forked
+        workers never share one open file description (and so one flock).
+        """
+        with self._lock:
+            lock_file = open(self._lock_path, 'a+') if fcntl is not None else None
+            try:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                self._refresh(exclusive)
+                yield
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def _stamp(self):
+        try:
+            st = os.stat(self._meta_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def _refresh(self, exclusive):
+        stamp = self._stamp()
+        if self._values is not None and stamp == self._meta_stamp:
+            return
+        self._load(create=exclusive)
+
+    def _load(self, create=True):
+        """Read meta.json and map values.f64; without create (shared lock) a missing or bad pair reads as empty."""
+        meta = None
+        if os.path.exists(self._meta_path) and os.path.exists(self._values_path):
+            try:
+                with open(self._meta_path) as f:
+                    meta = json.load(f)
+                expected = int(np.prod(meta['capacity'])) * 8
+                if os.path.getsize(self._values_path) != expected:
+                    # interrupted grow: values file and meta disagree on the layout
+                    raise ValueError(f"values file is not {meta['capacity']}")
+            except Exception as exc:
+                print(f"⚠️ Matrix meta for {self.data_type} unreadable, rebuilding: {exc}")
+                meta = None
+        self._values = None
+        if meta:
+            self.symbols = meta['symbols']
+            self.names = meta['names']
+            self.dates = meta['dates']
+            self.stale = set(meta.get('stale', []))
+            self.capacity = tuple(meta['capacity'])
+            self.version = meta.get('version', 0)
+            self._values = np.memmap(self._values_path, dtype='float64', mode='r+', shape=self.capacity)
+            self._meta_stamp = self._stamp()
+        else:
+            self.symbols, self.names, self.dates, self.stale = [], [], [], set()
+            self.capacity = self._initial_capacity
+            self._meta_stamp = None
+            if create:
+                self._values = self._allocate(self._values_path, self.capacity)
+                self._save_meta()
+        self.symbol_index = {s: i for i, s in enumerate(self.symbols)}
+        self.date_index = {d: i for i, d in enumerate(self.dates)}
+
+    @staticmethod
+    def _allocate(path, shape):
+        arr = np.memmap(path, dtype='float64', mode='w+', shape=shape)
+        arr[:] = np.nan
+        arr.flush()
+        return arr
+
+    def _save_meta(self):
+        """Write meta.json (caller holds the exclusive lock)."""
+        self.version += 1
+        meta = {
+            'symbols': self.symbols,
+            'names': self.names,
+            'dates': self.dates,
+            'stale': sorted(self.stale),
+            'capacity': list(self.capacity),
+            'version': self.version
+        }
+        fd, tmp = tempfile.mkstemp(dir=self.dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path)
+        self._meta_stamp = self._stamp()
+
+    def _ensure_capacity(self, n_symbols, n_dates):
+        cap_s, cap_d = self.capacity
+        if n_symbols <= cap_s and n_dates <= cap_d:
+            return
+        while cap_s < n_symbols:
+            cap_s *= 2
+        while cap_d < n_dates:
+            cap_d *= 2
+        tmp_path = self._values_path + '.grow'
+        grown = self._allocate(tmp_path, (cap_s, cap_d))
+        old_s, old_d = self.capacity
+        grown[:old_s, :old_d] = self._values[:old_s, :old_d]
+        grown.flush()
+        del grown
+        self._values.flush()
+        self._values = None
+        os.replace(tmp_path, self._values_path)
+        self.capacity = (cap_s, cap_d)
+        self._values = np.memmap(self._values_path, dtype='float64', mode='r+', shape=self.capacity)
+
+    def _row(self, symbol, name):
+        idx = self.symbol_index.get(symbol)
+        if idx is None:
+            idx = len(self.symbols)
+            self.symbols.append(symbol)
+            self.names.append(name or symbol)
+            self.symbol_index[symbol] = idx
+        elif name:
+            self.names[idx] = name
+        return idx
+
+    # ----- maintenance -----
+    def has_date(self, date_iso):
+        with self._locked():
+            return date_iso in self.date_index and date_iso not in self.stale
+
+    def invalidate(self, date_isos):
+        """
+        Mark days whose symbol_daily rows were written outside set_day; they
+        read as missing until set_day refills them.
+        """
+        with self._locked(exclusive=True):
+            hit = {d for d in date_isos if d in self.date_index} - self.stale
+            if hit:
+                self.stale |= hit
+                self._save_meta()
+            return len(hit)
+
+    def set_day(self, date_iso, day_values):
+        """Replace one day's column with {symbol: (value, company_name)}."""
+        with self._locked(exclusive=True):
+            new_symbols = sum(1 for s in day_values if s not in self.symbol_index)
+            new_dates = 0 if date_iso in self.date_index else 1
+            self._ensure_capacity(len(self.symbols) + new_symbols, len(self.dates) + new_dates)
+            col = self.date_index.get(date_iso)
+            if col is None:
+                col = len(self.dates)
+                self.dates.append(date_iso)
+                self.date_index[date_iso] = col
+            rows = np.fromiter((self._row(s, v[1]) for s, v in day_values.items()), dtype=np.int64, count=len(day_values))
+            vals = np.fromiter((v[0] for v in day_values.values()), dtype='float64', count=len(day_values))
+            self._values[:, col] = np.nan
+            if len(rows):
+                self._values[rows, col] = vals
+            self._values.flush()
+            self.stale.discard(date_iso)
+            self._save_meta()
+
+    # ----- queries -----
+    def consolidate(self, date_iso_list, allowed_symbols=None):
+        """
+        Pivot for the requested dates as a DataFrame shaped like
+        get_consolidated_metrics_from_db: Symbol, Company Name, Average Value,
+        Days With Data, non_zero_days, total_possible_days and one DD-MM-YYYY
+        column per date that has data. Returns None when nothing matches.
+        """
+        requested = sorted(set(date_iso_list))
+        with self._locked():
+            have = [d for d in requested if d in self.date_index and d not in self.stale]
+            if not have or not self.symbols:
+                return None
+            cols = np.array([self.date_index[d] for d in have])
+            n_rows = len(self.symbols)
+            if allowed_symbols:
+                rows = np.array(sorted(self.symbol_index[s] for s in set(allowed_symbols) if s in self.symbol_index), dtype=np.int64)
+            else:
+                rows = np.arange(n_rows)
+            if not len(rows):
+                return None
+            block = np.asarray(self._values[np.ix_(rows, cols)])
+            # snapshot the labels too: a later reload may swap these lists
+            symbols, names = self.symbols, self.names
+
+        present = ~np.isnan(block)
+        days = present.sum(axis=1)
+        keep = days > 0
+        if not keep.any():
+            return None
+        block, present, days, rows = block[keep], present[keep], days[keep], rows[keep]
+
+        sums = np.where(present, block, 0.0).sum(axis=1)
+        non_zero = (np.nan_to_num(block, nan=0.0) > 0).sum(axis=1)
+        # total_possible_days counts from the symbol's first data day to the end of the requested range
+        req_pos = np.array([requested.index(d) for d in have])
+        first_pos = req_pos[present.argmax(axis=1)]
+        total_possible = len(requested) - first_pos
+
+        data = {
+            'Symbol': [symbols[r] for r in rows],
+            'Company Name': [names[r] for r in rows],
+            'Average Value': sums / days,
+            'Days With Data': days,
+            'non_zero_days': non_zero,
+            'total_possible_days': total_possible,
+        }
+        has_data = present.any(axis=0)
+        for j, date_iso in enumerate(have):
+            if has_data[j]:
+                data[f"{date_iso[8:10]}-{date_iso[5:7]}-{date_iso[0:4]}"] = block[:, j]
+        df = pd.DataFrame(data)
+        return df[df['Symbol'].astype(str).str.strip().str.upper() != 'PERMITTED'].reset_index(drop=True)
+
+
+class MatrixStore:
+    """Per-type SymbolDateMatrix registry rooted at one directory."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self._matrices = {}
+        self._lock = threading.Lock()
+
+    def get(self, data_type):
+        with self._lock:
+            if data_type not in self._matrices:
+                self._matrices[data_type] = SymbolDateMatrix(self.root_dir, data_type)
+            return self._matrices[data_type]
+
+    def invalidate(self, data_type, date_isos):
+        """Mark days of one type stale after a symbol_daily write that bypassed set_day."""
+        if not date_isos:
+            return 0
+        return self.get(data_type).invalidate(date_isos)
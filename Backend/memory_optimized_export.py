@@ -5,6 +5,8 @@ Memory-optimized export utilities for reducing ZIP Excel export size and memory
 import pandas as pd
 import numpy as np
 import os
+import sys
+import time
 import tempfile
 import zipfile
 import gc
@@ -83,11 +85,21 @@ class MemoryOptimizedExporter:
         del df_optimized
         gc.collect()
 
-    def create_multi_sheet_excel(self, data_sheets, output_path):
+    # Column roles shared by both sheet writers
+    TEXT_COLS = {'Symbol', 'Company Name'}
+    INT_COLS = {'Days With Data'}
+
+    def create_multi_sheet_excel(self, data_sheets, output_path, progress_fn=None, vectorized=True):
         """
         Create a single Excel file with multiple sheets
         data_sheets: dict where keys are sheet names and values are DataFrames
+        progress_fn: optional callable(fraction 0..1) called after each written chunk
+        vectorized: emit rows from per-chunk NumPy column arrays with write_row
+                    (column formats carry the styling); False keeps the original
+                    cell-by-cell writer
         """
+        total_rows = sum(len(df) for df in data_sheets.values() if df is not None) or 1
+        rows_written = 0
         # Use xlsxwriter with compression options
         workbook = xlsxwriter.Workbook(output_path, {
             'constant_memory': True,
@@ -120,31 +132,28 @@ class MemoryOptimizedExporter:
             'border': 1,
             'align': 'right'
         })
+        formats = {'text': text_format, 'int': int_format, 'num': num_format}
         
         for sheet_name, df in data_sheets.items():
             if df is None or df.empty:
                 continue
                 
-            # Optimize DataFrame
-            df_optimized = self.optimize_dataframe(df.copy())
+            # The cell-by-cell writer benefits from category/downcast; the vectorized one reads columns once
+            df_sheet = df if vectorized else self.optimize_dataframe(df.copy())
             
             # Create worksheet
             worksheet = workbook.add_worksheet(sheet_name)
             
-            # Identify column types for formatting
-            text_cols = {'Symbol', 'Company Name'}
-            int_cols = {'Days With Data'}
-            
             # Write headers with formatting
-            for col_idx, column in enumerate(df_optimized.columns):
+            for col_idx, column in enumerate(df_sheet.columns):
                 worksheet.write(0, col_idx, column, header_format)
             
             # Set column widths and default formats
-            for col_idx, column in enumerate(df_optimized.columns):
-                if column in text_cols:
+            for col_idx, column in enumerate(df_sheet.columns):
+                if column in self.TEXT_COLS:
                     width = 30 if column == 'Company Name' else 15
                     worksheet.set_column(col_idx, col_idx, width, text_format)
-                elif column in int_cols:
+                elif column in self.INT_COLS:
                     worksheet.set_column(col_idx, col_idx, 14, int_format)
                 else:
                     worksheet.set_column(col_idx, col_idx, 16, num_format)
@@ -154,36 +163,74 @@ class MemoryOptimizedExporter:
             
             # Write data in chunks
             chunk_size = 1000
-            for start_row in range(0, len(df_optimized), chunk_size):
-                end_row = min(start_row + chunk_size, len(df_optimized))
-                chunk = df_optimized.iloc[start_row:end_row]
-                
-                for row_idx, (_, row) in enumerate(chunk.iterrows(), start=start_row + 1):
-                    for col_idx, value in enumerate(row):
-                        col_name = df_optimized.columns[col_idx]
-                        if pd.isna(value):
-                            worksheet.write(row_idx, col_idx, '', text_format)
-                        elif col_name in text_cols:
-                            worksheet.write(row_idx, col_idx, str(value), text_format)
-                        elif col_name in int_cols:
-                            worksheet.write_number(row_idx, col_idx, int(value), int_format)
-                        elif isinstance(value, (int, float, np.integer, np.floating)):
-                            worksheet.write_number(row_idx, col_idx, float(value), num_format)
-                        else:
-                            worksheet.write(row_idx, col_idx, str(value), text_format)
-                
-                # Force garbage collection after each chunk
-                gc.collect()
+            write_chunk = self._write_chunk_vectorized if vectorized else self._write_chunk_cellwise
+            for start_row in range(0, len(df_sheet), chunk_size):
+                end_row = min(start_row + chunk_size, len(df_sheet))
+                write_chunk(worksheet, df_sheet.iloc[start_row:end_row], start_row + 1, formats)
+                rows_written += end_row - start_row
+                if progress_fn:
+                    progress_fn(rows_written / total_rows)
             
             # Add auto-filter to the sheet
-            if len(df_optimized) > 0:
-                worksheet.autofilter(0, 0, len(df_optimized), len(df_optimized.columns) - 1)
+            if len(df_sheet) > 0:
+                worksheet.autofilter(0, 0, len(df_sheet), len(df_sheet.columns) - 1)
             
-            del df_optimized
-            gc.collect()
+            del df_sheet
         
         workbook.close()
         gc.collect()
+
+    def _write_chunk_cellwise(self, worksheet, chunk, first_row, formats):
+        """Original writer: one typed write per cell."""
+        text_format, int_format, num_format = formats['text'], formats['int'], formats['num']
+        for row_idx, (_, row) in enumerate(chunk.iterrows(), start=first_row):
+            for col_idx, value in enumerate(row):
+                col_name = chunk.columns[col_idx]
+                if pd.isna(value):
+                    worksheet.write(row_idx, col_idx, '', text_format)
+                elif col_name in self.TEXT_COLS:
+                    worksheet.write(row_idx, col_idx, str(value), text_format)
+                elif col_name in self.INT_COLS:
+                    worksheet.write_number(row_idx, col_idx, int(value), int_format)
+                elif isinstance(value, (int, float, np.integer, np.floating)):
+                    worksheet.write_number(row_idx, col_idx, float(value), num_format)
+                else:
+                    worksheet.write(row_idx, col_idx, str(value), text_format)
+        
+        # Force garbage collection after each chunk
+        gc.collect()
+
+    def _chunk_column_values(self, series):
+        """
+        One column of a chunk as a list of native Python values for write_row:
+        NaN masked to None (blank cell), ints for INT_COLS, floats for numeric
+        columns, str for text; mixed object columns keep numbers numeric.
+        """
+        name = series.name
+        missing = series.isna().to_numpy()
+        if name in self.TEXT_COLS:
+            values = series.astype(str).to_numpy(dtype=object)
+        elif pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+            numbers = series.to_numpy(dtype='float64', na_value=np.nan)
+            if name in self.INT_COLS:
+                values = np.where(missing, 0, numbers).astype(np.int64).astype(object)
+            else:
+                values = numbers.astype(object)
+        else:
+            numbers = pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+            is_number = ~np.isnan(numbers)
+            values = series.astype(str).to_numpy(dtype=object)
+            if is_number.any():
+                values[is_number] = numbers[is_number].astype(object)
+        if missing.any():
+            values[missing] = None
+        return values.tolist()
+
+    def _write_chunk_vectorized(self, worksheet, chunk, first_row, formats):
+        """Columns converted once per chunk, then one write_row per row (column formats apply)."""
+        columns = [self._chunk_column_values(chunk.iloc[:, i]) for i in range(chunk.shape[1])]
+        for offset, row in enumerate(zip(*columns)):
+            worksheet.write_row(first_row + offset, 0, row)
     
     def create_compressed_zip(self, file_paths, zip_path, max_files_per_zip=None):
         """
@@ -326,4 +373,66 @@ def get_memory_usage_mb():
     """
     import psutil
     process = psutil.Process(os.getpid())
-    return process.memory_info().rss / 1024 / 1024
\ No newline at end of file
+    return process.memory_info().rss / 1024 / 1024
+
+
+def _synthetic_consolidated_frame(rows, date_cols, nan_ratio=0.1, seed=0):
+    """Consolidated-sheet shaped DataFrame (Symbol, Company Name, stats, DD-MM-YYYY columns)."""
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(mean=20, sigma=2, size=(rows, date_cols))
+    values[rng.random((rows, date_cols)) < nan_ratio] = np.nan
+    dates = pd.bdate_range('2025-01-01', periods=date_cols).strftime('%d-%m-%Y')
+    df = pd.DataFrame(values, columns=dates)
+    df.insert(0, 'Symbol', [f"SYM{i:05d}" for i in range(rows)])
+    df.insert(1, 'Company Name', [f"Company {i} Limited" for i in range(rows)])
+    df.insert(2, 'Days With Data', np.count_nonzero(~np.isnan(values), axis=1))
+    df.insert(3, 'Average Market Cap', np.nanmean(values, axis=1))
+    return df
+
+
+def benchmark_excel_writers(rows=2500, date_cols=250, sheets=2, repeat=1):
+    """Time the cell-by-cell and vectorized multi-sheet writers on the same synthetic data."""
+    exporter = MemoryOptimizedExporter()
+    df = _synthetic_consolidated_frame(rows, date_cols)
+    data_sheets = {f"Sheet{i + 1}": df for i in range(sheets)}
+    results = {}
+    for label, vectorized in (('cellwise', False), ('vectorized', True)):
+        timings = []
+        for _ in range(repeat):
+            fd, path = tempfile.mkstemp(suffix='.xlsx')
+            os.close(fd)
+            try:
+                started = time.perf_counter()
+                exporter.create_multi_sheet_excel(data_sheets, path, vectorized=vectorized)
+                timings.append(time.perf_counter() - started)
+                size = os.path.getsize(path)
+            finally:
+                os.remove(path)
+        results[label] = {'seconds': round(min(timings), 2), 'bytes': size}
+    results['speedup'] = round(results['cellwise']['seconds'] / max(results['vectorized']['seconds'], 1e-9), 2)
+    results['shape'] = {'rows': rows, 'columns': df.shape[1], 'sheets': sheets}
+    return results
+
+
+def main(argv=None):
+    """CLI entry point: `python memory_optimized_export.py bench [--rows N] [--dates N] [--sheets N]`."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export writer utilities')
+    sub = parser.add_subparsers(dest='command')
+    bench = sub.add_parser('bench', help='Compare the cell-by-cell and vectorized Excel writers')
+    bench.add_argument('--rows', type=int, default=2500)
+    bench.add_argument('--dates', type=int, default=250)
+    bench.add_argument('--sheets', type=int, default=2)
+    bench.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command != 'bench':
+        parser.print_help()
+        return 1
+    print(benchmark_excel_writers(args.rows, args.dates, args.sheets, args.repeat))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Monthly-bucketed storage for daily symbol metrics
+One document per (symbol, YYYY-MM) holds that month's days keyed by day of
+month, so storing a day is a single idempotent `$set` (re-running a date just
+overwrites its slot) and a date-range read only touches the months it spans
+instead of unwinding an ever-growing per-symbol array.
+"""
+
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+DAILY_METRIC_FIELDS = ('impact_cost', 'free_float_mcap', 'total_market_cap', 'total_traded_value')
+
+
+def month_key(date_iso):
+    """'2026-02-02' -> '2026-02'."""
+    return date_iso[:7]
+
+
+def months_between(start_iso, end_iso):
+    """Inclusive list of YYYY-MM keys covering [start_iso, end_iso]."""
+    year, month = int(start_iso[:4]), int(start_iso[5:7])
+    end_year, end_month = int(end_iso[:4]), int(end_iso[5:7])
+    months = []
+    while (year, month) <= (end_year, end_month):
+        months.append(f"{year:04d}-{month:02d}")
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return months
+
+
+class MonthlyMetricsStore:
+    def __init__(self, collection):
+        """
+        Args:
+            collection: bucket collection (`symbol_metrics_monthly`), docs shaped
+                {_id: 'SYMBOL:YYYY-MM', symbol, month, company_name,
+                 days: {'DD': {impact_cost, free_float_mcap, ...}}}
+        """
+        self.collection = collection
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        try:
+            self.collection.create_index([('symbol', 1), ('month', 1)], name='symbol_month', unique=True)
+            self.collection.create_index([('month', 1)], name='month_idx')
+        except Exception as exc:
+            print(f"⚠️ symbol_metrics_monthly indexes not created: {exc}")
+
+    @staticmethod
+    def bucket_id(symbol, date_iso):
+        return f"{symbol}:{month_key(date_iso)}"
+
+    def upsert_op(self, symbol, date_iso, entry, company_name=None, now_iso=None):
+        """Single idempotent write for one symbol/day."""
+        now_iso = now_iso or datetime.now().isoformat()
+        update = {
+            '$set': {f"days.{date_iso[8:10]}": entry, 'last_updated': now_iso},
+            '$setOnInsert': {'symbol': symbol, 'month': month_key(date_iso), 'created_at': now_iso}
+        }
+        if company_name:
+            update['$set']['company_name'] = company_name
+        return UpdateOne({'_id': self.bucket_id(symbol, date_iso)}, update, upsert=True)
+
+    def write(self, ops):
+        for i in range(0, len(ops), 1000):
+            self.collection.bulk_write(ops[i:i + 1000], ordered=False)
+
+    @staticmethod
+    def _date_filter(start_date, end_date):
+        date_filter = {}
+        if start_date:
+            date_filter['$gte'] = start_date
+        if end_date:
+            date_filter['$lte'] = end_date
+        return date_filter
+
+    def _days_pipeline(self, symbols, start_date=None, end_date=None):
+        """One {symbol, date, m} document per stored day in [start_date, end_date]."""
+        match = {'symbol': {'$in': list(symbols)}}
+        if start_date and end_date:
+            match['month'] = {'$in': months_between(start_date, end_date)}
+        elif start_date:
+            match['month'] = {'$gte': month_key(start_date)}
+        elif end_date:
+            match['month'] = {'$lte': month_key(end_date)}
+
+        pipeline = [
+            {'$match': match},
+            {'$project': {'symbol': 1, 'month': 1, 'days': {'$objectToArray': '$days'}}},
+            {'$unwind': '$days'},
+            {'$project': {
+                'symbol': 1,
+                'date': {'$concat': ['$month', '-', '$days.k']},
+                'm': '$days.v'
+            }},
+        ]
+        date_filter = self._date_filter(start_date, end_date)
+        if date_filter:
+            pipeline.append({'$match': {'date': date_filter}})
+        return pipeline
+
+    def averages(self, symbols, start_date=None, end_date=None):
+        """
+        {symbol: {avg_<field>..., days_count}} over [start_date, end_date].
+        Only buckets for the spanned months are read; days are filtered
+        precisely inside the pipeline.
+        """
+        pipeline = self._days_pipeline(symbols, start_date, end_date)
+        group = {'_id': '$symbol', 'count': {'$sum': 1}}
+        for field in DAILY_METRIC_FIELDS:
+            group[f"avg_{field}"] = {'$avg': f"$m.{field}"}
+        pipeline.append({'$group': group})
+
+        result = {}
+        for doc in self.collection.aggregate(pipeline):
+            result[doc['_id']] = {
+                **{f"avg_{field}": doc.get(f"avg_{field}") for field in DAILY_METRIC_FIELDS},
+                'days_count': doc.get('count', 0)
+            }
+        return result
+
+    def averages_with_legacy(self, legacy_collection, symbols, start_date=None, end_date=None):
+        """
+        averages() over bucket days plus the days of legacy `symbol_metrics_daily`
+        docs not migrated yet (no `migrated_at`) that the buckets do not hold
+        (a bucket day wins over its legacy copy).
+        """
+        days = {}
+        for doc in self.collection.aggregate(self._days_pipeline(symbols, start_date, end_date)):
+            days[(doc['symbol'], doc['date'])] = doc.get('m') or {}
+        from_buckets = len(days)
+
+        pipeline = [
+            {'$match': {'symbol': {'$in': list(symbols)}, 'migrated_at': {'$exists': False}}},
+            {'$unwind': '$daily_data'}
+        ]
+        date_filter = self._date_filter(start_date, end_date)
+        if date_filter:
+            pipeline.append({'$match': {'daily_data.date': date_filter}})
+        pipeline.append({'$project': {'_id': 0, 'symbol': 1, 'daily_data': 1}})
+        for doc in legacy_collection.aggregate(pipeline):
+            entry = doc.get('daily_data') or {}
+            date_iso = str(entry.get('date') or '')[:10]
+            if date_iso:
+                days.setdefault((doc['symbol'], date_iso), entry)
+        return average_days(days), {'bucket_days': from_buckets, 'legacy_days': len(days) - from_buckets}
+
+    def migrate_from_legacy(self, legacy_collection, batch_size=200, dry_run=False):
+        """
+        Copy `symbol_metrics_daily` docs ({symbol, daily_data: [...]}) into monthly
+        buckets, then stamp them `migrated_at` so reads stop merging them. Only
+        day slots the buckets don't hold yet are filled (newer bucket data wins).
+        Docs already stamped are skipped, so re-running resumes an interrupted run.
+        """
+        summary = {'symbols': 0, 'days': 0, 'skipped_days': 0, 'buckets': 0, 'dry_run': dry_run}
+        pending, doc_ids = [], []   # (symbol, date_iso, entry, company_name), legacy _ids
+        buckets = set()
+
+        def flush():
+            ids = list({self.bucket_id(symbol, date_iso) for symbol, date_iso, _, _ in pending})
+            held = {
+                doc['_id']: set((doc.get('days') or {}).keys())
+                for doc in self.collection.find({'_id': {'$in': ids}}, {'days': 1})
+            } if ids else {}
+            ops = []
+            for symbol, date_iso, entry, company_name in pending:
+                bucket = self.bucket_id(symbol, date_iso)
+                if date_iso[8:10] in held.get(bucket, ()):
+                    summary['skipped_days'] += 1
+                    continue
+                ops.append(self.upsert_op(symbol, date_iso, entry, company_name=company_name))
+                buckets.add(bucket)
+                summary['days'] += 1
+            if not dry_run:
+                self.write(ops)
+                if doc_ids:
+                    legacy_collection.update_many({'_id': {'$in': list(doc_ids)}}, {'$set': {'migrated_at': datetime.now().isoformat()}})
+            pending.clear()
+            doc_ids.clear()
+
+        cursor = legacy_collection.find(
+            {'migrated_at': {'$exists': False}}, {'symbol': 1, 'company_name': 1, 'daily_data': 1}
+        ).batch_size(batch_size)
+        for doc in cursor:
+            symbol = doc.get('symbol')
+            if not symbol:
+                continue
+            summary['symbols'] += 1
+            for entry in doc.get('daily_data') or []:
+                date_iso = entry.get('date')
+                if not date_iso or len(date_iso) < 10:
+                    continue
+                pending.append((symbol, date_iso, {k: v for k, v in entry.items() if k != 'date'}, doc.get('company_name')))
+            doc_ids.append(doc['_id'])
+            if len(pending) >= 1000:
+                flush()
+        flush()
+        summary['buckets'] = len(buckets)
+        return summary
+
+
+def average_days(days):
+    """
+    {(symbol, date): {field: value}} -> {symbol: {avg_<field>..., days_count}},
+    with $avg's rule: non-numeric and missing values are skipped per field.
+    """
+    totals = {}
+    for (symbol, _), entry in days.items():
+        acc = totals.setdefault(symbol, {'count': 0, **{field: [0.0, 0] for field in DAILY_METRIC_FIELDS}})
+        acc['count'] += 1
+        for field in DAILY_METRIC_FIELDS:
+            value = entry.get(field)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                acc[field][0] += value
+                acc[field][1] += 1
+    return {
+        symbol: {
+            **{f"avg_{field}": (acc[field][0] / acc[field][1] if acc[field][1] else None) for field in DAILY_METRIC_FIELDS},
+            'days_count': acc['count']
+        }
+        for symbol, acc in totals.items()
+    }
@@ -0,0 +1,116 @@
+"""
+Learned PR name -> ticker aliases
+PR names that only resolved through fuzzy matching are remembered here, so
+later runs resolve them with a plain dict hit instead of scoring candidates
+again. Backed by the `pr_name_aliases` collection when available; an alias
+can be pinned or removed by editing its document (source 'manual').
+"""
+
+import threading
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+
+class AliasTable:
+    def __init__(self, collection=None):
+        """
+        Args:
+            collection: Mongo collection (`pr_name_aliases`), docs shaped
+                {_id: normalized PR name, symbol, pr_name, mcap_name, confidence,
+                 source ('fuzzy' | 'manual'), learned_at}
+        """
+        self.collection = collection
+        self._aliases = {}   # normalized PR name -> symbol
+        self._manual = set()  # keys pinned by hand; never overwritten by learning
+        self._lock = threading.Lock()
+        self.stats = {'learned': 0, 'hits': 0}
+        self.load()
+
+    def load(self):
+        if self.collection is None:
+            return 0
+        try:
+            docs = list(self.collection.find({}, {'symbol': 1, 'source': 1}))
+        except Exception as exc:
+            print(f"⚠️ PR alias table not loaded: {exc}")
+            return 0
+        with self._lock:
+            self._aliases = {doc['_id']: doc['symbol'] for doc in docs if doc.get('symbol')}
+            self._manual = {doc['_id'] for doc in docs if doc.get('source') == 'manual'}
+        return len(docs)
+
+    def mapping(self):
+        """Current {normalized PR name: symbol} dict (read-only by convention)."""
+        return self._aliases
+
+    def record_hits(self, count):
+        self.stats['hits'] += count
+
+    def learn(self, matches):
+        """
+        Persist accepted fuzzy matches.
+        matches: iterable of dicts {key, symbol, pr_name, mcap_name, confidence}
+        """
+        now = datetime.now()
+        with self._lock:
+            matches = [m for m in matches if m.get('key') and m.get('symbol') and m['key'] not in self._manual]
+            if not matches:
+                return 0
+            for m in matches:
+                self._aliases[m['key']] = m['symbol']
+            self.stats['learned'] += len(matches)
+        if self.collection is not None:
+            ops = [
+                UpdateOne(
+                    {'_id': m['key']},
+                    {'$set': {
+                        'symbol': m['symbol'],
+                        'pr_name': m.get('pr_name'),
+                        'mcap_name': m.get('mcap_name'),
+                        'confidence': round(float(m.get('confidence') or 0), 4),
+                        'source': 'fuzzy',
+                        'learned_at': now
+                    }},
+                    upsert=True
+                )
+                for m in matches
+            ]
+            try:
+                self.collection.bulk_write(ops, ordered=False)
+            except Exception as exc:
+                print(f"⚠️ PR alias write failed: {exc}")
+        return len(matches)
+
+    def get_stats(self):
+        return {**self.stats, 'entries': len(self._aliases), 'persistent': self.collection is not None}
+
+
+_table = AliasTable(None)
+_table_lock = threading.Lock()
+
+
+def configure_alias_table(collection):
+    """Swap in a Mongo-backed alias table (called once the DB connection is up)."""
+    global _table
+    with _table_lock:
+        _table = AliasTable(collection)
+    return _table
+
+
+def configure_alias_mapping(mapping):
+    """
+    Swap in a memory-only table holding mapping: for loader processes, which
+    get the parent's aliases through their pool initializer (under spawn /
+    forkserver the module-level table starts empty) and must not write Mongo.
+    """
+    global _table
+    with _table_lock:
+        _table = AliasTable(None)
+        _table._aliases = dict(mapping or {})
+    return _table
+
+
+def get_alias_table():
+    """Return the process-wide PR alias table."""
+    return _table
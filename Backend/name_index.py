@@ -0,0 +1,313 @@
+"""
+PR security name -> MCAP ticker resolution
+PR bhavcopies identify securities by company name while MCAP files carry the
+ticker. NameIndex is built once per MCAP snapshot (company name -> symbol
+pairs), cached by a content version, and resolves a whole Series of PR names
+with dictionary maps: exact name, normalized name, punctuation-free name,
+the name read as a ticker, then learned aliases. An optional fuzzy pass scores
+what is left against a trigram/token inverted index and records accepted
+matches as aliases. Every resolve records per-stage match statistics.
+"""
+
+import hashlib
+import math
+import threading
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+import pandas as pd
+
+from name_aliases import get_alias_table
+
+STAGES = ('exact', 'normalized', 'compact', 'symbol', 'alias', 'fuzzy')
+FUZZY_MIN_SCORE = 0.8        # confidence needed to accept a fuzzy match for the current call
+FUZZY_LEARN_SCORE = 0.92     # confidence needed to learn it as a permanent alias (below: review only)
+FUZZY_MARGIN = 0.05          # lead required over the best different symbol
+FUZZY_CANDIDATES = 8         # trigram candidates re-scored by token overlap
+FUZZY_TRIGRAM_WEIGHT = 0.6
+# Legal-form words carry no identity; they are ignored by the fuzzy pass
+STOP_TOKENS = {'LTD', 'LIMITED', 'THE', 'AND', 'OF', 'CO', 'INDIA', 'PVT', 'PRIVATE', 'CORP', 'CORPORATION', 'COMPANY', 'INC'}
+
+
+def normalize_names(names):
+    """Upper-case, punctuation removed, whitespace collapsed ('A.B.  Ltd.' -> 'AB LTD')."""
+    return (names.fillna('').astype(str).str.upper()
+            .str.replace(r'[^A-Z0-9\s]', '', regex=True)
+            .str.replace(r'\s+', ' ', regex=True).str.strip())
+
+
+def compact_names(names):
+    """Letters and digits only ('A. B. Ltd' and 'AB LTD' -> 'ABLTD')."""
+    return names.fillna('').astype(str).str.upper().str.replace(r'[^A-Z0-9]', '', regex=True)
+
+
+def _tokens(normalized_name):
+    return {t for t in normalized_name.split() if t not in STOP_TOKENS}
+
+
+def _trigrams(normalized_name):
+    """Character trigrams of the name without legal-form words, padded at word edges."""
+    core = ' '.join(t for t in normalized_name.split() if t not in STOP_TOKENS)
+    if not core:
+        return set()
+    padded = f"  {core} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    def __init__(self, names, symbols, version=None):
+        """
+        Args:
+            names / symbols: aligned MCAP 'Security Name' and 'Symbol' values
+            version: content version (computed from the pairs when omitted)
+        """
+        pairs = pd.DataFrame({'name': pd.Series(list(names), dtype=object), 'symbol': pd.Series(list(symbols), dtype=object)})
+        pairs = pairs.dropna()
+        pairs['name'] = pairs['name'].astype(str).str.strip()
+        pairs['symbol'] = pairs['symbol'].astype(str).str.strip()
+        pairs = pairs[(pairs['name'] != '') & (pairs['symbol'] != '')]
+        self.version = version or pairs_version(pairs['name'], pairs['symbol'])
+        self.size = len(pairs)
+
+        # Later pairs win, matching the dict(zip(names, symbols)) the callers used to build
+        self._exact = dict(zip(pairs['name'], pairs['symbol']))
+        self._normalized = dict(zip(normalize_names(pairs['name']), pairs['symbol']))
+        self._compact = dict(zip(compact_names(pairs['name']), pairs['symbol']))
+        self._symbols = dict(zip(compact_names(pairs['symbol']), pairs['symbol']))
+        for table in (self._normalized, self._compact, self._symbols):
+            table.pop('', None)
+        self.name_by_symbol = dict(zip(pairs['symbol'], pairs['name']))
+
+        self._fuzzy_ready = False
+        self._fuzzy_lock = threading.Lock()
+        self.stats = {stage: 0 for stage in STAGES}
+        self.stats.update({'total': 0, 'unmatched': 0})
+        self.last_stats = None
+
+    def __getstate__(self):
+        # Sent to loader processes: the fuzzy index is rebuilt lazily on the other side
+        state = {k: v for k, v in self.__dict__.items() if k not in ('_fuzzy_lock', '_entries', '_postings', '_idf', '_entry_weight')}
+        state['_fuzzy_ready'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fuzzy_lock = threading.Lock()
+
+    # ----- fuzzy (trigram + token) index -----
+    def _build_fuzzy_index(self):
+        if self._fuzzy_ready:
+            return
+        with self._fuzzy_lock:
+            if self._fuzzy_ready:
+                return
+            self._entries = []                # (symbol, token set, trigram set)
+            token_postings = defaultdict(list)
+            trigram_postings = defaultdict(list)
+            for norm, symbol in self._normalized.items():
+                tokens = _tokens(norm)
+                if not tokens:
+                    continue
+                trigrams = _trigrams(norm)
+                entry_id = len(self._entries)
+                self._entries.append((symbol, tokens, trigrams))
+                for token in tokens:
+                    token_postings[token].append(entry_id)
+                for gram in trigrams:
+                    trigram_postings[gram].append(entry_id)
+            n = max(len(self._entries), 1)
+            self._postings = dict(trigram_postings)
+            self._idf = {t: math.log(1 + n / len(ids)) for t, ids in token_postings.items()}
+            self._entry_weight = [sum(self._idf[t] for t in tokens) for _, tokens, _ in self._entries]
+            self._fuzzy_ready = True
+
+    def _token_score(self, tokens, entry_id):
+        """IDF-weighted Jaccard between query tokens and an entry's tokens."""
+        entry_tokens = self._entries[entry_id][1]
+        unseen = math.log(1 + len(self._entries))
+        shared = sum(self._idf[t] for t in tokens & entry_tokens)
+        query = sum(self._idf.get(t, unseen) for t in tokens)
+        union = query + self._entry_weight[entry_id] - shared
+        return shared / union if union else 0.0
+
+    def fuzzy_match(self, normalized_name, min_score=FUZZY_MIN_SCORE, candidates=FUZZY_CANDIDATES, exclude=()):
+        """
+        Best (symbol, confidence) for a normalized PR name, or (None, best confidence).
+        Candidates come from the trigram postings (Dice coefficient); the top few are
+        re-scored with token overlap. Ambiguous winners (within FUZZY_MARGIN of a
+        different symbol) are rejected. Symbols in exclude (already matched by
+        another row) are never candidates.
+        """
+        self._build_fuzzy_index()
+        tokens = _tokens(normalized_name)
+        trigrams = _trigrams(normalized_name)
+        if not tokens or not trigrams:
+            return None, 0.0
+        shared = defaultdict(int)
+        for gram in trigrams:
+            for entry_id in self._postings.get(gram, ()):
+                shared[entry_id] += 1
+        if exclude:
+            shared = {entry_id: count for entry_id, count in shared.items() if self._entries[entry_id][0] not in exclude}
+        if not shared:
+            return None, 0.0
+        q_len = len(trigrams)
+        dice = sorted(
+            ((2.0 * count / (q_len + len(self._entries[entry_id][2])), entry_id) for entry_id, count in shared.items()),
+            reverse=True
+        )[:candidates]
+        scored = sorted(
+            ((FUZZY_TRIGRAM_WEIGHT * d + (1 - FUZZY_TRIGRAM_WEIGHT) * self._token_score(tokens, entry_id), entry_id)
+             for d, entry_id in dice),
+            reverse=True
+        )
+        best_score, best_id = scored[0]
+        best_symbol = self._entries[best_id][0]
+        runner_up = next((score for score, entry_id in scored[1:] if self._entries[entry_id][0] != best_symbol), 0.0)
+        if best_score < min_score or best_score - runner_up < FUZZY_MARGIN:
+            return None, best_score
+        return best_symbol, best_score
+
+    # ----- resolution -----
+    def resolve(self, names, fuzzy=False, min_score=FUZZY_MIN_SCORE, learn=True):
+        """Map a Series of PR names to MCAP symbols (NaN where unresolved), aligned with names."""
+        return self.resolve_with_stats(names, fuzzy=fuzzy, min_score=min_score, learn=learn)[0]
+
+    def resolve_with_stats(self, names, fuzzy=False, min_score=FUZZY_MIN_SCORE, learn=True, learn_score=FUZZY_LEARN_SCORE):
+        """
+        resolve() plus this call's per-stage match counts, match rate and the
+        accepted fuzzy matches. Learned aliases are always consulted. Aliases and
+        fuzzy matches never take a symbol another row of this call already holds
+        (e.g. a partly-paid 'HDFC BANK LTD RE' next to 'HDFC BANK LTD'). With learn,
+        fuzzy matches scoring at least learn_score are added to the alias table;
+        weaker ones are used for this call and reported for review only.
+        """
+        text = names.astype(object).fillna('').astype(str).str.strip()
+        values = text.to_numpy(dtype=object)
+        result = text.map(self._exact).to_numpy(dtype=object)
+        stage_counts = {'exact': int(pd.notna(result).sum())}
+        claimed = set(result[pd.notna(result)])
+
+        stages = [
+            ('normalized', lambda sub: normalize_names(sub).map(self._normalized)),
+            ('compact', lambda sub: compact_names(sub).map(self._compact)),
+            # Some PR rows carry the ticker itself
+            ('symbol', lambda sub: compact_names(sub).map(self._symbols)),
+        ]
+        alias_table = get_alias_table()
+        aliases = alias_table.mapping()
+        if aliases:
+            def _alias(sub):
+                hit = normalize_names(sub).map(aliases)
+                # an alias to a ticker missing from this snapshot, or already held by another row, does not count
+                return hit.where(hit.map(self.name_by_symbol).notna() & ~hit.isin(list(claimed)))
+            stages.append(('alias', _alias))
+
+        accepted = []
+        if fuzzy:
+            def _fuzzy(sub):
+                normalized = normalize_names(sub)
+                matches = {}
+                for key, pr_name in zip(normalized, sub):
+                    if not key or key in matches:
+                        continue
+                    symbol, confidence = self.fuzzy_match(key, min_score, exclude=claimed)
+                    matches[key] = symbol
+                    if symbol:
+                        claimed.add(symbol)
+                        accepted.append({
+                            'key': key, 'symbol': symbol, 'pr_name': pr_name,
+                            'mcap_name': self.name_by_symbol.get(symbol), 'confidence': confidence,
+                            'learned': bool(learn and confidence >= learn_score)
+                        })
+                return normalized.map(matches)
+            stages.append(('fuzzy', _fuzzy))
+
+        for stage, lookup in stages:
+            pending = np.flatnonzero(pd.isna(result))
+            if not len(pending):
+                break
+            hit = lookup(pd.Series(values[pending], dtype=object)).to_numpy(dtype=object)
+            result[pending] = hit
+            stage_counts[stage] = int(pd.notna(hit).sum())
+            claimed.update(hit[pd.notna(hit)])
+
+        if stage_counts.get('alias'):
+            alias_table.record_hits(stage_counts['alias'])
+        learned = [m for m in accepted if m['learned']]
+        if learned:
+            alias_table.learn(learned)
+
+        pending = pd.isna(result)
+        total = len(text)
+        unmatched = int(pending.sum())
+        for stage, count in stage_counts.items():
+            self.stats[stage] += count
+        self.stats['total'] += total
+        self.stats['unmatched'] += unmatched
+        call_stats = {
+            **{stage: stage_counts.get(stage, 0) for stage in STAGES},
+            'total': total,
+            'matched': total - unmatched,
+            'unmatched': unmatched,
+            'match_rate': round((total - unmatched) / total, 4) if total else None,
+            'fuzzy_matches': accepted
+        }
+        self.last_stats = call_stats
+        return pd.Series(result, index=names.index), call_stats
+
+    def canonical_names(self, symbols):
+        """MCAP 'Security Name' for resolved symbols (NaN where unknown)."""
+        return symbols.map(self.name_by_symbol)
+
+    def get_stats(self):
+        total = self.stats['total']
+        return {
+            **self.stats,
+            'version': self.version[:12],
+            'size': self.size,
+            'match_rate': round((total - self.stats['unmatched']) / total, 4) if total else None
+        }
+
+
+def pairs_version(names, symbols):
+    """Content hash of (name, symbol) pairs, independent of order."""
+    digest = hashlib.sha1()
+    for name, symbol in sorted(zip(map(str, names), map(str, symbols))):
+        digest.update(name.encode('utf-8', 'ignore'))
+        digest.update(b'\x00')
+        digest.update(symbol.encode('utf-8', 'ignore'))
+        digest.update(b'\x01')
+    return digest.hexdigest()
+
+
+_indexes = OrderedDict()  # version -> NameIndex, most recent last
+_indexes_lock = threading.Lock()
+MAX_CACHED_INDEXES = 8
+
+
+def get_name_index(names, symbols):
+    """Shared NameIndex for an MCAP snapshot; rebuilt only when its content changes."""
+    names, symbols = list(names), list(symbols)
+    version = pairs_version(names, symbols)
+    with _indexes_lock:
+        index = _indexes.get(version)
+        if index is not None:
+            _indexes.move_to_end(version)
+            return index
+    index = NameIndex(names, symbols, version=version)
+    with _indexes_lock:
+        _indexes[version] = index
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def get_name_index_for_map(symbol_name_map):
+    """Same as get_name_index for a {company name: symbol} dict."""
+    return get_name_index(symbol_name_map.keys(), symbol_name_map.values())
+
+
+def name_index_stats():
+    with _indexes_lock:
+        return {version[:12]: index.get_stats() for version, index in _indexes.items()}
@@ -0,0 +1,210 @@
+"""
+Process-wide pooled HTTP client for NSE endpoints
+A bounded pool of keep-alive sessions shares one set of warmed NSE cookies,
+so callers no longer pay a homepage fetch per symbol/date. Cookies are
+refreshed on 401/403 and concurrency is capped per host; within that cap an
+adaptive limiter (rate_limiter.py) paces requests from the observed
+429/403/timeout rate.
+"""
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limiter import ERROR, TIMEOUT, classify_status, get_limiter, limiter_stats
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+
+# Hosts that require a cookie-primed session (bot protection on nseindia.com)
+COOKIE_HOSTS = {'www.nseindia.com', 'nseindia.com'}
+
+
+class NSEClient:
+    HOME_URL = 'https://www.nseindia.com'
+
+    def __init__(self, pool_size=16, host_limits=None, default_host_limit=16, cookie_ttl_seconds=300, user_agent=None):
+        """
+        Args:
+            pool_size: maximum number of live sessions (one in-flight request each)
+            host_limits: {host: max concurrent requests}; others use default_host_limit
+            cookie_ttl_seconds: re-prime the shared NSE cookies after this age
+        """
+        self.pool_size = pool_size
+        self.host_limits = host_limits or {}
+        self.default_host_limit = default_host_limit
+        self.cookie_ttl = cookie_ttl_seconds
+        self.headers = {
+            'User-Agent': user_agent or DEFAULT_USER_AGENT,
+            'Accept': 'application/json,text/plain,*/*',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Connection': 'keep-alive'
+        }
+        self._idle = queue.LifoQueue()  # LIFO keeps hot connections in use
+        self._created = 0
+        self._create_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._host_sems = {}
+        self._host_lock = threading.Lock()
+        self._cookie_lock = threading.Lock()
+        self._cookies = None
+        self._cookies_at = 0.0
+        self._cookies_version = 0  # bumped on every re-prime
+        self._priming = None       # Event while one thread fetches the homepage
+        self.stats = {'requests': 0, 'primes': 0, 'cookie_refreshes': 0, 'sessions_created': 0}
+
+    # ----- sessions -----
+    def _new_session(self):
+        sess = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0)
+        sess.mount('https://', adapter)
+        sess.mount('http://', adapter)
+        sess.headers.update(self.headers)
+        sess._cookies_version = 0
+        self.stats['sessions_created'] += 1
+        return sess
+
+    def _adopt_cookies(self, sess):
+        """Copy the shared jar into sess if it is newer (caller holds _cookie_lock)."""
+        if self._cookies is not None and sess._cookies_version < self._cookies_version:
+            sess.cookies.update(self._cookies)
+            sess._cookies_version = self._cookies_version
+        return sess._cookies_version
+
+    def _prime(self, sess, seen_version=None, force=False):
+        """
+        Load NSE cookies into sess, reusing the shared jar while it is fresh.
+        seen_version (the version a rejected request went out with) re-primes
+        only if nobody has refreshed since; force re-primes the current jar.
+        One thread fetches the homepage, outside the lock; concurrent callers
+        wait for it and adopt its cookies. Returns the version sess now holds.
+        """
+        with self._cookie_lock:
+            if force:
+                seen_version = self._cookies_version
+            if seen_version is not None:
+                stale = self._cookies_version == seen_version
+            else:
+                stale = self._cookies is None or (time.time() - self._cookies_at) >= self.cookie_ttl
+            if not stale:
+                return self._adopt_cookies(sess)
+            priming = self._priming
+            if priming is None:
+                self._priming = threading.Event()
+        if priming is not None:
+            priming.wait(timeout=30)
+            with self._cookie_lock:
+                return self._adopt_cookies(sess)
+        try:
+            sess.get(self.HOME_URL, timeout=10)
+            self.stats['primes'] += 1
+        except Exception as exc:  # best-effort warmup
+            print(f"⚠️ NSE cookie warmup failed: {exc}")
+        finally:
+            with self._cookie_lock:
+                self._cookies = sess.cookies.copy()
+                self._cookies_at = time.time()
+                self._cookies_version += 1
+                sess._cookies_version = self._cookies_version
+                priming, self._priming = self._priming, None
+            priming.set()
+        return sess._cookies_version
+
+    @contextmanager
+    def session(self):
+        """Check out a session for exclusive use (blocks when the pool is exhausted)."""
+        self._slots.acquire()
+        try:
+            try:
+                sess = self._idle.get_nowait()
+            except queue.Empty:
+                with self._create_lock:
+                    self._created += 1
+                sess = self._new_session()
+            try:
+                yield sess
+            finally:
+                self._idle.put(sess)
+        finally:
+            self._slots.release()
+
+    def _host_semaphore(self, url):
+        host = urlparse(url).netloc
+        with self._host_lock:
+            if host not in self._host_sems:
+                limit = self.host_limits.get(host, self.default_host_limit)
+                self._host_sems[host] = threading.BoundedSemaphore(limit)
+            return self._host_sems[host]
+
+    # ----- requests -----
+    def get(self, url, params=None, headers=None, timeout=10, refresh_on=(401, 403)):
+        """
+        GET through the pool. NSE hosts get primed cookies; a 401/403 re-primes
+        the cookies once per wave of rejections and retries. The host's adaptive limiter paces the call
+        and learns from its outcome. Returns the requests.Response.
+        """
+        host = urlparse(url).netloc
+        needs_cookies = host in COOKIE_HOSTS
+        limiter = get_limiter(host)
+        limiter.acquire()
+        outcome = ERROR
+        try:
+            with self._host_semaphore(url):
+                with self.session() as sess:
+                    version = self._prime(sess) if needs_cookies else None
+                    self.stats['requests'] += 1
+                    resp = sess.get(url, params=params, headers=headers, timeout=timeout)
+                    if needs_cookies and resp.status_code in refresh_on:
+                        # Re-primes only if no concurrent caller already refreshed the jar
+                        self.stats['cookie_refreshes'] += 1
+                        self._prime(sess, seen_version=version)
+                        self.stats['requests'] += 1
+                        resp = sess.get(url, params=params, headers=headers, timeout=timeout)
+                    outcome = classify_status(resp.status_code)
+                    return resp
+        except (requests.Timeout, requests.ConnectionError):
+            outcome = TIMEOUT
+            raise
+        finally:
+            limiter.release(outcome)
+
+    def refresh_cookies(self):
+        with self.session() as sess:
+            self._prime(sess, force=True)
+
+    def cookie_snapshot(self, force=False):
+        """Return the shared NSE cookies as a dict (priming them if stale) for non-requests clients."""
+        with self.session() as sess:
+            self._prime(sess, force=force)
+        with self._cookie_lock:
+            return self._cookies.get_dict() if self._cookies is not None else {}
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'pool_size': self.pool_size,
+            'idle_sessions': self._idle.qsize(),
+            'limiters': limiter_stats()
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_nse_client():
+    """Return the process-wide NSEClient (created on first use)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = NSEClient(
+                    pool_size=int(os.getenv('NSE_POOL_SIZE', 16)),
+                    default_host_limit=int(os.getenv('NSE_HOST_CONCURRENCY', 16))
+                )
+    return _client
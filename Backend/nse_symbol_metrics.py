@@ -1,3 +1,4 @@
+import re
 import time
 import requests
 import pandas as pd
@@ -7,6 +8,11 @@ from dateutil.relativedelta import relativedelta
 from concurrent.futures import ThreadPoolExecutor
 import xlsxwriter
 import io
+from nse_client import get_nse_client
+from async_quote_fetcher import AsyncQuoteFetcher, async_backend_available
+from series_cache import get_series_cache
+from quote_cache import get_quote_cache
+from rate_limiter import RETRYABLE_STATUSES, RetryScheduler
 
 
 # Indices that qualify for NIFTY 500 broader index
@@ -29,15 +35,18 @@ class SymbolMetricsFetcher:
     BASE_URL = "https://www.nseindia.com/api/NextApi/apiClient/GetQuoteApi"
     HOME_URL = "https://www.nseindia.com"
 
-    def __init__(self, user_agent=None, timeout=10):
-        self.session = self._make_session(user_agent)
+    def __init__(self, user_agent=None, timeout=10, client=None, series_cache=None, quote_cache=None):
+        # Shared pooled client: warmed cookies + keep-alive, no per-instance homepage fetch
+        self.client = client or get_nse_client()
+        self.series_cache = series_cache or get_series_cache()
+        self.quote_cache = quote_cache or get_quote_cache()
+        self.session = None
         self.timeout = timeout
         self.headers = {
             'User-Agent': user_agent or 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
             'Accept': 'application/json,text/plain,*/*',
             'Connection': 'keep-alive'
         }
-        self._prime_cookies(self.session)
         self.index_mapping = {}  # Cache for symbol -> indices mapping
 
     def fetch_nifty_indices(self, max_retries=3):
@@ -78,7 +87,7 @@ class SymbolMetricsFetcher:
                     else:
                         print(f"[fetch_nifty_indices] Fetching {index_name} constituents...")
                     
-                    response = requests.get(csv_url, headers=csv_headers, timeout=30)
+                    response = get_nse_client().get(csv_url, headers=csv_headers, timeout=30)
                     response.raise_for_status()
                     
                     # Parse CSV content
@@ -123,9 +132,11 @@ class SymbolMetricsFetcher:
         return sess
 
     def _prime_cookies(self, session=None):
-        sess = session or self.session
+        if session is None:
+            self.client.refresh_cookies()
+            return
         try:
-            sess.get(self.HOME_URL, headers=self.headers, timeout=10)
+            session.get(self.HOME_URL, headers=self.headers, timeout=10)
         except Exception as exc:  # pragma: no cover - best effort warmup
             print(f"⚠️ NSE cookie warmup failed: {exc}")
 
@@ -138,15 +149,8 @@ class SymbolMetricsFetcher:
             return None
 
     def _call_symbol(self, symbol, series, session=None):
-        sess = session or self.session
-        params = {
-            'functionName': 'getSymbolData',
-            'marketType': 'N',
-            'series': series,
-            'symbol': symbol
-        }
-        
-        resp = sess.get(self.BASE_URL, params=params, headers=self.headers, timeout=self.timeout)
+        sess = session or self.session or self.client
+        resp = sess.get(self.BASE_URL, params=self._quote_params(symbol, series), headers=self.headers, timeout=self.timeout)
         if resp.status_code != 200:
             raise ValueError(f"NSE getSymbolData error {resp.status_code} for {symbol} ({series})")
         
@@ -154,7 +158,18 @@ class SymbolMetricsFetcher:
             payload = resp.json() if resp.content else {}
         except Exception:
             raise ValueError(f"Invalid JSON for {symbol} ({series})")
-            
+        return self._extract_quote_item(payload, symbol, series)
+
+    def _quote_params(self, symbol, series):
+        return {
+            'functionName': 'getSymbolData',
+            'marketType': 'N',
+            'series': series,
+            'symbol': symbol
+        }
+
+    def _extract_quote_item(self, payload, symbol, series):
+        """Pull the equity item out of a GetQuoteApi payload (shared by sync and async backends)."""
         equity_list = payload.get('equityResponse') or []
         if not equity_list:
             message = payload.get('msg') or payload.get('message') or 'No equityResponse'
@@ -167,20 +182,55 @@ class SymbolMetricsFetcher:
 
         return item
 
+    SERIES_FALLBACKS = ('EQ', 'BE', 'BZ', 'SM', 'ST', 'E1', 'E2')
+
+    @classmethod
+    def series_order(cls, series='EQ'):
+        """Series tried for a symbol: requested (or cached) series first, then every other series, EQ included."""
+        return [series] + [s for s in cls.SERIES_FALLBACKS if s != series]
+
+    def resolve_series_order(self, symbol, series='EQ'):
+        """Series to try, cached resolution first. Returns (order, cached_series)."""
+        cached = self.series_cache.get(symbol)
+        return self.series_order(cached or series), cached
+
+    def record_series(self, symbol, cached, used_series):
+        if used_series != cached:
+            self.series_cache.put(symbol, used_series)
+
+    @staticmethod
+    def is_series_miss(exc):
+        """True when the error means 'wrong series' and the next one should be tried."""
+        msg = str(exc)
+        return 'error 404' in msg or 'No equityResponse' in msg or 'Empty data' in msg
+
+    @staticmethod
+    def is_retryable_error(exc):
+        """True for throttling, server and network errors worth another try later."""
+        if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+            return True
+        match = re.search(r'error (\d{3})', str(exc))
+        return bool(match) and int(match.group(1)) in RETRYABLE_STATUSES
+
+    @staticmethod
+    def normalize_as_on(as_of=None):
+        as_on = as_of or datetime.now().strftime('%Y-%m-%d')
+        if isinstance(as_on, datetime):
+            as_on = as_on.strftime('%Y-%m-%d')
+        return as_on
+
     def fetch_symbol_data(self, symbol, series='EQ', as_of=None, session=None):
         # STRICT FILTER: Never allow 'PERMITTED' 
         if str(symbol).strip().upper() == 'PERMITTED':
             return None
             
-        as_on = as_of or datetime.now().strftime('%Y-%m-%d')
-        if isinstance(as_on, datetime):
-            as_on = as_on.strftime('%Y-%m-%d')
+        as_on = self.normalize_as_on(as_of)
 
-        fallback_series = [series] + [s for s in ['BE', 'BZ', 'SM', 'ST', 'E1', 'E2'] if s != series]
         last_exc = None
         data = None
         used_series = series
-        for ser in fallback_series:
+        order, cached = self.resolve_series_order(symbol, series)
+        for ser in order:
             try:
                 data = self._call_symbol(symbol, ser, session=session)
                 used_series = ser
@@ -188,14 +238,21 @@ class SymbolMetricsFetcher:
             except ValueError as exc:
                 last_exc = exc
                 # try next series on 404, no equityResponse, or empty data
-                if 'error 404' not in str(exc) and 'No equityResponse' not in str(exc) and 'Empty data' not in str(exc):
+                if not self.is_series_miss(exc):
                     # non-retriable
                     raise
+                if ser == cached:
+                    self.series_cache.invalidate(symbol)
                 continue
 
         if data is None:
             raise last_exc or ValueError(f"No data for {symbol}")
+        self.record_series(symbol, cached, used_series)
 
+        return self.build_quote_row(data, symbol, used_series, as_on)
+
+    def build_quote_row(self, data, symbol, used_series, as_on):
+        """Flatten one GetQuoteApi equity item into a dashboard row."""
         meta = data.get('metaData', {}) or {}
         trade_info = data.get('tradeInfo', {}) or {}
         price_info = data.get('priceInfo', {}) or {}
@@ -245,17 +302,46 @@ class SymbolMetricsFetcher:
         }
         return result
 
-    def fetch_many(self, symbols, sleep_between=0.02, max_symbols=None, as_of=None, parallel=True, max_workers=20, chunk_size=100, max_time_seconds=None, external_metrics_cache=None, log_fn=None):
+    def fetch_many(self, symbols, sleep_between=0.02, max_symbols=None, as_of=None, parallel=True, max_workers=20, chunk_size=100, max_time_seconds=None, external_metrics_cache=None, log_fn=None, backend='threads', use_quote_cache=True):
         """
         Fetch symbol data with optional timeout protection.
         external_metrics_cache: dict of {symbol: dashboard_row} already stored in DB.
+        backend: 'threads' (chunked ThreadPoolExecutor) or 'async' (single event loop,
+                 max_workers concurrent requests; falls back to threads without aiohttp).
+        use_quote_cache: serve fresh/stale rows from the quote cache (stale ones are
+                 refetched in the background) and only hit NSE for misses.
         """
         rows = []
         errors = []
         capped_symbols = symbols[:max_symbols] if max_symbols else symbols
         start_time = time.time()
 
-        if parallel and max_workers and max_workers > 1:
+        cached_rows = []
+        if use_quote_cache and self.quote_cache is not None:
+            capped_symbols, cached_rows = self._serve_from_quote_cache(
+                capped_symbols, as_of, external_metrics_cache,
+                lambda syms: self.fetch_many(
+                    syms, as_of=as_of, parallel=parallel, max_workers=max_workers,
+                    chunk_size=chunk_size, backend=backend, use_quote_cache=False
+                )
+            )
+
+        if backend == 'async' and parallel and not async_backend_available():
+            print("[fetch-symbols] aiohttp not installed - using thread backend")
+            backend = 'threads'
+
+        # One Mongo read for every symbol's cached series; new resolutions are flushed at the end
+        self.series_cache.preload(capped_symbols)
+
+        if not capped_symbols:
+            pass  # everything was served from the quote cache
+        elif backend == 'async' and parallel:
+            engine = AsyncQuoteFetcher(self, concurrency=max_workers or 1)
+            rows, errors = engine.fetch_many(
+                capped_symbols, as_of=as_of, max_time_seconds=max_time_seconds,
+                external_metrics_cache=external_metrics_cache, log_fn=log_fn
+            )
+        elif parallel and max_workers and max_workers > 1:
             def _worker(sym):
                 # 1. Check external cache first to skip slow API calls
                 if external_metrics_cache and sym in external_metrics_cache:
@@ -270,13 +356,11 @@ class SymbolMetricsFetcher:
                 if max_time_seconds and (time.time() - start_time) > max_time_seconds:
                     return ('timeout', {'symbol': sym, 'error': 'Skipped - time limit reached'})
                 
-                # 3. Fresh session per thread for API call
-                sess = self._make_session()
-                self._prime_cookies(sess)
+                # 3. Pooled, already-warmed session from the shared NSE client
                 try:
-                    return ('ok', self.fetch_symbol_data(sym, as_of=as_of, session=sess))
+                    return ('ok', self.fetch_symbol_data(sym, as_of=as_of))
                 except Exception as exc:
-                    return ('err', {'symbol': sym, 'error': str(exc)})
+                    return ('err', {'symbol': sym, 'error': str(exc), 'retryable': self.is_retryable_error(exc)})
 
             for i in range(0, len(capped_symbols), chunk_size or len(capped_symbols)):
                 # Check if we're running out of time
@@ -309,10 +393,29 @@ class SymbolMetricsFetcher:
                 try:
                     rows.append(self.fetch_symbol_data(sym, as_of=as_of))
                 except Exception as exc:
-                    errors.append({'symbol': sym, 'error': str(exc)})
+                    errors.append({'symbol': sym, 'error': str(exc), 'retryable': self.is_retryable_error(exc)})
                 if sleep_between:
                     time.sleep(sleep_between)
 
+        # Throttled / timed-out symbols get jittered-backoff retries instead of failing the batch
+        retry_symbols = [e['symbol'] for e in errors if e.pop('retryable', False)]
+        if retry_symbols:
+            retried, errors = self._retry_failed(
+                retry_symbols, errors, as_of, max_workers, start_time + max_time_seconds if max_time_seconds else None
+            )
+            rows.extend(retried)
+
+        if use_quote_cache and self.quote_cache is not None:
+            fetched = [r for r in rows if not (external_metrics_cache and r.get('symbol') in external_metrics_cache)]
+            self.quote_cache.store_many(fetched)
+            self.quote_cache.flush()
+            rows = cached_rows + rows
+
+        self.series_cache.flush()
+        cache_stats = self.series_cache.get_stats()
+        print(f"[fetch-symbols] Series cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+              f"{cache_stats['invalidations']} invalidated")
+
         if max_symbols and len(symbols) > max_symbols:
             errors.append({
                 'symbol': 'info',
@@ -321,13 +424,76 @@ class SymbolMetricsFetcher:
 
         return rows, errors
 
-    def build_dashboard(self, symbols, excel_path=None, max_symbols=None, as_of=None, parallel=True, max_workers=50, chunk_size=100, symbol_pr_data=None, symbol_mcap_data=None, max_time_seconds=None, fetch_indices_from_csv=False, nifty_indices_collection=None, external_index_mapping=None, external_metrics_cache=None, log_fn=None):
+    def _retry_failed(self, symbols, errors, as_of, max_workers, deadline=None):
+        """
+        Re-run retryable failures through a RetryScheduler. Returns (rows, errors)
+        where errors keeps the non-retried entries plus the final failures.
+        """
+        remaining = (deadline - time.time()) if deadline else None
+        if remaining is not None and remaining <= 0:
+            return [], errors
+
+        def _attempt(sym, attempt):
+            try:
+                return ('ok', self.fetch_symbol_data(sym, as_of=as_of))
+            except Exception as exc:
+                return ('err', {'symbol': sym, 'error': str(exc), 'retryable': self.is_retryable_error(exc)})
+
+        scheduler = RetryScheduler(workers=max(1, min(max_workers or 1, len(symbols))), max_attempts=3)
+        print(f"[fetch-symbols] Retrying {len(symbols)} throttled/failed symbols with backoff...")
+        results = scheduler.run(
+            symbols, _attempt,
+            should_retry=lambda res: res[0] == 'err' and res[1].get('retryable'),
+            deadline=time.monotonic() + remaining if remaining is not None else None,
+            initial_backoff=True
+        )
+        retry_set = set(symbols)
+        errors = [e for e in errors if e.get('symbol') not in retry_set]
+        rows = []
+        for status, payload in results:
+            if status == 'ok':
+                rows.append(payload)
+            else:
+                payload.pop('retryable', None)
+                errors.append(payload)
+        print(f"[fetch-symbols] Retry pass: {len(rows)} recovered, {len(symbols) - len(rows)} still failing")
+        return rows, errors
+
+    def _serve_from_quote_cache(self, symbols, as_of, external_metrics_cache, refetch_fn):
+        """
+        Split symbols into cache hits and ones that must be fetched now.
+        Stale hits are returned as-is and handed to refetch_fn in the background.
+        Returns (symbols_to_fetch, cached_rows).
+        """
+        self.quote_cache.preload(symbols)
+        to_fetch, cached_rows, stale = [], [], []
+        for sym in symbols:
+            if external_metrics_cache and sym in external_metrics_cache:
+                to_fetch.append(sym)  # the worker returns the DB row without an API call
+                continue
+            row, state = self.quote_cache.lookup(sym)
+            if row is None:
+                to_fetch.append(sym)
+                continue
+            # as_on stays the day the cached numbers were fetched, not as_of
+            cached_rows.append(row)
+            if state == 'stale':
+                stale.append(sym)
+        if stale:
+            self.quote_cache.revalidate(stale, refetch_fn)
+        if cached_rows:
+            print(f"[fetch-symbols] Quote cache: {len(cached_rows)} served ({len(stale)} stale, revalidating), "
+                  f"{len(to_fetch)} to fetch")
+        return to_fetch, cached_rows
+
+    def build_dashboard(self, symbols, excel_path=None, max_symbols=None, as_of=None, parallel=True, max_workers=50, chunk_size=100, symbol_pr_data=None, symbol_mcap_data=None, max_time_seconds=None, fetch_indices_from_csv=False, nifty_indices_collection=None, external_index_mapping=None, external_metrics_cache=None, log_fn=None, fetch_backend='threads'):
         """
         Build dashboard with additional calculated columns.
         Optimized with minimum 5 workers per batch for parallel processing.
         
         external_index_mapping: Optional pre-fetched {symbol: [indices]} to avoid DB calls.
         external_metrics_cache: Optional pre-fetched {symbol: dashboard_row} to avoid API calls.
+        fetch_backend: 'threads' or 'async' (see fetch_many).
         """
         # STRICT FILTER: Never allow 'PERMITTED' symbol in any dashboard result
         if symbols:
@@ -369,7 +535,7 @@ class SymbolMetricsFetcher:
             parallel=parallel, max_workers=effective_workers, 
             chunk_size=chunk_size, max_time_seconds=max_time_seconds,
             external_metrics_cache=external_metrics_cache,
-            log_fn=log_fn
+            log_fn=log_fn, backend=fetch_backend
         )
 
         # Store API indices before overriding and clear current index/indexList
@@ -0,0 +1,245 @@
+"""
+Persistent quote cache for symbol dashboard rows (stale-while-revalidate)
+Each GetQuoteApi row is cached per symbol with a fetch timestamp per field.
+Fields have their own freshness: static metadata (company name, listing
+date, industry) is trusted for weeks, intraday numbers for minutes. Stale
+rows are served immediately while a background worker refetches them, so
+warm dashboard batches never wait on NSE.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+MINUTE = 60
+DAY = 24 * 60 * MINUTE
+
+# Freshness per dashboard field, in seconds
+DEFAULT_FIELD_TTLS = {
+    # static metadata
+    'companyName': 21 * DAY,
+    'listingDate': 21 * DAY,
+    'basicIndustry': 21 * DAY,
+    'series': 21 * DAY,
+    # changes at most daily
+    'status': DAY,
+    'index': DAY,
+    'indexList': DAY,
+    'applicableMargin': DAY,
+}
+
+INTRADAY_FIELDS = (
+    'impact_cost', 'free_float_mcap', 'total_market_cap', 'total_traded_value',
+    'last_price', 'live_detail_mc', 'live_detail_ff'
+)
+DEFAULT_FIELD_TTLS.update({field: 5 * MINUTE for field in INTRADAY_FIELDS})
+
+# Request-specific keys that are never cached
+UNCACHED_FIELDS = {'as_on', '_id', 'source', 'updated_at'}
+
+# 'source' of rows served from the cache (not fetched by the current request)
+CACHED_SOURCE = 'quote_cache'
+
+
+class QuoteCache:
+    def __init__(self, collection=None, field_ttls=None, default_ttl=5 * MINUTE, max_stale_seconds=3 * DAY, refresh_workers=2):
+        """
+        Args:
+            collection: Mongo collection (`quote_cache`), or None for memory only
+            field_ttls: {field: seconds} overrides for DEFAULT_FIELD_TTLS
+            max_stale_seconds: rows not refetched for longer than this are
+                               treated as misses and fetched synchronously
+        """
+        self.collection = collection
+        self.field_ttls = {**DEFAULT_FIELD_TTLS, **(field_ttls or {})}
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale_seconds
+        self._entries = {}      # symbol -> {'values': {...}, 'field_at': {...}}
+        self._loaded = set()
+        self._pending = set()   # symbols with unsaved changes
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='quote-revalidate')
+        self.stats = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0, 'revalidations': 0, 'revalidate_errors': 0}
+
+    @staticmethod
+    def _key(symbol):
+        return str(symbol).strip().upper()
+
+    def _ttl(self, field):
+        return self.field_ttls.get(field, self.default_ttl)
+
+    def preload(self, symbols):
+        """Bulk-load cached rows for symbols not yet in memory (one Mongo query)."""
+        keys = [self._key(s) for s in symbols]
+        with self._lock:
+            missing = [k for k in keys if k not in self._loaded]
+        if missing and self.collection is not None:
+            try:
+                docs = list(self.collection.find({'_id': {'$in': missing}}))
+            except Exception as exc:
+                print(f"⚠️ Quote cache preload failed: {exc}")
+                return
+            with self._lock:
+                for doc in docs:
+                    self._entries.setdefault(doc['_id'], {
+                        'values': doc.get('values') or {},
+                        'field_at': doc.get('field_at') or {}
+                    })
+        with self._lock:
+            self._loaded.update(missing)
+
+    def lookup(self, symbol, now=None):
+        """
+        Returns (row, state) with state 'fresh', 'stale' or 'miss'.
+        Fields past their own TTL make the row stale; a row is a miss when
+        it is absent or was last fetched more than max_stale_seconds ago.
+        The row's as_on is the day its numbers were fetched and its source
+        is CACHED_SOURCE.
+        """
+        key = self._key(symbol)
+        now = now or time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry or not entry['field_at']:
+                self.stats['misses'] += 1
+                return None, 'miss'
+            if now - max(entry['field_at'].values()) > self.max_stale:
+                self.stats['misses'] += 1
+                return None, 'miss'
+            expired = any(now - at > self._ttl(f) for f, at in entry['field_at'].items())
+            row = dict(entry['values'])
+            fetched_at = max(
+                (entry['field_at'][f] for f in INTRADAY_FIELDS if f in entry['field_at']),
+                default=max(entry['field_at'].values())
+            )
+            row['as_on'] = datetime.fromtimestamp(fetched_at).strftime('%Y-%m-%d')
+            row['source'] = CACHED_SOURCE
+            if expired:
+                self.stats['stale_hits'] += 1
+                return row, 'stale'
+            self.stats['fresh_hits'] += 1
+            return row, 'fresh'
+
+    def store(self, row, now=None):
+        """
+        Merge a freshly fetched row. A field that came back empty keeps its
+        previous value while that value is still within its own TTL.
+        """
+        key = self._key(row.get('symbol'))
+        if not key:
+            return
+        now = now or time.time()
+        with self._lock:
+            entry = self._entries.setdefault(key, {'values': {}, 'field_at': {}})
+            for field, value in row.items():
+                if field in UNCACHED_FIELDS:
+                    continue
+                prev_at = entry['field_at'].get(field)
+                if value is None and field in entry['values'] and prev_at and now - prev_at <= self._ttl(field):
+                    continue
+                entry['values'][field] = value
+                entry['field_at'][field] = now
+            self._loaded.add(key)
+            self._pending.add(key)
+
+    def store_many(self, rows):
+        now = time.time()
+        for row in rows:
+            self.store(row, now=now)
+
+    def flush(self):
+        """Persist changed rows in one bulk_write. Returns count written."""
+        with self._lock:
+            keys, self._pending = self._pending, set()
+            docs = {
+                k: {'values': dict(self._entries[k]['values']), 'field_at': dict(self._entries[k]['field_at'])}
+                for k in keys if k in self._entries
+            }
+        if not docs or self.collection is None:
+            return 0
+        ops = [
+            UpdateOne({'_id': k}, {'$set': {'values': e['values'], 'field_at': e['field_at']}}, upsert=True)
+            for k, e in docs.items()
+        ]
+        try:
+            self.collection.bulk_write(ops, ordered=False)
+        except Exception as exc:
+            print(f"⚠️ Quote cache flush failed: {exc}")
+            return 0
+        return len(ops)
+
+    def revalidate(self, symbols, fetch_fn):
+        """
+        Refetch stale symbols in the background. fetch_fn(symbols) -> (rows, errors).
+        Symbols already being refreshed are skipped.
+        """
+        with self._lock:
+            todo = [s for s in symbols if self._key(s) not in self._refreshing]
+            self._refreshing.update(self._key(s) for s in todo)
+        if not todo:
+            return None
+
+        def _job():
+            try:
+                rows, _ = fetch_fn(todo)
+                self.store_many(rows)
+                self.flush()
+                self.stats['revalidations'] += len(rows)
+            except Exception as exc:
+                self.stats['revalidate_errors'] += 1
+                print(f"⚠️ Quote revalidation failed: {exc}")
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(self._key(s) for s in todo)
+
+        return self._executor.submit(_job)
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'entries': len(self._entries),
+            'refreshing': len(self._refreshing),
+            'persistent': self.collection is not None
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _env_ttls():
+    overrides = {}
+    intraday = os.getenv('QUOTE_CACHE_INTRADAY_TTL')
+    if intraday:
+        overrides.update({field: int(intraday) for field in INTRADAY_FIELDS})
+    static = os.getenv('QUOTE_CACHE_STATIC_TTL')
+    if static:
+        overrides.update({field: int(static) for field in ('companyName', 'listingDate', 'basicIndustry', 'series')})
+    return overrides
+
+
+def configure_quote_cache(collection):
+    """Swap in a Mongo-backed cache (called once the DB connection is up)."""
+    global _cache
+    with _cache_lock:
+        _cache = QuoteCache(
+            collection,
+            field_ttls=_env_ttls(),
+            max_stale_seconds=int(os.getenv('QUOTE_CACHE_MAX_STALE', 3 * DAY))
+        )
+    return _cache
+
+
+def get_quote_cache():
+    """Return the process-wide quote cache (memory-only until configured)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QuoteCache(None, field_ttls=_env_ttls())
+    return _cache
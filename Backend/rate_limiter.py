@@ -0,0 +1,233 @@
+"""
+Adaptive rate limiting and retry scheduling for NSE endpoints
+Each host gets a token bucket (requests/second) plus an AIMD concurrency
+limit: every clean round of responses adds one slot and a little rate, a
+window with too many 429/403/timeouts halves both. Failed items go through
+RetryScheduler, which re-queues them with full-jitter exponential backoff
+instead of hammering NSE again immediately.
+"""
+
+import heapq
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Responses that mean "slow down" (403 is NSE's bot wall once cookies were refreshed)
+THROTTLE_STATUSES = {403, 429, 503}
+RETRYABLE_STATUSES = THROTTLE_STATUSES | {500, 502, 504}
+
+OK = 'ok'
+THROTTLED = 'throttled'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+
+def classify_status(status_code):
+    """Outcome of an HTTP response for the limiter."""
+    if status_code in THROTTLE_STATUSES:
+        return THROTTLED
+    if status_code >= 500:
+        return ERROR
+    return OK
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class AdaptiveLimiter:
+    def __init__(self, name, rate=8.0, burst=16, min_rate=0.5, max_rate=40.0,
+                 concurrency=8, min_concurrency=2, max_concurrency=32,
+                 window=20, throttle_threshold=0.1, decrease_factor=0.5, cooldown_seconds=2.0):
+        """
+        Args:
+            rate / burst: token bucket refill (req/s) and capacity
+            concurrency: starting in-flight limit, kept within [min, max]_concurrency
+            window: recent outcomes considered for a multiplicative decrease
+            throttle_threshold: fraction of throttled/timed-out outcomes in the
+                                window that triggers the decrease
+            cooldown_seconds: minimum gap between two decreases (one burst of
+                              429s should only halve once)
+        """
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.min_rate, self.max_rate = float(min_rate), float(max_rate)
+        self.limit = int(concurrency)
+        self.min_concurrency, self.max_concurrency = int(min_concurrency), int(max_concurrency)
+        self.throttle_threshold = throttle_threshold
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown_seconds
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._outcomes = deque(maxlen=window)
+        self._clean_streak = 0
+        self._decreased_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'acquired': 0, 'throttled': 0, 'timeouts': 0, 'errors': 0, 'increases': 0, 'decreases': 0, 'waited_seconds': 0.0}
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def try_acquire(self):
+        """Take a slot + token if available. Returns 0 on success, else seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._in_flight >= self.limit:
+                return 0.05
+            if self._tokens < 1.0:
+                return max(0.01, (1.0 - self._tokens) / self.rate)
+            self._tokens -= 1.0
+            self._in_flight += 1
+            self.stats['acquired'] += 1
+            return 0
+
+    def acquire(self, timeout=None):
+        """Block until a slot and token are available. Returns False on timeout."""
+        started = time.monotonic()
+        while True:
+            wait_for = self.try_acquire()
+            if not wait_for:
+                self.stats['waited_seconds'] += time.monotonic() - started
+                return True
+            if timeout is not None and time.monotonic() - started + wait_for > timeout:
+                return False
+            time.sleep(wait_for)
+
+    def release(self, outcome=OK):
+        """Return the slot and feed the outcome into the AIMD controller."""
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if outcome == THROTTLED:
+                self.stats['throttled'] += 1
+            elif outcome == TIMEOUT:
+                self.stats['timeouts'] += 1
+            elif outcome == ERROR:
+                self.stats['errors'] += 1
+            bad = outcome in (THROTTLED, TIMEOUT)
+            self._outcomes.append(bad)
+
+            now = time.monotonic()
+            if bad:
+                self._clean_streak = 0
+                bad_share = sum(self._outcomes) / len(self._outcomes)
+                if bad_share >= self.throttle_threshold and now - self._decreased_at >= self.cooldown:
+                    # multiplicative decrease
+                    self.limit = max(self.min_concurrency, int(self.limit * self.decrease_factor))
+                    self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                    self._tokens = min(self._tokens, 1.0)
+                    self._decreased_at = now
+                    self._outcomes.clear()
+                    self.stats['decreases'] += 1
+                return
+            if outcome != OK:
+                return
+            # additive increase after a full clean round at the current limit
+            self._clean_streak += 1
+            if self._clean_streak >= self.limit:
+                self._clean_streak = 0
+                if self.limit < self.max_concurrency or self.rate < self.max_rate:
+                    self.limit = min(self.max_concurrency, self.limit + 1)
+                    self.rate = min(self.max_rate, self.rate + 1.0)
+                    self.stats['increases'] += 1
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'waited_seconds': round(self.stats['waited_seconds'], 2),
+            'rate': round(self.rate, 2),
+            'concurrency_limit': self.limit,
+            'in_flight': self._in_flight
+        }
+
+
+class RetryScheduler:
+    def __init__(self, workers=8, max_attempts=4, base_delay=1.0, max_delay=30.0):
+        """
+        Args:
+            workers: items processed concurrently
+            max_attempts: total tries per item, including the first
+            base_delay / max_delay: full-jitter backoff parameters (seconds)
+        """
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {'attempts': 0, 'retries': 0, 'gave_up': 0}
+
+    def run(self, items, fn, should_retry, deadline=None, initial_backoff=False):
+        """
+        Run fn(item, attempt) for every item; results for which should_retry(result)
+        is true are re-queued after a jittered backoff. Exceptions raised by fn
+        are returned as results. deadline (time.monotonic()) stops new retries.
+        initial_backoff spreads the first attempts too (items that already failed once).
+        Returns the final result per item, in input order.
+        """
+        results = [None] * len(items)
+        now = time.monotonic()
+        ready = [  # (ready_at, idx, attempt)
+            (now + backoff_delay(0, self.base_delay, self.max_delay) if initial_backoff else 0.0, idx, 0)
+            for idx in range(len(items))
+        ]
+        heapq.heapify(ready)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while ready or in_flight:
+                now = time.monotonic()
+                while ready and ready[0][0] <= now and len(in_flight) < self.workers:
+                    _, idx, attempt = heapq.heappop(ready)
+                    self.stats['attempts'] += 1
+                    in_flight[pool.submit(fn, items[idx], attempt)] = (idx, attempt)
+                next_ready = max(0.0, ready[0][0] - now) if ready else None
+                if not in_flight:
+                    time.sleep(next_ready or 0)
+                    continue
+                timeout = next_ready if len(in_flight) < self.workers else None
+                done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx, attempt = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        result = exc
+                    results[idx] = result
+                    if not should_retry(result):
+                        continue
+                    ready_at = time.monotonic() + backoff_delay(attempt, self.base_delay, self.max_delay)
+                    if attempt + 1 < self.max_attempts and (deadline is None or ready_at < deadline):
+                        self.stats['retries'] += 1
+                        heapq.heappush(ready, (ready_at, idx, attempt + 1))
+                    else:
+                        self.stats['gave_up'] += 1
+        return results
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(host):
+    """Process-wide limiter for host (NSE_RATE / NSE_BURST / NSE_MAX_CONCURRENCY)."""
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = AdaptiveLimiter(
+                host,
+                rate=float(os.getenv('NSE_RATE', 8)),
+                burst=int(os.getenv('NSE_BURST', 16)),
+                max_rate=float(os.getenv('NSE_MAX_RATE', 40)),
+                concurrency=int(os.getenv('NSE_START_CONCURRENCY', 8)),
+                max_concurrency=int(os.getenv('NSE_MAX_CONCURRENCY', 32))
+            )
+        return _limiters[host]
+
+
+def limiter_stats():
+    with _limiters_lock:
+        return {host: limiter.get_stats() for host, limiter in _limiters.items()}
@@ -0,0 +1,234 @@
+"""
+In-process reference data for request handlers
+Holds symbol <-> company name, symbol -> aggregates, symbol -> Nifty index
+membership and the day's stored symbol metrics as plain dicts, loaded once at
+startup and reloaded when a writer marks a table dirty (or after max_age as a
+backstop for writes made by other processes). Dashboard batches and
+consolidation exports read these tables instead of re-querying Mongo.
+Symbol -> series resolutions stay in series_cache and are warmed from here.
+"""
+
+import os
+import threading
+import time
+
+from series_cache import get_series_cache
+
+AGGREGATE_FIELDS = {
+    'symbol': 1, 'type': 1, 'company_name': 1, 'average': 1, 'days_with_data': 1,
+    'non_zero_days': 1, 'Non Zero Days': 1, 'total_possible_days': 1, 'date_range': 1, '_id': 0
+}
+INDEX_FIELDS = {'symbol': 1, 'indices': 1, 'primary_index': 1, 'live_mc': 1, 'live_ff': 1, '_id': 0}
+EXCLUDED_SYMBOLS = {'PERMITTED'}
+
+
+def _key(symbol):
+    return str(symbol or '').strip().upper()
+
+
+class ReferenceData:
+    TABLES = ('aggregates', 'indices', 'metrics')
+
+    def __init__(self, aggregates_collection=None, indices_collection=None, metrics_collection=None, max_age_seconds=300):
+        """
+        Args:
+            aggregates_collection / indices_collection / metrics_collection:
+                symbol_aggregates, nifty_indices and symbol_metrics (None = empty table)
+            max_age_seconds: reload a table at least this often even without invalidation
+        """
+        self.collections = {
+            'aggregates': aggregates_collection,
+            'indices': indices_collection,
+            'metrics': metrics_collection
+        }
+        self.max_age = max_age_seconds
+        self._tables = {name: {} for name in self.TABLES}
+        self._versions = {name: 0 for name in self.TABLES}
+        self._loaded_at = {name: None for name in self.TABLES}
+        self._dirty = set(self.TABLES)
+        self._load_locks = {name: threading.Lock() for name in self.TABLES}
+        self._lock = threading.Lock()
+        self.stats = {'reads': 0, 'loads': 0, 'invalidations': 0, 'load_errors': 0}
+
+    # ----- loading -----
+    def _load_aggregates(self):
+        by_symbol, name_by_symbol, symbol_by_name = {}, {}, {}
+        mcap_ranked = []
+        for doc in self.collections['aggregates'].find({}, AGGREGATE_FIELDS):
+            sym = _key(doc.get('symbol'))
+            dtype = doc.get('type')
+            if not sym or not dtype:
+                continue
+            by_symbol.setdefault(sym, {})[dtype] = doc
+            if dtype == 'mcap':
+                name = doc.get('company_name')
+                if name:
+                    name_by_symbol[sym] = name
+                    symbol_by_name[name] = doc.get('symbol')
+                if sym not in EXCLUDED_SYMBOLS:
+                    mcap_ranked.append((-(doc.get('average') or 0), sym))
+        mcap_ranked.sort()
+        return {
+            'by_symbol': by_symbol,
+            'name_by_symbol': name_by_symbol,
+            'symbol_by_name': symbol_by_name,
+            'mcap_ranked': [sym for _, sym in mcap_ranked]
+        }
+
+    def _load_indices(self):
+        table = {}
+        for doc in self.collections['indices'].find({}, INDEX_FIELDS):
+            sym = _key(doc.get('symbol'))
+            if sym:
+                table[sym] = doc
+        return table
+
+    def _load_metrics(self):
+        # Filled per as_on day on demand (see metrics_for)
+        return {}
+
+    def _table(self, name):
+        """Return a table, (re)loading it when dirty or older than max_age."""
+        self.stats['reads'] += 1
+        loaded_at = self._loaded_at[name]
+        fresh = loaded_at is not None and (self.max_age is None or time.monotonic() - loaded_at < self.max_age)
+        if fresh and name not in self._dirty:
+            return self._tables[name]
+        if self.collections[name] is None:
+            self._loaded_at[name] = time.monotonic()
+            self._dirty.discard(name)
+            return self._tables[name]
+        with self._load_locks[name]:
+            # another thread may have reloaded while we waited
+            if self._loaded_at[name] != loaded_at and name not in self._dirty:
+                return self._tables[name]
+            with self._lock:
+                self._dirty.discard(name)
+            started = time.perf_counter()
+            try:
+                table = getattr(self, f"_load_{name}")()
+            except Exception as exc:
+                self.stats['load_errors'] += 1
+                print(f"⚠️ Reference table {name} reload failed, serving previous copy: {exc}")
+                return self._tables[name]
+            with self._lock:
+                self._tables[name] = table
+                self._versions[name] += 1
+                self._loaded_at[name] = time.monotonic()
+            self.stats['loads'] += 1
+            print(f"[reference-data] {name} v{self._versions[name]} loaded in {time.perf_counter() - started:.2f}s")
+            return table
+
+    def warm(self):
+        """Load every table and pre-resolve series for the known symbol universe."""
+        for name in self.TABLES:
+            self._table(name)
+        symbols = list(self._table('aggregates').get('by_symbol', {}))
+        if symbols:
+            get_series_cache().preload(symbols)
+        return self.versions()
+
+    def warm_async(self):
+        threading.Thread(target=self.warm, name='reference-data-warm', daemon=True).start()
+
+    def invalidate(self, *names):
+        """Mark tables dirty; they reload on the next read."""
+        with self._lock:
+            for name in names or self.TABLES:
+                self._dirty.add(name)
+                if name == 'metrics':
+                    self._tables['metrics'] = {}
+            self.stats['invalidations'] += 1
+
+    # ----- lookups -----
+    def name_to_symbol(self):
+        """{company name: symbol} from the MCAP aggregates."""
+        return self._table('aggregates').get('symbol_by_name', {})
+
+    def symbol_to_name(self):
+        """{SYMBOL: company name} from the MCAP aggregates."""
+        return self._table('aggregates').get('name_by_symbol', {})
+
+    def aggregates(self, symbols=None):
+        """{SYMBOL: {'mcap': doc, 'pr': doc}} for the given symbols (all when None)."""
+        by_symbol = self._table('aggregates').get('by_symbol', {})
+        if symbols is None:
+            return by_symbol
+        return {k: by_symbol[k] for k in (_key(s) for s in symbols) if k in by_symbol}
+
+    def top_mcap_symbols(self, limit):
+        """Symbols ordered by average market cap (desc), like the symbol_aggregates sort."""
+        return self._table('aggregates').get('mcap_ranked', [])[:limit]
+
+    def indices(self, symbols=None):
+        """{SYMBOL: nifty_indices doc} for the given symbols (all when None)."""
+        table = self._table('indices')
+        if symbols is None:
+            return table
+        return {k: table[k] for k in (_key(s) for s in symbols) if k in table}
+
+    def metrics_for(self, as_on, symbols):
+        """Stored symbol_metrics rows for one as_on day, loading that day once."""
+        table = self._table('metrics')
+        collection = self.collections['metrics']
+        day = table.get(as_on)
+        if day is None and collection is not None:
+            day = {}
+            try:
+                for doc in collection.find({'as_on': as_on}):
+                    sym = _key(doc.get('symbol'))
+                    if sym:
+                        day[sym] = doc
+            except Exception as exc:
+                self.stats['load_errors'] += 1
+                print(f"⚠️ symbol_metrics for {as_on} not loaded: {exc}")
+                return {}
+            with self._lock:
+                table[as_on] = day
+                self._versions['metrics'] += 1
+        day = day or {}
+        return {k: day[k] for k in (_key(s) for s in symbols) if k in day}
+
+    def series(self, symbols):
+        """{SYMBOL: series} from the series resolution cache (one preload query for misses)."""
+        cache = get_series_cache()
+        cache.preload(symbols)
+        resolved = {}
+        for sym in symbols:
+            series = cache.get(sym)
+            if series:
+                resolved[_key(sym)] = series
+        return resolved
+
+    def versions(self):
+        with self._lock:
+            return dict(self._versions)
+
+    def get_stats(self):
+        with self._lock:
+            sizes = {
+                'aggregates': len(self._tables['aggregates'].get('by_symbol', {})),
+                'indices': len(self._tables['indices']),
+                'metrics_days': len(self._tables['metrics'])
+            }
+            return {**self.stats, 'versions': dict(self._versions), 'sizes': sizes, 'dirty': sorted(self._dirty)}
+
+
+_reference = ReferenceData()
+_reference_lock = threading.Lock()
+
+
+def configure_reference_data(aggregates_collection, indices_collection, metrics_collection):
+    """Swap in Mongo-backed tables (called once the DB connection is up)."""
+    global _reference
+    with _reference_lock:
+        _reference = ReferenceData(
+            aggregates_collection, indices_collection, metrics_collection,
+            max_age_seconds=int(os.getenv('REFERENCE_DATA_MAX_AGE', 300))
+        )
+    return _reference
+
+
+def get_reference_data():
+    """Return the process-wide reference data tables."""
+    return _reference
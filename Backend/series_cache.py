@@ -0,0 +1,164 @@
+"""
+Symbol -> trading series resolution cache for GetQuoteApi
+Remembers which series (EQ, BE, BZ, SM, ...) answered for each symbol so the
+next dashboard run makes exactly one quote call per symbol instead of probing
+the fallback list. Backed by a Mongo collection when available, with an
+in-process layer in front; entries expire after a TTL and are dropped when
+the cached series stops answering.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import DeleteOne, UpdateOne
+
+
+class SeriesResolutionCache:
+    def __init__(self, collection=None, ttl_hours=24 * 7):
+        """
+        Args:
+            collection: Mongo collection (`symbol_series`), or None for memory only
+            ttl_hours: how long a resolved series is trusted
+        """
+        self.collection = collection
+        self.ttl = timedelta(hours=ttl_hours)
+        self._entries = {}      # symbol -> (series, resolved_at)
+        self._loaded = set()    # symbols already looked up in Mongo (hit or not)
+        self._pending = {}      # symbol -> (series, resolved_at) awaiting flush
+        self._deletes = set()   # invalidated symbols awaiting flush
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'invalidations': 0, 'writes': 0}
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        if self.collection is None:
+            return
+        try:
+            # resolved_at is naive UTC: Mongo reads naive datetimes as UTC when expiring
+            self.collection.create_index('resolved_at', expireAfterSeconds=int(self.ttl.total_seconds()))
+        except Exception as exc:
+            print(f"⚠️ symbol_series TTL index not created: {exc}")
+
+    @staticmethod
+    def _key(symbol):
+        return str(symbol).strip().upper()
+
+    def preload(self, symbols):
+        """Bulk-load entries for symbols not yet looked up (one Mongo query)."""
+        keys = [self._key(s) for s in symbols]
+        with self._lock:
+            missing = [k for k in keys if k not in self._loaded]
+        if not missing or self.collection is None:
+            with self._lock:
+                self._loaded.update(missing)
+            return
+        try:
+            docs = list(self.collection.find(
+                {'_id': {'$in': missing}},
+                {'series': 1, 'resolved_at': 1}
+            ))
+        except Exception as exc:
+            print(f"⚠️ Series cache preload failed: {exc}")
+            return
+        with self._lock:
+            for doc in docs:
+                self._entries[doc['_id']] = (doc.get('series'), doc.get('resolved_at') or datetime.min)
+            self._loaded.update(missing)
+
+    def get(self, symbol):
+        """Return the cached series for symbol, or None on miss/expiry."""
+        key = self._key(symbol)
+        with self._lock:
+            loaded = key in self._loaded
+        if not loaded:
+            self.preload([key])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry[0]:
+                self.stats['misses'] += 1
+                return None
+            if datetime.utcnow() - entry[1] > self.ttl:
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                self._entries.pop(key, None)
+                return None
+            self.stats['hits'] += 1
+            return entry[0]
+
+    def put(self, symbol, series):
+        """Record a resolution; persisted on the next flush()."""
+        key = self._key(symbol)
+        now = datetime.utcnow()
+        with self._lock:
+            self._entries[key] = (series, now)
+            self._loaded.add(key)
+            self._pending[key] = (series, now)
+            self._deletes.discard(key)
+
+    def invalidate(self, symbol, persist=True):
+        """
+        Drop a symbol whose cached series no longer answers. With persist=False
+        the Mongo delete waits for the next flush() (for callers on an event loop).
+        """
+        key = self._key(symbol)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._pending.pop(key, None)
+            self._loaded.add(key)
+            self.stats['invalidations'] += 1
+            if not persist:
+                self._deletes.add(key)
+                return
+        if self.collection is not None:
+            try:
+                self.collection.delete_one({'_id': key})
+            except Exception as exc:
+                print(f"⚠️ Series cache invalidation failed for {key}: {exc}")
+
+    def flush(self):
+        """Write pending resolutions/invalidations to Mongo in one bulk_write. Returns count written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            deletes, self._deletes = self._deletes, set()
+        if (not pending and not deletes) or self.collection is None:
+            return 0
+        ops = [
+            UpdateOne({'_id': key}, {'$set': {'series': series, 'resolved_at': resolved_at}}, upsert=True)
+            for key, (series, resolved_at) in pending.items()
+        ]
+        ops.extend(DeleteOne({'_id': key}) for key in deletes)
+        try:
+            self.collection.bulk_write(ops, ordered=False)
+            self.stats['writes'] += len(ops)
+        except Exception as exc:
+            print(f"⚠️ Series cache flush failed: {exc}")
+            return 0
+        return len(ops)
+
+    def get_stats(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'hit_rate': round(self.stats['hits'] / total, 3) if total else None,
+            'entries': len(self._entries),
+            'persistent': self.collection is not None
+        }
+
+
+_cache = SeriesResolutionCache(None)
+_cache_lock = threading.Lock()
+
+
+def configure_series_cache(collection, ttl_hours=None):
+    """Swap in a Mongo-backed cache (called once the DB connection is up)."""
+    global _cache
+    ttl = ttl_hours or float(os.getenv('SERIES_CACHE_TTL_HOURS', 24 * 7))
+    with _cache_lock:
+        _cache = SeriesResolutionCache(collection, ttl_hours=ttl)
+    return _cache
+
+
+def get_series_cache():
+    """Return the process-wide series resolution cache."""
+    return _cache
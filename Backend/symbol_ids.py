@@ -0,0 +1,262 @@
+"""
+Stable int32 symbol IDs
+One process-wide dictionary SYMBOL -> sid, persisted in the `symbol_ids`
+collection ({_id: SYMBOL, sid, symbol}) so IDs survive restarts and agree
+across processes writing symbol_daily. New symbols draw IDs from an atomic
+counter document and keep them forever. A marker document records whether
+every symbol_daily row carries a sid; until a backfill sets it, and whenever
+any process writes a row without one, queries keep the symbol fallback. Symbols are normalized (stripped,
+upper-cased) once here on the way in; decode() turns IDs back into symbols
+at the output edge.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pymongo import DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+COUNTER_ID = '__next_sid__'  # lower-case, so it never collides with a normalized symbol
+COVERAGE_ID = '__backfill__'  # {complete, uncovered}: persisted "every symbol_daily row has a sid"
+MISSING = -1
+UNCOVERED_WRITE_SECONDS = 1  # a burst of rows without sid persists the marker once
+
+
+def normalize_symbols(symbols):
+    """Stripped, upper-cased symbols as a Series ('' for blanks)."""
+    if not isinstance(symbols, pd.Series):
+        symbols = pd.Series(list(symbols), dtype=object)
+    return symbols.fillna('').astype(str).str.strip().str.upper()
+
+
+class SymbolDictionary:
+    def __init__(self, collection=None):
+        """
+        Args:
+            collection: Mongo collection (`symbol_ids`); None keeps IDs in memory only
+        """
+        self.collection = collection
+        self._ids = {}          # SYMBOL -> sid
+        self._symbols = []      # sid -> symbol as first seen (None for unused IDs)
+        self._table = None      # decode table, rebuilt after allocations
+        self._lock = threading.Lock()
+        self._covered = False       # marker said complete at the last check
+        self._uncovered_at = None   # when this process last cleared the marker
+        self.stats = {'allocated': 0, 'encoded': 0, 'backfilled_docs': 0, 'errors': 0}
+        self.load()
+
+    def load(self):
+        if self.collection is None:
+            return 0
+        try:
+            docs = list(self.collection.find({}))
+        except Exception as exc:
+            print(f"⚠️ Symbol ID table not loaded: {exc}")
+            return 0
+        with self._lock:
+            for doc in docs:
+                if doc['_id'] != COUNTER_ID and doc.get('sid') is not None:
+                    self._set(doc['_id'], int(doc['sid']), doc.get('symbol'))
+        return len(self._ids)
+
+    def _set(self, key, sid, symbol):
+        self._ids[key] = sid
+        if sid >= len(self._symbols):
+            self._symbols.extend([None] * (sid + 1 - len(self._symbols)))
+        self._symbols[sid] = symbol or key
+        self._table = None
+
+    def _allocate(self, keys, spellings):
+        """Assign IDs to unseen keys (caller holds the lock)."""
+        if self.collection is None:
+            for key in keys:
+                self._set(key, len(self._symbols), spellings.get(key))
+            self.stats['allocated'] += len(keys)
+            return
+        try:
+            counter = self.collection.find_one_and_update(
+                {'_id': COUNTER_ID}, {'$inc': {'next': len(keys)}}, return_document=ReturnDocument.AFTER
+            )
+            if counter is None:
+                self._seed_counter()
+                counter = self.collection.find_one_and_update(
+                    {'_id': COUNTER_ID}, {'$inc': {'next': len(keys)}}, return_document=ReturnDocument.AFTER
+                )
+            first = counter['next'] - len(keys)
+            ops = [
+                UpdateOne({'_id': key}, {'$setOnInsert': {'sid': first + i, 'symbol': spellings.get(key) or key}}, upsert=True)
+                for i, key in enumerate(keys)
+            ]
+            try:
+                self.collection.bulk_write(ops, ordered=False)
+            except BulkWriteError:
+                # another process inserted some of these keys first; its IDs win
+                pass
+            for doc in self.collection.find({'_id': {'$in': keys}}):
+                self._set(doc['_id'], int(doc['sid']), doc.get('symbol'))
+            self.stats['allocated'] += len(keys)
+        except Exception as exc:
+            # unallocated symbols encode as MISSING; they get IDs on a later call
+            self.stats['errors'] += 1
+            print(f"⚠️ Symbol ID allocation failed for {len(keys)} symbols: {exc}")
+
+    def _seed_counter(self):
+        """Create a missing counter past the highest stored sid, so new IDs never reuse one."""
+        top = list(self.collection.find({'sid': {'$exists': True}}, {'sid': 1}).sort('sid', DESCENDING).limit(1))
+        try:
+            self.collection.update_one(
+                {'_id': COUNTER_ID}, {'$setOnInsert': {'next': int(top[0]['sid']) + 1 if top else 0}}, upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # another process seeded it first
+
+    # ----- encode / decode -----
+    def encode(self, symbols, allocate=True):
+        """
+        int32 IDs aligned with symbols (a Series or list). Blanks are MISSING;
+        unseen symbols get new IDs, or MISSING when allocate is False.
+        """
+        keys = normalize_symbols(symbols)
+        ids = keys.map(self._ids)
+        unseen = ids.isna() & (keys != '')
+        if allocate and unseen.any():
+            raw = symbols if isinstance(symbols, pd.Series) else pd.Series(list(symbols), dtype=object)
+            spellings = dict(zip(keys[unseen], raw[unseen].astype(str).str.strip()))
+            with self._lock:
+                fresh = [key for key in spellings if key not in self._ids]
+                if fresh:
+                    self._allocate(fresh, spellings)
+            ids = keys.map(self._ids)
+        self.stats['encoded'] += len(keys)
+        return ids.fillna(MISSING).to_numpy(dtype=np.int32)
+
+    def decode(self, ids):
+        """Symbols for an array of IDs (None for MISSING / unknown IDs)."""
+        table = self._table
+        if table is None:
+            table = np.array(self._symbols + [None], dtype=object)
+            self._table = table
+        ids = np.asarray(ids, dtype=np.int64)
+        unknown = len(table) - 1
+        return table[np.where((ids >= 0) & (ids < unknown), ids, unknown)]
+
+    def in_filter(self, symbols, collection=None):
+        """
+        Mongo filter for rows of the given symbols: `sid $in` once the backfill
+        marker says every row of collection carries an ID, otherwise sid OR (no
+        sid and symbol $in), so rows written without an ID (legacy, or a failed
+        allocation) still match.
+        """
+        symbols = list(symbols)
+        ids = self.encode(symbols, allocate=False)
+        sid_match = {'sid': {'$in': [int(i) for i in np.unique(ids[ids != MISSING])]}}
+        if collection is not None and self.covered(collection):
+            return sid_match
+        return {'$or': [sid_match, {'sid': {'$exists': False}, 'symbol': {'$in': symbols}}]}
+
+    def covered(self, collection):
+        """
+        Whether the persisted marker says no row lacks a sid. Read on every call
+        (one _id lookup), so a row written without a sid by any process takes
+        effect on the next query.
+        """
+        if self.collection is None or collection is None:
+            return False
+        try:
+            marker = self.collection.find_one({'_id': COVERAGE_ID}) or {}
+            self._covered = bool(marker.get('complete'))
+        except Exception as exc:
+            self.stats['errors'] += 1
+            print(f"⚠️ Symbol ID coverage check failed: {exc}")
+            self._covered = False
+        return self._covered
+
+    def mark_uncovered(self):
+        """A row is being written without a sid: clear the persisted marker for every process."""
+        self._covered = False
+        now = time.monotonic()
+        if self.collection is None or (self._uncovered_at is not None and now - self._uncovered_at < UNCOVERED_WRITE_SECONDS):
+            return
+        self._uncovered_at = now
+        try:
+            self.collection.update_one(
+                {'_id': COVERAGE_ID}, {'$set': {'complete': False}, '$inc': {'uncovered': 1}}, upsert=True
+            )
+        except Exception as exc:
+            self.stats['errors'] += 1
+            print(f"⚠️ Symbol ID coverage marker not cleared: {exc}")
+
+    def sid_fields(self, sid):
+        """{'sid': int} for an encoded ID, {} (and mark_uncovered) for MISSING."""
+        if sid == MISSING:
+            self.mark_uncovered()
+            return {}
+        return {'sid': int(sid)}
+
+    # ----- maintenance -----
+    def backfill(self, collection, field='symbol'):
+        """
+        Set sid on documents written without one (before IDs existed, or when
+        allocation failed), then set the coverage marker if none is left and no
+        process cleared it meanwhile.
+        """
+        if collection is None:
+            return 0
+        updated = 0
+        try:
+            seen = None
+            if self.collection is not None:
+                self.collection.update_one(
+                    {'_id': COVERAGE_ID}, {'$setOnInsert': {'complete': False, 'uncovered': 0}}, upsert=True
+                )
+                seen = (self.collection.find_one({'_id': COVERAGE_ID}) or {}).get('uncovered', 0)
+            symbols = [s for s in collection.distinct(field, {'sid': {'$exists': False}}) if str(s or '').strip()]
+            ids = self.encode(pd.Series(symbols, dtype=object))
+            for symbol, sid in zip(symbols, ids):
+                if sid != MISSING:
+                    updated += collection.update_many(
+                        {field: symbol, 'sid': {'$exists': False}}, {'$set': {'sid': int(sid)}}
+                    ).modified_count
+            if seen is not None and collection.find_one({'sid': {'$exists': False}}, {'_id': 1}) is None:
+                self.collection.update_one(
+                    {'_id': COVERAGE_ID, 'uncovered': seen},
+                    {'$set': {'complete': True, 'completed_at': datetime.now()}}
+                )
+        except Exception as exc:
+            self.stats['errors'] += 1
+            print(f"⚠️ Symbol ID backfill stopped: {exc}")
+        self.stats['backfilled_docs'] += updated
+        if updated:
+            print(f"✅ Symbol IDs backfilled on {updated} documents")
+        return updated
+
+    def backfill_async(self, collection, field='symbol'):
+        threading.Thread(target=self.backfill, args=(collection, field), name='symbol-id-backfill', daemon=True).start()
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'entries': len(self._ids),
+            'persistent': self.collection is not None,
+            'covered': self._covered
+        }
+
+
+_dictionary = SymbolDictionary(None)
+_dictionary_lock = threading.Lock()
+
+
+def configure_symbol_ids(collection):
+    """Swap in the Mongo-backed symbol dictionary (called once the DB connection is up)."""
+    global _dictionary
+    with _dictionary_lock:
+        _dictionary = SymbolDictionary(collection)
+    return _dictionary
+
+
+def get_symbol_ids():
+    """Return the process-wide symbol dictionary."""
+    return _dictionary
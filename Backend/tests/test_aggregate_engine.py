@@ -0,0 +1,221 @@
+import pytest
+
+pytest.importorskip('pymongo')
+
+from aggregate_engine import IncrementalAggregateEngine  # noqa: E402
+
+
+def _get(doc, path):
+    for part in path.split('.'):
+        if not isinstance(doc, dict) or part not in doc:
+            return None, False
+        doc = doc[part]
+    return doc, True
+
+
+def _set(doc, path, value):
+    *parents, leaf = path.split('.')
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+
+def _unset(doc, path):
+    *parents, leaf = path.split('.')
+    for part in parents:
+        doc = doc.get(part, {})
+    doc.pop(leaf, None)
+
+
+def _matches(doc, query):
+    for path, cond in query.items():
+        value, present = _get(doc, path)
+        ops = cond if isinstance(cond, dict) and all(k.startswith('$') for k in cond) else {'$eq': cond}
+        for op, arg in ops.items():
+            if op == '$eq':
+                ok = arg in value if isinstance(value, list) else value == arg
+            elif op == '$ne':
+                ok = arg not in value if isinstance(value, list) else value != arg
+            elif op == '$in':
+                ok = value in arg
+            elif op == '$exists':
+                ok = present == arg
+            elif op == '$lte':
+                ok = present and value <= arg
+            elif op == '$gte':
+                ok = present and value >= arg
+            else:
+                raise NotImplementedError(op)
+            if not ok:
+                return False
+    return True
+
+
+class Result:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class MemoryCollection:
+    """In-memory stand-in for the handful of pymongo calls the engine makes."""
+
+    def __init__(self, docs=()):
+        self.docs = [dict(d) for d in docs]
+        self.pipeline_updates = 0
+
+    def find(self, query, projection=None):
+        return [doc for doc in self.docs if _matches(doc, query)]
+
+    def find_one(self, query):
+        found = self.find(query)
+        return found[0] if found else None
+
+    def distinct(self, field, query):
+        return sorted({doc[field] for doc in self.find(query)})
+
+    def aggregate(self, pipeline):
+        match, group = pipeline[0]['$match'], pipeline[1]['$group']
+        firsts = {}
+        for doc in self.find(match):
+            firsts[doc['symbol']] = min(firsts.get(doc['symbol'], doc['date']), doc['date'])
+        assert group['_id'] == '$symbol'
+        return [{'_id': sym, 'first': first} for sym, first in firsts.items()]
+
+    def _apply(self, doc, update, inserted):
+        before = repr(doc)
+        for path, value in update.get('$set', {}).items():
+            _set(doc, path, value)
+        if inserted:
+            for path, value in update.get('$setOnInsert', {}).items():
+                _set(doc, path, value)
+        for path, value in update.get('$inc', {}).items():
+            _set(doc, path, (_get(doc, path)[0] or 0) + value)
+        for path, value in update.get('$min', {}).items():
+            current, present = _get(doc, path)
+            _set(doc, path, min(current, value) if present else value)
+        for path, value in update.get('$max', {}).items():
+            current, present = _get(doc, path)
+            _set(doc, path, max(current, value) if present else value)
+        for path in update.get('$unset', {}):
+            _unset(doc, path)
+        for path, value in update.get('$addToSet', {}).items():
+            items = _get(doc, path)[0] or []
+            _set(doc, path, items if value in items else items + [value])
+        for path, value in update.get('$pull', {}).items():
+            _set(doc, path, [item for item in _get(doc, path)[0] or [] if item != value])
+        return repr(doc) != before
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.find_one(query)
+        if doc is None:
+            if not upsert:
+                return Result(0)
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            self.docs.append(doc)
+            self._apply(doc, update, inserted=True)
+            return Result(0)
+        return Result(int(self._apply(doc, update, inserted=False)))
+
+    def update_many(self, query, update):
+        if isinstance(update, list):
+            self.pipeline_updates += 1  # derived-field refresh; not modelled
+            return Result(0)
+        changed = sum(self._apply(doc, update, inserted=False) for doc in self.find(query))
+        return Result(changed)
+
+    def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            self.update_one(op._filter, op._doc, upsert=op._upsert)
+
+    def delete_one(self, query):
+        doc = self.find_one(query)
+        if doc is not None:
+            self.docs.remove(doc)
+
+    def delete_many(self, query):
+        self.docs = [doc for doc in self.docs if not _matches(doc, query)]
+
+
+DAYS = {
+    '2026-03-09': {'A': 10.0, 'B': 0.0},
+    '2026-03-10': {'A': 20.0, 'B': 4.0},
+    '2026-03-11': {'A': 30.0},
+}
+
+
+def daily_collection():
+    return MemoryCollection(
+        {'symbol': sym, 'type': 'mcap', 'date': date, 'value': value, 'company_name': f"{sym} Ltd"}
+        for date, values in DAYS.items() for sym, value in values.items()
+    )
+
+
+def shared_engines(count=2):
+    """Engines over the same collections, as separate worker processes would see them."""
+    daily, aggregates, state = daily_collection(), MemoryCollection(), MemoryCollection()
+    return [IncrementalAggregateEngine(daily, aggregates, state) for _ in range(count)], aggregates
+
+
+def running(aggregates, symbol):
+    return aggregates.find_one({'symbol': symbol, 'type': 'mcap'})['running']
+
+
+def test_add_day_is_applied_once_across_processes():
+    (first, second), aggregates = shared_engines()
+    first.set_window('mcap', '2026-03-09', '2026-03-10')
+    assert first.add_day('mcap', '2026-03-11', refresh=False)
+    assert not second.add_day('mcap', '2026-03-11', refresh=False)
+    assert not first.add_day('mcap', '2026-03-11', refresh=False)
+    assert running(aggregates, 'A') == {'sum': 60.0, 'count': 3, 'non_zero': 3, 'first_seen': '2026-03-09'}
+    assert first.get_state('mcap')['end'] == '2026-03-11'
+
+
+def test_stale_claim_is_refused():
+    (first, second), aggregates = shared_engines()
+    first.set_window('mcap', '2026-03-09', '2026-03-10')
+    # second's pre-check read already happened; only the atomic claim stands between it and a double count
+    assert not second._claim_day('mcap', '2026-03-10')
+    assert running(aggregates, 'A')['count'] == 2
+
+
+def test_window_shrink_removes_day_once():
+    (first, second), aggregates = shared_engines()
+    first.set_window('mcap', '2026-03-09', '2026-03-11')
+    assert first._release_day('mcap', '2026-03-09')
+    assert not second._release_day('mcap', '2026-03-09')
+    first._claim_day('mcap', '2026-03-09')  # undo, then shrink through the public API
+
+    summary = first.set_window('mcap', '2026-03-10', '2026-03-11')
+    assert summary['removed_days'] == 1
+    again = second.set_window('mcap', '2026-03-10', '2026-03-11')
+    assert again['removed_days'] == 0 and again['added_days'] == 0
+    assert running(aggregates, 'A') == {'sum': 50.0, 'count': 2, 'non_zero': 2, 'first_seen': '2026-03-10'}
+    assert running(aggregates, 'B')['first_seen'] == '2026-03-10'
+
+
+def test_add_day_outside_window_without_extend_is_ignored():
+    (engine,), aggregates = shared_engines(1)
+    engine.set_window('mcap', '2026-03-10', '2026-03-10')
+    assert not engine.add_day('mcap', '2026-03-09', refresh=False)
+    assert not engine.add_day('mcap', '2026-03-11', auto_extend=False, refresh=False)
+    assert running(aggregates, 'A')['count'] == 1
+
+
+def test_batched_days_refresh_once():
+    (engine,), aggregates = shared_engines(1)
+    engine.set_window('mcap', '2026-03-09', '2026-03-09')
+    refreshes = aggregates.pipeline_updates
+    engine.add_day('mcap', '2026-03-10', refresh=False)
+    engine.add_day('mcap', '2026-03-11', refresh=False)
+    assert aggregates.pipeline_updates == refreshes
+    engine.refresh_pending()
+    engine.refresh_pending()
+    assert aggregates.pipeline_updates == refreshes + 1
+
+
+def test_reset_drops_docs_without_running_totals():
+    (engine,), aggregates = shared_engines(1)
+    aggregates.docs.append({'symbol': 'GONE', 'type': 'mcap', 'average': 999.0})
+    engine.set_window('mcap', '2026-03-09', '2026-03-09')
+    assert aggregates.find_one({'symbol': 'GONE'}) is None
+    assert running(aggregates, 'A')['count'] == 1
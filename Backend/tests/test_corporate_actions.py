@@ -0,0 +1,129 @@
+import math
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from corporate_actions import CorporateActions  # noqa: E402
+
+DATES = ['01-01-2026', '02-01-2026', '03-01-2026']
+
+
+def frame(rows):
+    """rows: {symbol: [value per DATES column]} plus a non-date summary column."""
+    df = pd.DataFrame([[sym] + values for sym, values in rows.items()], columns=['Symbol'] + DATES)
+    df['Average Value'] = 0.0
+    return df
+
+
+def values(df, symbol):
+    return df.loc[df['Symbol'] == symbol, DATES].iloc[0].tolist()
+
+
+def is_nan(values):
+    return [isinstance(v, float) and math.isnan(v) for v in values]
+
+
+def test_split_blanks_days_before_the_date():
+    out, stats = CorporateActions({'splits': [{'old_symbol': 'A', 'split_date': '02-01-2026'}]}).apply(
+        frame({'A': [1.0, 2.0, 3.0], 'B': [4.0, 5.0, 6.0]})
+    )
+    assert is_nan(values(out, 'A')) == [True, False, False]
+    assert values(out, 'B') == [4.0, 5.0, 6.0]
+    assert stats['blanked_cells'] == 1
+
+
+def test_delisting_blanks_from_the_date_on():
+    out, stats = CorporateActions({'delistings': [{'symbol': 'A', 'delisting_date': '02-01-2026'}]}).apply(
+        frame({'A': [1.0, 2.0, 3.0]})
+    )
+    assert is_nan(values(out, 'A')) == [False, True, True]
+    assert stats['blanked_cells'] == 2
+
+
+def test_remap_stitches_old_history_into_new_row():
+    config = {'remaps': [{'old_symbol': 'OLD', 'new_symbol': 'NEW', 'effective_date': '03-01-2026'}]}
+    out, stats = CorporateActions(config).apply(
+        frame({'OLD': [1.0, 2.0, 9.0], 'NEW': [float('nan'), 20.0, 30.0]})
+    )
+    assert out['Symbol'].tolist() == ['NEW']
+    # only NEW's missing day before the cutoff is filled; its own values win
+    assert values(out, 'NEW') == [1.0, 20.0, 30.0]
+    assert stats['remapped'] == 1 and stats['stitched_cells'] == 1
+
+
+def test_remap_renames_when_new_symbol_is_absent():
+    out, stats = CorporateActions({'remaps': [{'old_symbol': 'OLD', 'new_symbol': 'NEW'}]}).apply(
+        frame({'OLD': [1.0, 2.0, 3.0]})
+    )
+    assert out['Symbol'].tolist() == ['NEW']
+    assert values(out, 'NEW') == [1.0, 2.0, 3.0]
+    assert stats['remapped'] == 1
+
+
+def test_remap_chain_ends_on_last_symbol():
+    config = {'remaps': [{'old_symbol': 'A', 'new_symbol': 'B'}, {'old_symbol': 'B', 'new_symbol': 'C'}]}
+    out, _ = CorporateActions(config).apply(frame({'A': [1.0, 2.0, 3.0]}))
+    assert out['Symbol'].tolist() == ['C']
+
+
+def test_name_change_without_remap_blanks_and_with_remap_stitches():
+    blank = {'name_changes': [{'old_symbol': 'OLD', 'new_symbol': 'NEW', 'change_date': '02-01-2026'}]}
+    out, _ = CorporateActions(blank).apply(frame({'OLD': [1.0, 2.0, 3.0], 'NEW': [float('nan')] * 3}))
+    assert is_nan(values(out, 'OLD')) == [True, False, False]
+
+    remap = {'name_changes': [{'old_symbol': 'OLD', 'new_symbol': 'NEW', 'change_date': '02-01-2026', 'remap': True}]}
+    out, _ = CorporateActions(remap).apply(frame({'OLD': [1.0, 2.0, 3.0], 'NEW': [float('nan')] * 3}))
+    assert out['Symbol'].tolist() == ['NEW']
+    assert is_nan(values(out, 'NEW')) == [False, True, True]
+
+
+def test_placeholders_are_skipped_and_leave_frame_untouched():
+    actions = CorporateActions({
+        'splits': [{'old_symbol': 'A', 'split_date': 'DD-MM-YYYY'}],
+        'remaps': [{'old_symbol': 'A', 'new_symbol': 'A'}]
+    })
+    assert not actions
+    df = frame({'A': [1.0, 2.0, 3.0]})
+    out, stats = actions.apply(df)
+    assert out is df
+    assert stats['skipped'] == 2
+
+
+def test_non_date_columns_are_not_touched():
+    out, _ = CorporateActions({'delistings': [{'symbol': 'A', 'delisting_date': '01-01-2026'}]}).apply(
+        frame({'A': [1.0, 2.0, 3.0]})
+    )
+    assert out['Average Value'].tolist() == [0.0]
+
+
+def consolidator(tmp_path, config, ff_daily):
+    pytest.importorskip('xlsxwriter')
+    from datetime import datetime
+    from consolidate_marketcap import MarketCapConsolidator
+
+    cons = MarketCapConsolidator(str(tmp_path))
+    cons.corporate_actions = config
+    cons.dates_list = [(d, datetime.strptime(d, '%d-%m-%Y')) for d in DATES]
+    df = frame({'A': [1.0, 2.0, 3.0], 'B': [4.0, 5.0, 6.0]}).rename(columns={'Average Value': cons.avg_col})
+    df[cons.avg_ff_col] = [2.0, 5.0]  # pre-action averages of the FF values below
+    cons.df_consolidated = df
+    cons.ff_daily = ff_daily
+    return cons
+
+
+def test_average_free_float_follows_blanked_days(tmp_path):
+    ff = pd.DataFrame([['A', 1.0, 2.0, 3.0], ['B', 4.0, 5.0, 6.0]], columns=['Symbol'] + DATES)
+    cons = consolidator(tmp_path, {'splits': [{'old_symbol': 'A', 'split_date': '03-01-2026'}]}, ff)
+    cons.apply_corporate_actions()
+    out = cons.df_consolidated.set_index('Symbol')
+    assert out.loc['A', cons.avg_ff_col] == 3.0
+    assert out.loc['B', cons.avg_ff_col] == 5.0
+
+
+def test_average_free_float_blanked_for_touched_rows_without_daily_ff(tmp_path):
+    cons = consolidator(tmp_path, {'delistings': [{'symbol': 'A', 'delisting_date': '02-01-2026'}]}, None)
+    cons.apply_corporate_actions()
+    out = cons.df_consolidated.set_index('Symbol')
+    assert math.isnan(out.loc['A', cons.avg_ff_col])
+    assert out.loc['B', cons.avg_ff_col] == 5.0
@@ -0,0 +1,59 @@
+from export_cache import ExportResultCache
+
+PARAMS = {'dates': ['2026-03-09', '2026-03-10'], 'file_type': 'pr', 'output_format': 'xlsx', 'allow_missing': True}
+
+
+def fingerprint(aliases=None, name_map=None):
+    return {
+        'pr': [['2026-03-09', '2026-03-09T18:00:00', 2100], ['2026-03-10', '2026-03-10T18:00:00', 2104]],
+        'pr_name_map': ExportResultCache.mapping_fingerprint(name_map or {'Alpha Ltd': 'ALPHA'}),
+        'pr_aliases': ExportResultCache.mapping_fingerprint(aliases or {'ALPHA LIMITED': 'ALPHA'})
+    }
+
+
+def store(cache, tmp_path, key, dates):
+    src = tmp_path / 'result.xlsx'
+    src.write_bytes(b'workbook')
+    cache.put_file(key, str(src), 'result.xlsx', 'application/octet-stream', dates)
+
+
+def test_key_is_stable_for_same_inputs():
+    assert ExportResultCache.make_key(PARAMS, fingerprint()) == ExportResultCache.make_key(dict(PARAMS), fingerprint())
+
+
+def test_key_changes_with_allow_missing():
+    strict = {**PARAMS, 'allow_missing': False}
+    assert ExportResultCache.make_key(PARAMS, fingerprint()) != ExportResultCache.make_key(strict, fingerprint())
+
+
+def test_key_changes_with_alias_table_and_name_map():
+    base = ExportResultCache.make_key(PARAMS, fingerprint())
+    relearned = ExportResultCache.make_key(PARAMS, fingerprint(aliases={'ALPHA LIMITED': 'ALPHAX'}))
+    renamed = ExportResultCache.make_key(PARAMS, fingerprint(name_map={'Alpha Limited': 'ALPHA'}))
+    assert len({base, relearned, renamed}) == 3
+
+
+def test_mapping_fingerprint_ignores_insertion_order():
+    a = ExportResultCache.mapping_fingerprint({'X': '1', 'Y': '2'})
+    b = ExportResultCache.mapping_fingerprint({'Y': '2', 'X': '1'})
+    assert a == b
+
+
+def test_redownloaded_date_invalidates_entry_in_other_process(tmp_path):
+    root = str(tmp_path / 'cache')
+    writer, reader = ExportResultCache(root), ExportResultCache(root)
+    key = ExportResultCache.make_key(PARAMS, fingerprint())
+    store(writer, tmp_path, key, PARAMS['dates'])
+    assert reader.get(key)['filename'] == 'result.xlsx'
+
+    assert writer.invalidate_dates(['2026-03-10']) == 1
+    assert reader.get(key) is None
+
+
+def test_invalidation_leaves_other_ranges(tmp_path):
+    cache = ExportResultCache(str(tmp_path / 'cache'))
+    store(cache, tmp_path, 'a', ['2026-03-09'])
+    store(cache, tmp_path, 'b', ['2026-03-10'])
+    assert cache.invalidate_dates(['2026-03-10']) == 1
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
@@ -0,0 +1,90 @@
+import pytest
+
+pytest.importorskip('pymongo')
+
+from metrics_buckets import MonthlyMetricsStore, average_days, months_between  # noqa: E402
+
+
+class Cursor(list):
+    def batch_size(self, _):
+        return self
+
+
+class FakeCollection:
+    """Just enough of a pymongo collection: canned aggregate/find results, recorded writes."""
+
+    def __init__(self, aggregate_docs=(), find_docs=()):
+        self.aggregate_docs = list(aggregate_docs)
+        self.find_docs = list(find_docs)
+        self.pipelines, self.finds, self.bulk_ops, self.updates = [], [], [], []
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return iter(self.aggregate_docs)
+
+    def find(self, query, projection=None):
+        self.finds.append(query)
+        return Cursor(self.find_docs)
+
+    def bulk_write(self, ops, ordered=True):
+        self.bulk_ops.extend(ops)
+
+    def update_many(self, query, update):
+        self.updates.append((query, update))
+
+
+def test_months_between_spans_year_end():
+    assert months_between('2025-11-15', '2026-02-01') == ['2025-11', '2025-12', '2026-01', '2026-02']
+
+
+def test_average_days_skips_missing_values_per_field():
+    days = {
+        ('A', '2026-01-01'): {'impact_cost': 1.0, 'total_market_cap': 10.0},
+        ('A', '2026-01-02'): {'impact_cost': 3.0, 'total_market_cap': None},
+        ('B', '2026-01-01'): {'impact_cost': 'n/a'},
+    }
+    result = average_days(days)
+    assert result['A']['avg_impact_cost'] == 2.0
+    assert result['A']['avg_total_market_cap'] == 10.0
+    assert result['A']['days_count'] == 2
+    assert result['B']['avg_impact_cost'] is None and result['B']['days_count'] == 1
+
+
+def test_averages_with_legacy_prefers_bucket_days_and_reads_unmigrated_docs_only():
+    buckets = FakeCollection(aggregate_docs=[
+        {'symbol': 'A', 'date': '2026-01-02', 'm': {'impact_cost': 5.0}},
+    ])
+    legacy = FakeCollection(aggregate_docs=[
+        {'symbol': 'A', 'daily_data': {'date': '2026-01-01', 'impact_cost': 1.0}},
+        {'symbol': 'A', 'daily_data': {'date': '2026-01-02', 'impact_cost': 100.0}},  # bucket wins
+    ])
+    result, merged = MonthlyMetricsStore(buckets).averages_with_legacy(legacy, ['A'], '2026-01-01', '2026-01-31')
+    assert result['A']['avg_impact_cost'] == 3.0
+    assert result['A']['days_count'] == 2
+    assert merged == {'bucket_days': 1, 'legacy_days': 1}
+    assert legacy.pipelines[0][0]['$match']['migrated_at'] == {'$exists': False}
+
+
+def test_migration_fills_only_missing_slots_and_stamps_docs():
+    buckets = FakeCollection(find_docs=[{'_id': 'A:2026-01', 'days': {'02': {'impact_cost': 5.0}}}])
+    legacy = FakeCollection(find_docs=[{
+        '_id': 'legacy-a', 'symbol': 'A', 'company_name': 'A Ltd',
+        'daily_data': [{'date': '2026-01-01', 'impact_cost': 1.0}, {'date': '2026-01-02', 'impact_cost': 100.0}]
+    }])
+    summary = MonthlyMetricsStore(buckets).migrate_from_legacy(legacy)
+    assert summary['days'] == 1 and summary['skipped_days'] == 1
+    assert [list(op._doc['$set']) for op in buckets.bulk_ops] == [['days.01', 'last_updated', 'company_name']]
+    assert legacy.finds[0] == {'migrated_at': {'$exists': False}}
+    (query, update), = legacy.updates
+    assert query == {'_id': {'$in': ['legacy-a']}} and 'migrated_at' in update['$set']
+
+
+def test_migration_dry_run_writes_nothing():
+    buckets = FakeCollection()
+    legacy = FakeCollection(find_docs=[{'_id': 1, 'symbol': 'A', 'daily_data': [{'date': '2026-01-01'}]}])
+    summary = MonthlyMetricsStore(buckets).migrate_from_legacy(legacy, dry_run=True)
+    assert summary['days'] == 1
+    assert buckets.bulk_ops == [] and legacy.updates == []
@@ -0,0 +1,134 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from name_aliases import configure_alias_mapping, get_alias_table  # noqa: E402
+from name_index import NameIndex, get_name_index  # noqa: E402
+
+MCAP = {
+    'Reliance Industries Limited': 'RELIANCE',
+    'Larsen & Toubro Ltd': 'LT',
+    'Tata Consultancy Services Limited': 'TCS',
+    'Hindustan Unilever Limited': 'HINDUNILVR',
+    'Hindustan Aeronautics Limited': 'HAL',
+    'Bharat Petroleum Corporation Limited': 'BPCL',
+    # same identity words under two tickers: the fuzzy pass cannot tell them apart
+    'ABC Industries Limited': 'ABC1',
+    'ABC Industries Ltd': 'ABC2',
+}
+
+
+@pytest.fixture(autouse=True)
+def empty_aliases():
+    """Memory-only alias table per test, so learned aliases never leak between tests."""
+    configure_alias_mapping({})
+    yield
+    configure_alias_mapping({})
+
+
+@pytest.fixture
+def index():
+    return NameIndex(MCAP.keys(), MCAP.values())
+
+
+def resolve(index, names, **kwargs):
+    return index.resolve_with_stats(pd.Series(names, dtype=object), **kwargs)
+
+
+def test_exact_name(index):
+    result, stats = resolve(index, ['Reliance Industries Limited'])
+    assert result.tolist() == ['RELIANCE']
+    assert stats['exact'] == 1 and stats['matched'] == 1
+
+
+def test_normalized_name(index):
+    result, stats = resolve(index, ['RELIANCE INDUSTRIES LIMITED.'])
+    assert result.tolist() == ['RELIANCE']
+    assert stats['exact'] == 0 and stats['normalized'] == 1
+
+
+def test_compact_name(index):
+    result, stats = resolve(index, ['LARSEN&TOUBRO LTD'])
+    assert result.tolist() == ['LT']
+    assert stats['normalized'] == 0 and stats['compact'] == 1
+
+
+def test_name_read_as_ticker(index):
+    result, stats = resolve(index, ['TCS'])
+    assert result.tolist() == ['TCS']
+    assert stats['symbol'] == 1
+
+
+def test_unmatched_keeps_alignment(index):
+    names = pd.Series(['Unknown Co', 'Reliance Industries Limited', None], index=[10, 20, 30], dtype=object)
+    result, stats = index.resolve_with_stats(names)
+    assert result.index.tolist() == [10, 20, 30]
+    assert pd.isna(result[10]) and result[20] == 'RELIANCE' and pd.isna(result[30])
+    assert stats['unmatched'] == 2
+    assert stats['match_rate'] == round(1 / 3, 4)
+
+
+def test_fuzzy_is_opt_in(index):
+    result, stats = resolve(index, ['HINDUSTAN UNILEVER LTD'])
+    assert pd.isna(result[0])
+    assert stats['fuzzy'] == 0
+
+
+def test_fuzzy_match_learns_confident_alias(index):
+    result, stats = resolve(index, ['HINDUSTAN UNILEVER LTD'], fuzzy=True)
+    assert result.tolist() == ['HINDUNILVR']
+    assert stats['fuzzy'] == 1
+    assert stats['fuzzy_matches'][0]['learned'] is True
+    assert get_alias_table().mapping() == {'HINDUSTAN UNILEVER LTD': 'HINDUNILVR'}
+
+
+def test_fuzzy_match_below_learn_score_is_review_only(index):
+    result, stats = resolve(index, ['HINDUSTAN UNILEVER LTD'], fuzzy=True, learn_score=1.01)
+    assert result.tolist() == ['HINDUNILVR']
+    assert stats['fuzzy_matches'][0]['learned'] is False
+    assert get_alias_table().mapping() == {}
+
+
+def test_fuzzy_rejects_ambiguous_winner(index):
+    symbol, confidence = index.fuzzy_match('ABC INDUSTRIES')
+    assert symbol is None
+    assert confidence >= 0.8  # a strong score, rejected only for lacking a margin
+
+    result, stats = resolve(index, ['ABC INDUSTRIES'], fuzzy=True)
+    assert pd.isna(result[0])
+    assert stats['fuzzy'] == 0 and stats['fuzzy_matches'] == []
+
+
+def test_fuzzy_rejects_weak_match(index):
+    symbol, confidence = index.fuzzy_match('COMPLETELY DIFFERENT NAME')
+    assert symbol is None
+    assert confidence < 0.8
+
+
+def test_fuzzy_skips_symbols_claimed_in_the_call(index):
+    result, _ = resolve(index, ['Hindustan Unilever Limited', 'HINDUSTAN UNILEVER LTD RE'], fuzzy=True)
+    assert result[0] == 'HINDUNILVR'
+    assert result[1] != 'HINDUNILVR'
+
+
+def test_alias_stage(index):
+    configure_alias_mapping({'RIL LTD': 'RELIANCE', 'GONE LTD': 'DELISTED'})
+    result, stats = resolve(index, ['RIL Ltd', 'Gone Ltd'])
+    assert result[0] == 'RELIANCE'
+    # aliases to tickers missing from the snapshot don't count
+    assert pd.isna(result[1])
+    assert stats['alias'] == 1
+
+
+def test_alias_never_takes_a_claimed_symbol(index):
+    configure_alias_mapping({'RIL LTD': 'RELIANCE'})
+    result, _ = resolve(index, ['Reliance Industries Limited', 'RIL Ltd'])
+    assert result[0] == 'RELIANCE'
+    assert pd.isna(result[1])
+
+
+def test_shared_index_is_reused_until_content_changes():
+    first = get_name_index(MCAP.keys(), MCAP.values())
+    assert get_name_index(list(MCAP.keys()), list(MCAP.values())) is first
+    changed = {**MCAP, 'New Listing Limited': 'NEWCO'}
+    assert get_name_index(changed.keys(), changed.values()) is not first
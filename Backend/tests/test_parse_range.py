@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip('gridfs')
+
+from artifact_store import parse_range  # noqa: E402
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('items=0-9', None),
+    ('bytes=0-9,20-29', None),      # multi-range is served whole
+    ('bytes=a-b', None),
+    ('bytes=0-9', (0, 10)),
+    ('bytes=90-', (90, 100)),
+    ('bytes=5-500', (5, 100)),      # end clamped to the length
+    ('bytes=-10', (90, 100)),       # suffix range
+    ('bytes=-500', (0, 100)),
+    ('bytes=100-', False),
+    ('bytes=9-5', False),
+    ('bytes=-0', False),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
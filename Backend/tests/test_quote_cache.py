@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('pymongo')
+
+from quote_cache import CACHED_SOURCE, DAY, MINUTE, QuoteCache  # noqa: E402
+
+NOW = datetime(2026, 3, 10, 12, 0).timestamp()
+
+
+def cache():
+    return QuoteCache(None, max_stale_seconds=3 * DAY, refresh_workers=1)
+
+
+def row(**values):
+    return {'symbol': 'ABC', 'companyName': 'ABC Ltd', 'total_market_cap': 100.0,
+            'as_on': '2026-03-10', 'source': 'symbol_dashboard', **values}
+
+
+def test_fresh_hit_keeps_fetch_day_and_marks_source():
+    qc = cache()
+    qc.store(row(), now=NOW)
+    hit, state = qc.lookup('abc', now=NOW + MINUTE)
+    assert state == 'fresh'
+    assert hit['total_market_cap'] == 100.0
+    assert hit['as_on'] == '2026-03-10'
+    assert hit['source'] == CACHED_SOURCE
+
+
+def test_stale_hit_reports_the_day_its_numbers_were_fetched():
+    qc = cache()
+    qc.store(row(), now=NOW - 2 * DAY)
+    hit, state = qc.lookup('ABC', now=NOW)
+    assert state == 'stale'
+    assert hit['as_on'] == '2026-03-08'
+
+
+def test_rows_older_than_max_stale_are_misses():
+    qc = cache()
+    qc.store(row(), now=NOW - 4 * DAY)
+    assert qc.lookup('ABC', now=NOW) == (None, 'miss')
+
+
+def test_fetch_day_follows_intraday_fields_not_static_metadata():
+    qc = cache()
+    qc.store(row(), now=NOW - 2 * DAY)
+    # a later fetch that only refreshed metadata does not make the numbers newer
+    qc.store({'symbol': 'ABC', 'companyName': 'ABC Limited'}, now=NOW - DAY)
+    hit, _ = qc.lookup('ABC', now=NOW)
+    assert hit['as_on'] == '2026-03-08'
+    assert hit['companyName'] == 'ABC Limited'
+
+
+def test_empty_field_keeps_previous_value_within_ttl():
+    qc = cache()
+    qc.store(row(), now=NOW)
+    qc.store(row(total_market_cap=None), now=NOW + MINUTE)
+    hit, _ = qc.lookup('ABC', now=NOW + 2 * MINUTE)
+    assert hit['total_market_cap'] == 100.0
@@ -0,0 +1,44 @@
+import time
+
+from rate_limiter import RetryScheduler
+
+
+def scheduler(**kwargs):
+    return RetryScheduler(workers=2, base_delay=0.001, max_delay=0.005, **kwargs)
+
+
+def test_retries_until_success_and_keeps_input_order():
+    calls = {}
+
+    def fn(item, attempt):
+        calls.setdefault(item, []).append(attempt)
+        return 'fail' if item == 'b' and attempt < 2 else f"ok-{item}"
+
+    sched = scheduler(max_attempts=4)
+    results = sched.run(['a', 'b', 'c'], fn, should_retry=lambda r: r == 'fail')
+    assert results == ['ok-a', 'ok-b', 'ok-c']
+    assert calls['b'] == [0, 1, 2]
+    assert sched.stats == {'attempts': 5, 'retries': 2, 'gave_up': 0}
+
+
+def test_gives_up_after_max_attempts():
+    sched = scheduler(max_attempts=3)
+    results = sched.run(['x'], lambda item, attempt: 'fail', should_retry=lambda r: r == 'fail')
+    assert results == ['fail']
+    assert sched.stats == {'attempts': 3, 'retries': 2, 'gave_up': 1}
+
+
+def test_exceptions_are_returned_as_results():
+    def fn(item, attempt):
+        raise ValueError(item)
+
+    results = scheduler(max_attempts=2).run(['x'], fn, should_retry=lambda r: isinstance(r, ValueError))
+    assert isinstance(results[0], ValueError)
+
+
+def test_deadline_stops_retries():
+    sched = scheduler(max_attempts=5)
+    results = sched.run(['x'], lambda item, attempt: 'fail', should_retry=lambda r: r == 'fail',
+                        deadline=time.monotonic())
+    assert results == ['fail']
+    assert sched.stats['attempts'] == 1 and sched.stats['gave_up'] == 1
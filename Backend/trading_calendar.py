@@ -0,0 +1,253 @@
+"""
+NSE trading calendar
+Decides which dates can have a bhavcopy so range operations stop requesting
+weekends and holidays. Weekends are non-trading unless a session was seen
+(e.g. Budget-day Saturdays); weekday holidays come from a local seed file
+and, for years the seed does not cover, are learned once "no data" bhavcopy
+responses for the date have been seen on HOLIDAY_CONFIRMATIONS separate days.
+Learned and observed dates persist to Mongo (`trading_calendar`) when
+available and can be forgotten again; the seed is never overridden by learning.
+"""
+
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from dateutil import parser as date_parser
+
+DEFAULT_HOLIDAY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nse_holidays.json')
+DEFAULT_CONFIRMATIONS = 2  # no-data responses on separate days before a weekday is learned as a holiday
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date_parser.parse(str(value)).date()
+
+
+class TradingCalendar:
+    def __init__(self, collection=None, holiday_file=DEFAULT_HOLIDAY_FILE, confirmations=DEFAULT_CONFIRMATIONS):
+        """
+        Args:
+            collection: Mongo collection (`trading_calendar`), docs shaped
+                {_id: 'YYYY-MM-DD', status: 'holiday'|'suspect'|'session', source,
+                 miss_days: [days a no-data response was seen], updated_at}
+            holiday_file: JSON seed {"holidays": [...], "sessions": [...]}
+            confirmations: no-data responses on separate days needed to learn a holiday
+        """
+        self.collection = collection
+        self.confirmations = max(1, int(confirmations))
+        self.holidays = set()
+        self.sessions = set()   # weekend dates that did trade
+        self.seed_holidays = set()
+        self.seed_sessions = set()
+        self._seed_years = set()  # years whose holidays the seed lists in full
+        self.suspects = {}      # date -> set of days a no-data response was seen
+        self._lock = threading.Lock()
+        self.stats = {'learned_holidays': 0, 'observed_sessions': 0, 'suspected': 0, 'forgotten': 0}
+        if holiday_file:
+            self._load_seed(holiday_file)
+        self._load_collection()
+
+    def _load_seed(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                seed = json.load(f)
+        except Exception as exc:
+            print(f"⚠️ Holiday file {path} unreadable: {exc}")
+            return
+        if isinstance(seed, list):
+            seed = {'holidays': seed}
+        self.seed_holidays = {_to_date(d).isoformat() for d in seed.get('holidays', [])}
+        self.seed_sessions = {_to_date(d).isoformat() for d in seed.get('sessions', [])}
+        self._seed_years = {int(iso[:4]) for iso in self.seed_holidays}
+        self.holidays.update(self.seed_holidays)
+        self.sessions.update(self.seed_sessions)
+
+    def _seed_decides(self, d):
+        """True when the seed already says whether this date trades."""
+        iso = d.isoformat()
+        return iso in self.seed_holidays or iso in self.seed_sessions or d.year in self._seed_years
+
+    def is_seed_holiday(self, value):
+        return _to_date(value).isoformat() in self.seed_holidays
+
+    def _load_collection(self):
+        if self.collection is None:
+            return
+        try:
+            for doc in self.collection.find({}, {'status': 1, 'miss_days': 1, 'updated_at': 1}):
+                iso = doc['_id']
+                status = doc.get('status')
+                if status in ('holiday', 'suspect'):
+                    if self._seed_decides(_to_date(iso)):
+                        continue
+                    miss_days = set(doc.get('miss_days') or [])
+                    if not miss_days and doc.get('updated_at'):
+                        # learned from a single miss before confirmations existed
+                        miss_days = {str(doc['updated_at'])[:10]}
+                    if len(miss_days) >= self.confirmations:
+                        self.holidays.add(iso)
+                        self.sessions.discard(iso)
+                    else:
+                        self.suspects[iso] = miss_days
+                elif status == 'session':
+                    self.sessions.add(doc['_id'])
+                    self.holidays.discard(doc['_id'])
+        except Exception as exc:
+            print(f"⚠️ Trading calendar load failed: {exc}")
+
+    def _persist(self, date_iso, status, source, **fields):
+        if self.collection is None:
+            return
+        try:
+            self.collection.update_one(
+                {'_id': date_iso},
+                {'$set': {'status': status, 'source': source, 'updated_at': datetime.now().isoformat(), **fields}},
+                upsert=True
+            )
+        except Exception as exc:
+            print(f"⚠️ Trading calendar write for {date_iso} failed: {exc}")
+
+    def is_trading_day(self, value):
+        d = _to_date(value)
+        iso = d.isoformat()
+        with self._lock:
+            if iso in self.sessions:
+                return True
+            if iso in self.holidays:
+                return False
+        return d.weekday() < 5
+
+    def trading_days(self, start, end):
+        """Trading days in [start, end] as datetimes (midnight), oldest first."""
+        current, last = _to_date(start), _to_date(end)
+        days = []
+        while current <= last:
+            if self.is_trading_day(current):
+                days.append(datetime(current.year, current.month, current.day))
+            current += timedelta(days=1)
+        return days
+
+    def trading_days_iso(self, start, end):
+        return [d.strftime('%Y-%m-%d') for d in self.trading_days(start, end)]
+
+    def record_no_data(self, value, today=None):
+        """
+        A bhavcopy request answered with no file (404 / empty). A past weekday the
+        seed does not cover becomes a suspect, and a learned holiday once no-data
+        responses were seen on `confirmations` separate days (a single transient
+        NSE failure cannot drop a trading day). Returns True when it was learned.
+        """
+        d = _to_date(value)
+        iso = d.isoformat()
+        today = today or date.today()
+        if d >= today or d.weekday() >= 5 or self._seed_decides(d):
+            return False
+        with self._lock:
+            if iso in self.holidays or iso in self.sessions:
+                return False
+            miss_days = self.suspects.setdefault(iso, set())
+            if today.isoformat() in miss_days:
+                return False
+            miss_days.add(today.isoformat())
+            confirmed = len(miss_days) >= self.confirmations
+            if confirmed:
+                self.holidays.add(iso)
+                del self.suspects[iso]
+                self.stats['learned_holidays'] += 1
+            else:
+                self.stats['suspected'] += 1
+        self._persist(iso, 'holiday' if confirmed else 'suspect', 'learned', miss_days=sorted(miss_days))
+        return confirmed
+
+    def forget(self, value):
+        """Drop what was learned or observed for a date; the seed (or the weekday rule) applies again."""
+        iso = _to_date(value).isoformat()
+        with self._lock:
+            changed = self.suspects.pop(iso, None) is not None
+            if iso in self.holidays and iso not in self.seed_holidays:
+                self.holidays.discard(iso)
+                changed = True
+            if iso in self.sessions and iso not in self.seed_sessions:
+                self.sessions.discard(iso)
+                changed = True
+            if iso in self.seed_holidays:
+                self.holidays.add(iso)
+            if iso in self.seed_sessions:
+                self.sessions.add(iso)
+            if changed:
+                self.stats['forgotten'] += 1
+        if self.collection is not None:
+            try:
+                changed = self.collection.delete_one({'_id': iso}).deleted_count > 0 or changed
+            except Exception as exc:
+                print(f"⚠️ Trading calendar delete for {iso} failed: {exc}")
+        return changed
+
+    def record_session(self, value):
+        """A bhavcopy exists for this date: it traded, whatever the seed says."""
+        d = _to_date(value)
+        iso = d.isoformat()
+        with self._lock:
+            was_holiday = iso in self.holidays or self.suspects.pop(iso, None) is not None
+            self.holidays.discard(iso)
+            if d.weekday() < 5:
+                if not was_holiday:
+                    return False
+            elif iso in self.sessions:
+                return False
+            else:
+                self.sessions.add(iso)
+            self.stats['observed_sessions'] += 1
+        self._persist(iso, 'session', 'observed')
+        return True
+
+    def learn_from_cached_dates(self, date_isos):
+        """Mark weekend dates that already have cached bhavcopies as sessions."""
+        return sum(1 for iso in date_isos if iso and _to_date(iso).weekday() >= 5 and self.record_session(iso))
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'holidays': len(self.holidays),
+            'suspected_holidays': len(self.suspects),
+            'weekend_sessions': len(self.sessions),
+            'persistent': self.collection is not None
+        }
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def configure_trading_calendar(collection, holiday_file=None):
+    """Swap in a Mongo-backed calendar (called once the DB connection is up)."""
+    global _calendar
+    path = holiday_file or os.getenv('TRADING_HOLIDAYS_FILE', DEFAULT_HOLIDAY_FILE)
+    with _calendar_lock:
+        _calendar = TradingCalendar(
+            collection, holiday_file=path,
+            confirmations=int(os.getenv('HOLIDAY_CONFIRMATIONS', DEFAULT_CONFIRMATIONS))
+        )
+    return _calendar
+
+
+def get_trading_calendar():
+    """Return the process-wide trading calendar (seed file only until configured)."""
+    global _calendar
+    if _calendar is None:
+        with _calendar_lock:
+            if _calendar is None:
+                _calendar = TradingCalendar(None, holiday_file=os.getenv('TRADING_HOLIDAYS_FILE', DEFAULT_HOLIDAY_FILE))
+    return _calendar
+
+
+def trading_days(start, end):
+    """Trading days in [start, end] from the process-wide calendar."""
+    return get_trading_calendar().trading_days(start, end)
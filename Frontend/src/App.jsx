@@ -581,51 +581,67 @@ function App() {
             let allRows = [];
             let allErrors = [];
             let totalBatches = 1;
-            let currentBatch = 0;
-            
-            while (currentBatch < totalBatches) {
-                setDashboardBatchProgress(prev => ({
-                    ...prev,
-                    currentBatch: currentBatch + 1,
-                    totalBatches: totalBatches,
-                    message: currentBatch > 0 ? `Batch ${currentBatch} processed, next batch is being processed (Batch ${currentBatch + 1} of ${totalBatches})...` : `Processing initial Batch 1 of ${totalBatches}...`,
-                    percentage: Math.round((currentBatch / totalBatches) * 100)
-                }));
-                
-                const response = await fetch(`${VITE_API_URL}/api/nse-symbol-dashboard`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        top_n: TOTAL_SYMBOLS,
-                        top_n_by: 'mcap',
-                        as_on: rangeEndDate,
-                        start_date: convertDateFormat(rangeStartDate),
-                        end_date: convertDateFormat(rangeEndDate),
-                        batch_index: currentBatch
-                    })
-                });
 
-                if (!response.ok) {
-                    const errorData = await response.json();
-                    throw new Error(errorData.error || `Dashboard batch ${currentBatch + 1} generation failed`);
+            // Single streaming request: the backend loads lookups once and
+            // flushes NDJSON events (rows / progress / done) as quotes complete
+            const response = await fetch(`${VITE_API_URL}/api/nse-symbol-dashboard/stream`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'application/x-ndjson' },
+                body: JSON.stringify({
+                    top_n: TOTAL_SYMBOLS,
+                    top_n_by: 'mcap',
+                    as_on: rangeEndDate,
+                    start_date: convertDateFormat(rangeStartDate),
+                    end_date: convertDateFormat(rangeEndDate)
+                })
+            });
+
+            if (!response.ok || !response.body) {
+                const errorData = await response.json().catch(() => ({}));
+                throw new Error(errorData.error || 'Dashboard generation failed');
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let finished = false;
+
+            const handleEvent = (evt) => {
+                const data = evt.data || {};
+                if (evt.event === 'rows') {
+                    allRows = [...allRows, ...(data.rows || [])];
+                    allErrors = [...allErrors, ...(data.errors || [])];
+                } else if (evt.event === 'progress') {
+                    setDashboardBatchProgress(prev => ({
+                        ...prev,
+                        symbolsProcessed: data.processed || 0,
+                        totalSymbols: data.total || prev.totalSymbols,
+                        message: data.stage === 'lookups'
+                            ? 'Loading aggregates and index data...'
+                            : `Fetched ${data.processed} of ${data.total} symbols...`,
+                        percentage: Math.min(90, Math.round((data.percentage || 0) * 0.9))
+                    }));
+                } else if (evt.event === 'done') {
+                    finished = true;
+                    setExportLog(prev => [...prev, data.message || 'Dashboard stream complete']);
+                } else if (evt.event === 'error') {
+                    throw new Error(data.error || 'Dashboard generation failed');
                 }
+            };
 
-                const data = await response.json();
-                
-                if (data.error) throw new Error(data.error);
-
-                allRows = [...allRows, ...(data.rows || [])];
-                allErrors = [...allErrors, ...(data.errors || [])];
-                
-                if (data.total_batches) {
-                    totalBatches = data.total_batches;
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (line.trim()) handleEvent(JSON.parse(line));
                 }
-                
-                setExportLog(prev => [...prev, data.message || `Processed batch ${currentBatch + 1}/${totalBatches}`]);
-                
-                currentBatch++;
             }
-            
+            if (buffer.trim()) handleEvent(JSON.parse(buffer));
+            if (!finished) throw new Error('Dashboard stream ended unexpectedly');
+
             setDashboardBatchProgress(prev => ({
                 ...prev,
                 currentBatch: totalBatches,